@@ -24,11 +24,14 @@ def recognize_driver_license(photo_guid: str,
                              request_id: str,
                              model_host='localhost',
                              model_http_port='8000',
-                             model_name='py_ru_driver_license_bls') -> dict:
+                             model_name='py_ru_driver_license_bls',
+                             photo_size=None,
+                             trace=False) -> dict:
     """Запрос на распознавание водительского удостоверение к Triton Inference Server.
     API Triton расширяет шаблоны KServe, которые заточены на стандартизацию взаимодействия c моделями машинного обучения.
     API Triton предполагает пакетную обработку и все данные запросов/ответов представляются виде списков.
-    Текущие модели распознавания не поддерживают пакетную обработку, поэтому данные должны быть представлены как список c одним элементов.
+    Модель поддерживает динамический батчинг на стороне Triton: запрос содержит пакет из одного фото формы [1, 1],
+    Triton сам объединяет одновременные запросы в пакет.
     На одно фото - один запрос.
 
     Parameters
@@ -37,6 +40,10 @@ def recognize_driver_license(photo_guid: str,
         GUID по которому можно скачать фото с файлового сервера
     request_id : str
         Идентификатор запроса
+    photo_size : int, optional
+        Размер фото в байтах, если известен: модель сразу выделит буфер нужного размера
+    trace : bool, optional
+        Вернуть в ответе временную шкалу обработки запроса (ключ 'trace'), by default False
 
     Returns
     -------
@@ -51,7 +58,7 @@ def recognize_driver_license(photo_guid: str,
                     {
                         'name': 'recognition_response',
                         'datatype': 'BYTES',
-                        'shape': [1],
+                        'shape': [1, 1],
                         'data': [!!! Строка с результатами распознавания, которую нужно десериализовать !!!]
                     }
                 ]
@@ -72,7 +79,20 @@ def recognize_driver_license(photo_guid: str,
                                 'field_text_score': 0.8317731618881226,     Скор распознавания текста поля (минимальный скор символов)
                                 'field_symbol_scores': [0.99716657, ...]    Список скоров распознавания символов
                             }, ...
-                        ]
+                        ],
+                    'trace':                                                Только при trace=True
+                        {
+                            'total_ms': 412.7,                              Время обработки запроса в модели
+                            'stages': [
+                                {
+                                    'stage': 'detection',                   Этап обработки
+                                    'start_ms': 231.4,                      Смещения начала и конца этапа от начала запроса
+                                    'end_ms': 298.0,
+                                    'durations_ms': {'detection_infer': 61.2, ...},    Вложенные этапы и запросы к моделям
+                                    'shape': [2, 1280, 1280, 3]             Форма входного тензора пакета
+                                }, ...
+                            ]
+                        }
                 }
         400
             Response:
@@ -81,11 +101,17 @@ def recognize_driver_license(photo_guid: str,
 
     model_url = f'http://{model_host}:{model_http_port}/v2/models/{model_name}/infer'
 
+    input_data = {'guid': photo_guid}
+    if photo_size is not None:
+        input_data['size'] = photo_size
+    if trace:
+        input_data['trace'] = True
+
     input_json = {
         "name": "image_guid",
-        "shape": [1],
+        "shape": [1, 1],
         "datatype": 'BYTES',
-        "data": [json.dumps({'guid': photo_guid})]
+        "data": [json.dumps(input_data)]
     }
 
     output_json = {
@@ -9,9 +9,9 @@ class ResultFieldDetection:
         ----------
         field_name : str
             Наименование поля
-        bbox : list(int)
+        bbox : numpy.array
             Координаты рамки
-        score : float
+        score : numpy.float32
             Скор детекции
         """
 
@@ -25,24 +25,24 @@ def complete_predictions(bboxes, classes, scores):
 
     Parameters
     ----------
-    bboxes : list(list(int))
+    bboxes : numpy.array
         Координаты рамок
-    classes : list(int)
-        Список id классов
-    scores : list(float)
+    classes : numpy.array
+        Id классов
+    scores : numpy.array
         Скоры детекции
 
     Returns
     -------
-    _type_
-        _description_
+    list(ResultFieldDetection)
+        Результаты детекции полей, координаты и скоры остаются numpy до сериализации в json
     """
 
     predictions = []
 
     for index in range(len(bboxes)):
         class_id = classes[index]
-        field_name = DriverLicenseClass(class_id).name
+        field_name = DriverLicenseClass(int(class_id)).name
 
         field_detection_result = ResultFieldDetection(field_name=field_name, bbox=bboxes[index], score=scores[index])
 
@@ -1,97 +1,40 @@
-import triton_python_backend_utils as pb_utils
-
-from driver_license_classes import DriverLicenseClass
-from detection.complete import complete_predictions
-from detection.postprocess import scale_bboxes, select_bboxes
-from detection.preprocess import preprocess
-from detection.rotate import rotate_doc_with_bboxes
-
-
-
-
-class ResultDetection:
-    def __init__(self, img, is_correct, is_front_side, predictions, angle):
-        """Результат детекции
-
-        Parameters
-        ----------
-        img : numpy
-            Фото паспорта в виде numpy
-        predictions : list(ResultFieldDetection)
-            Список результатов детекции
-        angle : int
-            Угол поворота изображения
-        is_correct : bool
-            Флаг корректности распознавания
-        """
-
-        self.img = img
-        self.is_correct = is_correct
-        self.is_front_side = is_front_side
-        self.predictions = predictions
-        self.angle = angle
-
-
+import time
 
-def postprocess(response_dict, img, scale, dw, dh, config):
-    """Постобработка результатов модели и упаковка результата
-
-    Parameters
-    ----------
-    response_dict : dict
-        _description_
-    img : numpy.array
-        Фото паспорта
-    scale : float
-        коэфф изменения размера (см resize_with_pad)
-    dw : int
-        дельта цирины
-    dh : int
-        дельта высоты
-    config : dict
-        Конфиг сервиса
-
-    Returns
-    -------
-    tuple
-        фото паспорта в правильной ориентации, результаты детекции list(ResultFieldDetection),
-        угол поворота фото, флаг корректности детекции
-    """
-    bboxes, scores, classes = select_bboxes(
-        response_dict["detection_boxes"], response_dict["detection_scores"], response_dict["detection_classes"])
-    scaled_bboxes = scale_bboxes(
-        img, bboxes, scale, dw, dh, detector_img_size=config['detector']['img_size'])
-
-    # rotate img and bboxes
-    img, rotated_bboxes, angle = rotate_doc_with_bboxes(
-        img, scaled_bboxes, classes)
+import triton_python_backend_utils as pb_utils
 
-    # check detection predict
-    is_correct, is_front_side = check_detection(classes, scores, config["detector"]['threshold'], config["detector"]['check_front_fields'],
-                                                config["detector"]['check_back_fields'])
+from log import logger
+from metrics import record_since
+from detection.postprocess import postprocess_batch
 
-    # complete predictions to one list
-    predictions = complete_predictions(rotated_bboxes, classes, scores)
 
-    return img, predictions, angle, is_correct, is_front_side
+# Модель детекции по умолчанию, вход float32
+DETECTION_MODEL_NAME = "tf_ru_driver_license_detection"
 
 
-def infer_model(img, config, log_msg=""):
-    """Функция исполнения модели детекции
+async def infer_model(img_shapes, batch_tensor, scales_pads, config, log_msg="", timings=None):
+    """Асинхронная функция исполнения модели детекции на пакете фото.
+    Все фото отправляются в модель одним запросом, поэтому у них одна форма входа
 
     Parameters
     ----------
-    img : numpy.array
-        Тензор фото паспорта
+    img_shapes : list(tuple)
+        Высота и ширина фото документов в полном разрешении
+    batch_tensor : numpy.array
+        Пакет предобработанных фото numpy([N, высота, ширина, 3]) float32, float16 или uint8
+        (см preprocess.preprocess_into), рамки переводятся обратно по его высоте и ширине
+    scales_pads : list(tuple)
+        Для каждого фото пара (коэфф изменения размера полного фото, (дельта ширины, дельта высоты))
     config : dict
         Конфиг сервиса
     log_msg : str, optional
         Шаблон строки лога, by default ''
+    timings : dict, optional
+        Словарь замеров этапов detection_infer и detection_postprocess в нс, by default None
 
     Returns
     -------
-    ResultDetection
-        Результат детекции
+    list(ResultDetection)
+        Результаты детекции для каждого фото
 
     Raises
     ------
@@ -100,22 +43,19 @@ def infer_model(img, config, log_msg=""):
     """
     log_msg = f"{log_msg} module: detection;"
 
-    # preprocessing
-    pb_utils.Logger.log_info(f"{log_msg} preprocess")
-    img_tensor, scale, (dw, dh) = preprocess(img, config)
-
-    # infer detect model
+    # infer detect model, the model input type must match the batch tensor type
     detection_request = pb_utils.InferenceRequest(
-        model_name="tf_ru_driver_license_detection",
+        model_name=config["detector"].get("model_name", DETECTION_MODEL_NAME),
         requested_output_names=[
             "detection_boxes",
             "detection_classes",
             "detection_scores",
         ],
-        inputs=[pb_utils.Tensor("inputs", img_tensor)],
+        inputs=[pb_utils.Tensor("inputs", batch_tensor)],
     )
-    pb_utils.Logger.log_info(f"{log_msg} send request to model")
-    detection_response = detection_request.exec()
+    logger.verbose("%s send request to model; batch size: %d", log_msg, len(img_shapes))
+    start_ns = time.perf_counter_ns() if timings is not None else 0
+    detection_response = await detection_request.async_exec()
     if detection_response.has_error():
         raise pb_utils.TritonModelException(
             detection_response.error().message())
@@ -126,57 +66,12 @@ def infer_model(img, config, log_msg=""):
             detection_response, out_name
         ).as_numpy()
 
-    # postprocessing
-    pb_utils.Logger.log_info(f"{log_msg} postprocess")
-    img, predictions, angle, is_correct, is_front_side = postprocess(
-        response_dict, img, scale, dw, dh, config
-    )
-    return ResultDetection(img, is_correct, is_front_side, predictions, angle)
-
-
-
-def check_detection(classes, scores, fields_threshold, check_front_fields, check_back_fields):
-    """Проверка корректности детекции
-
-    Parameters
-    ----------
-    classes : list(str)
-        Список имен классов
-    scores : dict(str, float)
-        Словарь скоров детекции
-    fields_threshold : float
-        Порог скора детекции
-    check_fields : list(str)
-        Список полей которые нужно проверять
+    record_since(timings, "detection_infer", start_ns)
 
-    Returns
-    -------
-    bool
-        Флаг корректности детекции
-    """
-
-    is_front_side = True
-    for field_name in check_front_fields:
-        field_id = DriverLicenseClass[field_name].value
-        if field_id in classes:
-            field_index = classes.index(field_id)
-            field_score = scores[field_index]
-            if field_score < fields_threshold:
-                is_front_side = False
-        else:
-            is_front_side = False
-
-    is_back_side = True
-    for field_name in check_back_fields:
-        field_id = DriverLicenseClass[field_name].value
-        if field_id in classes:
-            field_index = classes.index(field_id)
-            field_score = scores[field_index]
-            if field_score < fields_threshold:
-                is_back_side = False
-        else:
-            is_back_side = False
-
-    is_correct = is_front_side or is_back_side
+    # postprocessing
+    logger.verbose("%s postprocess", log_msg)
+    start_ns = time.perf_counter_ns() if timings is not None else 0
+    results = postprocess_batch(response_dict, img_shapes, scales_pads, config, batch_tensor.shape[1:3])
+    record_since(timings, "detection_postprocess", start_ns)
 
-    return is_correct, is_front_side
+    return results
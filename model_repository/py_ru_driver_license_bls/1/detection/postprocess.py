@@ -1,5 +1,34 @@
 import numpy as np
 
+from driver_license_classes import DriverLicenseClass
+from detection.complete import complete_predictions
+from detection.preprocess import get_input_shape
+from detection.rotate import rotate_doc_with_bboxes
+
+
+class ResultDetection:
+    def __init__(self, img, is_correct, is_front_side, predictions, angle):
+        """Результат детекции
+
+        Parameters
+        ----------
+        img : numpy
+            Фото паспорта в полном разрешении до поворота на angle, заполняется после детекции.
+            Поля вырезаются с поворотом только фрагмента (см utils.crop_rotated_img)
+        predictions : list(ResultFieldDetection)
+            Список результатов детекции
+        angle : int
+            Угол поворота изображения
+        is_correct : bool
+            Флаг корректности распознавания
+        """
+
+        self.img = img
+        self.is_correct = is_correct
+        self.is_front_side = is_front_side
+        self.predictions = predictions
+        self.angle = angle
+
 
 def select_bboxes(bboxes, scores, classes):
     # delete batch index
@@ -17,30 +46,200 @@ def select_bboxes(bboxes, scores, classes):
     bboxes = bboxes[uniq_indexes]
 
     # delete empty classes
-    bboxes = bboxes[np.where(scores > 0)]
-    classes = classes[np.where(scores > 0)]
-    scores = scores[np.where(scores > 0)]
+    not_empty = scores > 0
+
+    return bboxes[not_empty], scores[not_empty], classes[not_empty].astype(np.int64)
+
+
+def get_class_rows(classes):
+    """Таблица поиска строки детекции по id класса
+
+    Parameters
+    ----------
+    classes : numpy.array
+        Уникальные id классов детекции (см select_bboxes)
+
+    Returns
+    -------
+    numpy.array
+        Индекс строки для каждого id класса, -1 если класс не найден
+    """
+    class_rows = np.full(len(DriverLicenseClass), -1, dtype=np.int64)
+    class_rows[classes] = np.arange(len(classes))
+
+    return class_rows
+
+
+def scale_bboxes(img_shape, bboxes, scale, dw, dh, detector_img_size=1280):
+    """Перевод рамок из долей входа детектора в пиксели фото: x умножается на ширину входа,
+    y на высоту, затем вычитается паддинг своей оси и делится на общий коэфф изменения размера
+
+    Parameters
+    ----------
+    img_shape : tuple
+        Высота и ширина фото
+    bboxes : numpy.array
+        Рамки [x1, y1, x2, y2] в долях входа детектора
+    scale : float
+        коэфф изменения размера фото (см preprocess.get_resize_params)
+    dw : int
+        дельта ширины
+    dh : int
+        дельта высоты
+    detector_img_size : int or tuple, optional
+        Размер квадратного входа детектора или (высота, ширина), by default 1280
+
+    Returns
+    -------
+    numpy.array
+        Рамки int64 [x1, y1, x2, y2] в пикселях фото
+    """
+    img_height, img_width = img_shape[:2]
+    input_height, input_width = get_input_shape(detector_img_size)
+    # float64 как у python float, int() отбрасывает дробную часть
+    bboxes = np.trunc(
+        (bboxes.astype(np.float64) * [input_width, input_height, input_width, input_height]
+         - [dw / 2, dh / 2, dw / 2, dh / 2]) / scale
+    )
+    bboxes = bboxes.astype(np.int64).reshape(-1, 4)
+
+    bboxes[:, :2] = np.maximum(bboxes[:, :2], 0)
+    bboxes[:, 2] = np.minimum(bboxes[:, 2], img_width)
+    bboxes[:, 3] = np.minimum(bboxes[:, 3], img_height)
+
+    return bboxes
+
+
+def check_side_fields(class_rows, scores, fields_threshold, check_fields):
+    """Проверка, что все поля стороны найдены со скором не ниже порога
+
+    Parameters
+    ----------
+    class_rows : numpy.array
+        Индекс строки детекции по id класса (см postprocess.get_class_rows)
+    scores : numpy.array
+        Скоры детекции
+    fields_threshold : float
+        Порог скора детекции
+    check_fields : list(str)
+        Список полей которые нужно проверять
+
+    Returns
+    -------
+    bool
+        Флаг наличия всех полей стороны
+    """
+
+    rows = class_rows[[DriverLicenseClass[field_name].value for field_name in check_fields]]
+    if np.any(rows < 0):
+        return False
+
+    return not np.any(scores[rows] < fields_threshold)
+
+
+def check_detection(class_rows, scores, fields_threshold, check_front_fields, check_back_fields):
+    """Проверка корректности детекции
+
+    Parameters
+    ----------
+    class_rows : numpy.array
+        Индекс строки детекции по id класса (см postprocess.get_class_rows)
+    scores : numpy.array
+        Скоры детекции
+    fields_threshold : float
+        Порог скора детекции
+    check_front_fields : list(str)
+        Список полей лицевой стороны
+    check_back_fields : list(str)
+        Список полей обратной стороны
+
+    Returns
+    -------
+    tuple
+        Флаг корректности детекции, флаг лицевой стороны
+    """
+
+    is_front_side = check_side_fields(class_rows, scores, fields_threshold, check_front_fields)
+    is_back_side = check_side_fields(class_rows, scores, fields_threshold, check_back_fields)
+    is_correct = is_front_side or is_back_side
+
+    return is_correct, is_front_side
+
+
+def postprocess(response_dict, img_shape, scale, dw, dh, config, input_shape=None):
+    """Постобработка результатов модели и упаковка результата
+
+    Parameters
+    ----------
+    response_dict : dict
+        _description_
+    img_shape : tuple
+        Высота и ширина фото в полном разрешении
+    scale : float
+        коэфф изменения размера полного фото (см preprocess.get_resize_params)
+    dw : int
+        дельта цирины
+    dh : int
+        дельта высоты
+    config : dict
+        Конфиг сервиса
+    input_shape : tuple, optional
+        Высота и ширина входа детектора, by default None - квадратный вход img_size
+
+    Returns
+    -------
+    tuple
+        результаты детекции list(ResultFieldDetection), угол поворота фото, флаг корректности детекции
+    """
+    bboxes, scores, classes = select_bboxes(
+        response_dict["detection_boxes"], response_dict["detection_scores"], response_dict["detection_classes"])
+    class_rows = get_class_rows(classes)
+    scaled_bboxes = scale_bboxes(
+        img_shape, bboxes, scale, dw, dh, detector_img_size=input_shape or config['detector']['img_size'])
+
+    # rotate bboxes, only the field crops are rotated before recognition
+    rotated_bboxes, angle = rotate_doc_with_bboxes(
+        img_shape, scaled_bboxes, class_rows)
+
+    # check detection predict
+    is_correct, is_front_side = check_detection(class_rows, scores, config["detector"]['threshold'], config["detector"]['check_front_fields'],
+                                                config["detector"]['check_back_fields'])
 
-    # tolist
-    bboxes = bboxes.tolist()
-    classes = classes.tolist()
-    scores = scores.tolist()
+    # complete predictions to one list
+    predictions = complete_predictions(rotated_bboxes, classes, scores)
 
-    return bboxes, scores, classes
+    return predictions, angle, is_correct, is_front_side
 
 
-def scale_bboxes(img, bboxes, scale, dw, dh, detector_img_size=1280):
-    img_height, img_width = img.shape[:2]
-    new_bboxes = []
-    for index in range(len(bboxes)):
-        bbox = bboxes[index]
-        x1, y1, x2, y2 = bbox
+def postprocess_batch(response_dict, img_shapes, scales_pads, config, input_shape=None):
+    """Разделение выходов модели по фото пакета и постобработка каждого фото
 
-        xmin = max(0, int((x1 * detector_img_size - dw / 2) / scale))
-        ymin = max(0, int((y1 * detector_img_size - dh / 2) / scale))
-        xmax = min(img_width, int((x2 * detector_img_size - dw / 2) / scale))
-        ymax = min(img_height, int((y2 * detector_img_size - dh / 2) / scale))
+    Parameters
+    ----------
+    response_dict : dict
+        Выходы модели детекции, первая размерность - индекс фото в пакете
+    img_shapes : list(tuple)
+        Высота и ширина фото документов в полном разрешении
+    scales_pads : list(tuple)
+        Для каждого фото пара (коэфф изменения размера, (дельта ширины, дельта высоты))
+    config : dict
+        Конфиг сервиса
+    input_shape : tuple, optional
+        Высота и ширина входа детектора, by default None - квадратный вход img_size
 
-        new_bboxes.append([xmin, ymin, xmax, ymax])
+    Returns
+    -------
+    list(ResultDetection)
+        Результаты детекции для каждого фото
+    """
+    results = []
+    for index, (img_shape, (scale, (dw, dh))) in enumerate(zip(img_shapes, scales_pads)):
+        img_response_dict = {
+            out_name: out_value[index:index + 1] for out_name, out_value in response_dict.items()
+        }
+        predictions, angle, is_correct, is_front_side = postprocess(
+            img_response_dict, img_shape, scale, dw, dh, config, input_shape
+        )
+        results.append(ResultDetection(None, is_correct, is_front_side, predictions, angle))
 
-    return new_bboxes
+    return results
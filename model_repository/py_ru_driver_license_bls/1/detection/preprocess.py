@@ -1,42 +1,156 @@
+import threading
+
 import cv2
 import numpy as np
 
 
+# Значение паддинга после нормализации
+PAD_VALUE = np.float32(114 / 255.0)
+NORM_SCALE = np.float32(1 / 255.0)
+# Значение паддинга входа uint8, нормализация в графе модели
+PAD_VALUE_UINT8 = 114
+# Тип входа детектора по значению input_dtype конфига
+INPUT_DTYPES = {"float32": np.float32, "float16": np.float16, "uint8": np.uint8}
+
+
+def get_input_shape(img_size):
+    """Высота и ширина входа детектора
+
+    Parameters
+    ----------
+    img_size : int or list
+        Размер квадратного входа или [высота, ширина] прямоугольного входа
+
+    Returns
+    -------
+    tuple
+        Высота и ширина входа
+    """
+    if isinstance(img_size, (int, np.integer)):
+        return int(img_size), int(img_size)
+    input_height, input_width = img_size
+    return int(input_height), int(input_width)
+
+
+def get_input_shapes(detector_config):
+    """Формы входа детектора по конфигу: input_shapes - список [высота, ширина] для фото
+    с разным соотношением сторон, без него один квадратный вход img_size
 
-def resize_with_pad(img, img_size=1280):
-    img_height, img_width = img.shape[:2]
+    Parameters
+    ----------
+    detector_config : dict
+        Раздел detector конфига сервиса
 
-    if img_height > img_width:
-        scale = img_size / img_height
-        resized_height = img_size
+    Returns
+    -------
+    list(tuple)
+        Высота и ширина каждого входа
+    """
+    return [get_input_shape(x) for x in detector_config.get("input_shapes") or [detector_config["img_size"]]]
+
+
+def select_input_shape(img_shape, input_shapes):
+    """Выбор входа детектора с ближайшим к фото соотношением сторон, на нем меньше всего паддинга
+
+    Parameters
+    ----------
+    img_shape : tuple
+        Высота и ширина фото
+    input_shapes : list(tuple)
+        Высота и ширина каждого входа (см get_input_shapes)
+
+    Returns
+    -------
+    int
+        Индекс входа, при равенстве - первый из подходящих
+    """
+    if len(input_shapes) == 1:
+        return 0
+    img_aspect = np.log(img_shape[1] / img_shape[0])
+    distances = [abs(img_aspect - np.log(width / height)) for height, width in input_shapes]
+
+    return int(np.argmin(distances))
+
+
+def get_resize_params(img_shape, img_size=1280):
+    """Параметры изменения размера фото с сохранением пропорций
+
+    Parameters
+    ----------
+    img_shape : tuple
+        Высота и ширина фото
+    img_size : int or tuple, optional
+        Размер квадратного входа детектора или (высота, ширина), by default 1280
+
+    Returns
+    -------
+    tuple
+        коэфф изменения размера, (ширина, высота) после изменения размера,
+        (отступ слева, отступ сверху), (дельта ширины, дельта высоты)
+    """
+    img_height, img_width = img_shape[:2]
+    input_height, input_width = get_input_shape(img_size)
+
+    # сторона, которая упирается во вход детектора, для квадратного входа - большая сторона фото
+    if img_height * input_width > img_width * input_height:
+        scale = input_height / img_height
+        resized_height = input_height
         resized_width = int(img_width * scale)
     else:
-        scale = img_size / img_width
+        scale = input_width / img_width
         resized_height = int(img_height * scale)
-        resized_width = img_size
+        resized_width = input_width
 
     new_unpad = int(round(img_width * scale)), int(round(img_height * scale))
-    dw, dh = img_size - new_unpad[0], img_size - new_unpad[1]
+    dw, dh = input_width - new_unpad[0], input_height - new_unpad[1]
 
-    img = cv2.resize(img, (resized_width, resized_height))
+    pad_width = (input_width - resized_width) // 2
+    pad_height = (input_height - resized_height) // 2
 
-    delta_width = img_size - resized_width
-    delta_height = img_size - resized_height
-    pad_width = delta_width // 2
-    pad_height = delta_height // 2
+    return scale, (resized_width, resized_height), (pad_width, pad_height), (dw, dh)
 
-    img = np.pad(img, [(pad_height, delta_height - pad_height), (pad_width, delta_width - pad_width), (0, 0)],
-                 mode='constant', constant_values=(114 / 255.0, 114 / 255.0))
 
-    return img, scale, (dw, dh)
+def letterbox_into(img, out):
+    """Изменение размера фото с паддингом, BGR -> RGB и нормализация за один проход.
+    Размер меняется на uint8 фото, значения пишутся сразу в выходной тензор.
+    В тензор uint8 пишутся ненормализованные значения, нормализация делается в графе модели
+
+    Parameters
+    ----------
+    img : numpy.array
+        Фото в формате BGR uint8
+    out : numpy.array
+        Выходной тензор float32, float16 или uint8 [высота, ширина, 3], его форма задает вход детектора
+
+    Returns
+    -------
+    tuple
+        коэфф изменения размера, (дельта ширины, дельта высоты)
+    """
+    scale, (resized_width, resized_height), (pad_width, pad_height), (dw, dh) = get_resize_params(
+        img.shape, out.shape[:2]
+    )
+    resized = cv2.resize(img, (resized_width, resized_height))
+
+    bottom = pad_height + resized_height
+    right = pad_width + resized_width
+    pad_value = PAD_VALUE_UINT8 if out.dtype == np.uint8 else PAD_VALUE
+    out[:pad_height] = pad_value
+    out[bottom:] = pad_value
+    out[pad_height:bottom, :pad_width] = pad_value
+    out[pad_height:bottom, right:] = pad_value
+    # BGR -> RGB через обратный порядок каналов, нормализация при записи
+    if out.dtype == np.uint8:
+        out[pad_height:bottom, pad_width:right] = resized[..., ::-1]
+    else:
+        np.multiply(resized[..., ::-1], NORM_SCALE, out=out[pad_height:bottom, pad_width:right], casting='unsafe')
+
+    return scale, (dw, dh)
 
 
 def preprocessing_img(img, img_size=1280):
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = img.astype(np.float32)
-    img /= 255.
-    img_preprocess, scale, (dw, dh) = resize_with_pad(img, img_size)
-    img_tensor = np.expand_dims(img_preprocess, axis=0)
+    img_tensor = np.empty((1, *get_input_shape(img_size), 3), dtype=np.float32)
+    scale, (dw, dh) = letterbox_into(img, img_tensor[0])
 
     return img_tensor, scale, (dw, dh)
 
@@ -55,8 +169,130 @@ def preprocess(img, config):
     Returns
     -------
     tuple
-        фото numpy([1, 1280, 1280, 3]), коэфф изменения размера (см resize_with_pad), дельта цирины, дельта высоты
+        фото numpy([1, 1280, 1280, 3]), коэфф изменения размера (см get_resize_params), дельта цирины, дельта высоты
     """
 
     return preprocessing_img(img, config["detector"]["img_size"])
 
+
+def get_input_dtype(input_dtype):
+    """Тип входа детектора по значению конфига
+
+    Parameters
+    ----------
+    input_dtype : str
+        float32, float16 или uint8
+
+    Returns
+    -------
+    numpy.dtype
+        Тип тензора входа
+
+    Raises
+    ------
+    ValueError
+        Неизвестный тип входа
+    """
+    if input_dtype not in INPUT_DTYPES:
+        raise ValueError(f"Unknown detector input dtype: {input_dtype}; expected one of {list(INPUT_DTYPES)}")
+    return np.dtype(INPUT_DTYPES[input_dtype])
+
+
+class BatchBuffer:
+    def __init__(self, img_size=1280, dtype=np.float32):
+        """Переиспользуемый тензор под пакет предобработанных фото.
+        Память выделяется заново только при росте размера пакета
+
+        Parameters
+        ----------
+        img_size : int or tuple, optional
+            Размер квадратного входа детектора или (высота, ширина), by default 1280
+        dtype : numpy.dtype, optional
+            Тип входа детектора (см get_input_dtype), by default np.float32
+        """
+        self.input_shape = get_input_shape(img_size)
+        self.dtype = dtype
+        self._buffer = np.empty((0, *self.input_shape, 3), dtype=dtype)
+
+    def get(self, batch_size):
+        """Тензор numpy([N, высота, ширина, 3]) под пакет фото
+
+        Parameters
+        ----------
+        batch_size : int
+            Количество фото в пакете
+
+        Returns
+        -------
+        numpy.array
+            Непрерывный тензор пакета, значения не инициализированы
+        """
+        if len(self._buffer) < batch_size:
+            self._buffer = np.empty((batch_size, *self.input_shape, 3), dtype=self.dtype)
+        return self._buffer[:batch_size]
+
+
+class DetectorSlots:
+    def __init__(self, buffers, batch_size):
+        """Слоты пакета детектора для всех форм входа. Тензор формы берется из ее буфера при первом фото
+        этой формы и только на фото пакета, которые еще не заняли слоты, поэтому неиспользуемые формы
+        не занимают память. Потокобезопасный: слоты берутся из пула загрузки
+
+        Parameters
+        ----------
+        buffers : list(BatchBuffer)
+            Буфер пакета для каждой формы входа (см get_input_shapes)
+        batch_size : int
+            Количество фото в пакете
+        """
+        self.buffers = buffers
+        self.batch_size = batch_size
+        self._batches = [None] * len(buffers)
+        self._counts = [0] * len(buffers)
+        self._lock = threading.Lock()
+
+    def take(self, shape_index):
+        """Следующий свободный слот формы входа: фото занимают слоты по порядку,
+        поэтому заполняют начало тензора и детектор получает его без копии
+
+        Parameters
+        ----------
+        shape_index : int
+            Индекс формы входа (см select_input_shape)
+
+        Returns
+        -------
+        tuple
+            Тензор пакета формы и индекс фото в нем
+        """
+        with self._lock:
+            if self._batches[shape_index] is None:
+                self._batches[shape_index] = self.buffers[shape_index].get(self.batch_size - sum(self._counts))
+            index = self._counts[shape_index]
+            self._counts[shape_index] += 1
+        return self._batches[shape_index], index
+
+    def batch(self, shape_index):
+        """Тензор пакета формы входа или None, если фото этой формы не было"""
+        return self._batches[shape_index]
+
+
+def preprocess_into(img, batch_tensor, index):
+    """Предобработка фото с записью в тензор пакета, размер входа берется из формы тензора
+
+    Parameters
+    ----------
+    img : numpy.array
+        Фото документа в виде numpy
+    batch_tensor : numpy.array
+        Тензор пакета (см BatchBuffer)
+    index : int
+        Индекс фото в пакете
+
+    Returns
+    -------
+    tuple
+        коэфф изменения размера, (дельта ширины, дельта высоты)
+    """
+
+    return letterbox_into(img, batch_tensor[index])
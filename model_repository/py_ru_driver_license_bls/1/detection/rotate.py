@@ -1,7 +1,5 @@
-import numpy as np
-
 from driver_license_classes import DriverLicenseClass
-from utils import rotate_img_with_bboxes
+from utils import rotate_bboxes
 
 
 def get_angle(first_box, second_box):
@@ -41,47 +39,38 @@ def get_angle(first_box, second_box):
     return rotate_angle
 
 
-def rotate_doc_with_bboxes(img, bboxes, classes):
-    """Функция поворота изображения
+def rotate_doc_with_bboxes(img_shape, bboxes, class_rows):
+    """Функция определения угла поворота документа и поворота рамок.
+    Само фото не поворачивается, поворачиваются только фрагменты полей (см utils.crop_rotated_img)
 
     Parameters
     ----------
-    img : numpy.array
-        Фото паспорта
+    img_shape : tuple
+        Высота и ширина фото документа
     bboxes : numpy.array
         Координаты рамок детекции
-    classes : numpy.array
-        Классы детекции
+    class_rows : numpy.array
+        Индекс строки детекции по id класса (см postprocess.get_class_rows)
 
     Returns
     -------
     tuple
-        Перевернутые фото, координаты рамок и угол поворота
+        Перевернутые координаты рамок и угол поворота
     """
 
     rotate_angle = 0
 
-    if DriverLicenseClass.photo.value in classes and DriverLicenseClass.birthday.value in classes:
-        photo_box_index = classes.index(DriverLicenseClass.photo.value)
-        photo_box = bboxes[photo_box_index]
-
-        birthday_box_index = classes.index(DriverLicenseClass.birthday.value)
-        birthday_box = bboxes[birthday_box_index]
-
-        rotate_angle = get_angle(photo_box, birthday_box)
-
-    if DriverLicenseClass.mrc.value in classes and DriverLicenseClass.back_serial.value in classes:
-        mrc_box_index = classes.index(DriverLicenseClass.mrc.value)
-        mrc_box = bboxes[mrc_box_index]
-
-        serial_box_index = classes.index(DriverLicenseClass.back_serial.value)
-        serial_box = bboxes[serial_box_index]
+    photo_row = class_rows[DriverLicenseClass.photo.value]
+    birthday_row = class_rows[DriverLicenseClass.birthday.value]
+    if photo_row >= 0 and birthday_row >= 0:
+        rotate_angle = get_angle(bboxes[photo_row], bboxes[birthday_row])
 
-        rotate_angle = get_angle(mrc_box, serial_box)
+    mrc_row = class_rows[DriverLicenseClass.mrc.value]
+    serial_row = class_rows[DriverLicenseClass.back_serial.value]
+    if mrc_row >= 0 and serial_row >= 0:
+        rotate_angle = get_angle(bboxes[mrc_row], bboxes[serial_row])
 
     if rotate_angle != 0:
-        bboxes_array = np.array(bboxes)
-        img, new_bboxes_array = rotate_img_with_bboxes(img, bboxes_array, rotate_angle)
-        bboxes = new_bboxes_array.tolist()
+        bboxes = rotate_bboxes(bboxes, rotate_angle, img_shape)
 
-    return img, bboxes, rotate_angle
+    return bboxes, rotate_angle
@@ -0,0 +1,218 @@
+import base64
+import http.client
+import queue
+import ssl
+import threading
+from contextlib import contextmanager
+from urllib.parse import unquote, urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, url: str, status: int, reason: str) -> None:
+        self.status = status
+        self.message = f'HTTP Error {status}: {reason}; url: {url}'
+        super().__init__(self.message)
+
+
+def get_proxy_headers(proxy):
+    """Заголовок Proxy-Authorization для прокси с логином в url
+
+    Parameters
+    ----------
+    proxy : urllib.parse.SplitResult
+        Разобранный url прокси
+
+    Returns
+    -------
+    dict(str, str)
+        Заголовки запроса к прокси
+    """
+    if proxy.username is None:
+        return {}
+    credentials = f'{unquote(proxy.username)}:{unquote(proxy.password or "")}'
+    return {'Proxy-Authorization': f'Basic {base64.b64encode(credentials.encode()).decode()}'}
+
+
+class HTTPConnectionPool:
+    # Ошибки переиспользованного соединения, которое сервер успел закрыть
+    STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+    MAX_REDIRECTS = 5
+    SCHEMES = ('http', 'https')
+
+    def __init__(self, max_connections_per_host=8, cafile=None, proxies=None):
+        """Пул keep-alive HTTP(S) соединений.
+        SSL контекст создается один раз, соединения к одному хосту переиспользуются между запросами.
+        Прокси берутся как у urllib.request.urlopen: из переменных окружения HTTP(S)_PROXY с учетом NO_PROXY,
+        https запросы идут через туннель CONNECT, http запросы - на прокси с полным url
+
+        Parameters
+        ----------
+        max_connections_per_host : int, optional
+            Максимальное количество простаивающих соединений к одному хосту, хранимых в пуле,
+            by default 8. Одновременные соединения не ограничиваются, их число задает
+            количество потоков, выполняющих запросы
+        cafile : str, optional
+            Путь к файлу корневых сертификатов, by default None
+        proxies : dict(str, str), optional
+            url прокси по схеме запроса, by default None - urllib.request.getproxies()
+        """
+        self.max_connections_per_host = max_connections_per_host
+        self.ssl_context = ssl.create_default_context(cafile=cafile)
+        self.proxies = getproxies() if proxies is None else proxies
+        self._idle_connections = {}
+        self._lock = threading.Lock()
+
+    def _get_proxy(self, scheme, host):
+        """url прокси для хоста, разобранный urlsplit, или None для прямого соединения"""
+        proxy_url = self.proxies.get(scheme)
+        if not proxy_url or proxy_bypass(host):
+            return None
+        proxy = urlsplit(proxy_url if '://' in proxy_url else f'http://{proxy_url}')
+        if proxy.scheme != 'http' or not proxy.hostname:
+            raise ValueError(f'Unsupported {scheme} proxy: {proxy_url}; expected http://host:port')
+        return proxy
+
+    def _get_idle_queue(self, key):
+        with self._lock:
+            if key not in self._idle_connections:
+                self._idle_connections[key] = queue.LifoQueue(maxsize=self.max_connections_per_host)
+            return self._idle_connections[key]
+
+    def _new_connection(self, key, timeout_s):
+        scheme, host, port = key
+        proxy = self._get_proxy(scheme, host)
+        if proxy is None:
+            if scheme == 'https':
+                return http.client.HTTPSConnection(host, port, timeout=timeout_s, context=self.ssl_context)
+            return http.client.HTTPConnection(host, port, timeout=timeout_s)
+
+        proxy_headers = get_proxy_headers(proxy)
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(proxy.hostname, proxy.port, timeout=timeout_s, context=self.ssl_context)
+            conn.set_tunnel(host, port, headers=proxy_headers)
+            return conn
+        conn = http.client.HTTPConnection(proxy.hostname, proxy.port, timeout=timeout_s)
+        # Без туннеля прокси получает полный url запроса и свои заголовки в каждом запросе
+        conn.proxy_headers = proxy_headers
+        return conn
+
+    def _acquire(self, key, timeout_s):
+        """Возвращает простаивающее соединение из пула или новое и флаг переиспользования"""
+        try:
+            conn = self._get_idle_queue(key).get_nowait()
+        except queue.Empty:
+            return self._new_connection(key, timeout_s), False
+
+        conn.timeout = timeout_s
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout_s)
+        return conn, True
+
+    def _release(self, key, conn, response):
+        """Возвращает соединение в пул, если ответ дочитан и сервер не закрывает соединение"""
+        if response.isclosed() and not response.will_close:
+            try:
+                self._get_idle_queue(key).put_nowait(conn)
+                return
+            except queue.Full:
+                pass
+        conn.close()
+
+    def _request(self, conn, key, path):
+        headers = {'Connection': 'keep-alive'}
+        proxy_headers = getattr(conn, 'proxy_headers', None)
+        if proxy_headers is not None:
+            scheme, host, port = key
+            netloc = f'[{host}]' if ':' in host else host
+            path = f'{scheme}://{netloc}:{port}{path}' if port else f'{scheme}://{netloc}{path}'
+            headers.update(proxy_headers)
+        conn.request('GET', path, headers=headers)
+        return conn.getresponse()
+
+    def _send(self, key, path, timeout_s):
+        conn, is_reused = self._acquire(key, timeout_s)
+        try:
+            return conn, self._request(conn, key, path)
+        except self.STALE_CONNECTION_ERRORS:
+            conn.close()
+            if not is_reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        # Сервер закрыл простаивающее соединение, повторяем на новом
+        conn = self._new_connection(key, timeout_s)
+        try:
+            return conn, self._request(conn, key, path)
+        except Exception:
+            conn.close()
+            raise
+
+    @contextmanager
+    def get(self, url, timeout_s):
+        """GET запрос. Тело ответа нужно дочитать внутри контекста,
+        тогда соединение вернется в пул для следующих запросов
+
+        Parameters
+        ----------
+        url : str
+            url запроса
+        timeout_s : float
+            timeout соединения и чтения
+
+        Yields
+        ------
+        http.client.HTTPResponse
+            Ответ сервера со статусом 2xx
+
+        Raises
+        ------
+        HTTPStatusError
+            Сервер вернул статус ошибки или редиректов больше MAX_REDIRECTS
+        ValueError
+            Схема url не http(s), в url нет хоста или прокси не http
+        """
+        for redirect_count in range(self.MAX_REDIRECTS + 1):
+            parsed_url = urlsplit(url)
+            if parsed_url.scheme not in self.SCHEMES or not parsed_url.hostname:
+                raise ValueError(f'Unsupported url: {url}; expected http(s)://host/path')
+            key = (parsed_url.scheme, parsed_url.hostname, parsed_url.port)
+            path = parsed_url.path or '/'
+            if parsed_url.query:
+                path = f'{path}?{parsed_url.query}'
+
+            conn, response = self._send(key, path, timeout_s)
+            location = response.getheader('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                response.read()
+                # ответ дочитан, соединение возвращается в пул и больше не используется здесь
+                self._release(key, conn, response)
+                if redirect_count == self.MAX_REDIRECTS:
+                    raise HTTPStatusError(url, response.status, f'Too many redirects ({self.MAX_REDIRECTS})')
+                url = urljoin(url, location)
+                continue
+            break
+
+        try:
+            if response.status >= 300:
+                response.read()
+                raise HTTPStatusError(url, response.status, response.reason)
+            yield response
+        except BaseException:
+            conn.close()
+            raise
+        self._release(key, conn, response)
+
+    def close(self):
+        """Закрытие всех простаивающих соединений"""
+        with self._lock:
+            idle_queues = list(self._idle_connections.values())
+            self._idle_connections = {}
+        for idle_queue in idle_queues:
+            while True:
+                try:
+                    idle_queue.get_nowait().close()
+                except queue.Empty:
+                    break
@@ -0,0 +1,169 @@
+import struct
+
+
+# Маркеры JPEG без длины сегмента
+STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+# Начало данных изображения и конец файла: дальше метаданных нет
+SOS_MARKER = 0xDA
+EOI_MARKER = 0xD9
+APP1_MARKER = 0xE1
+# Маркеры SOF (начало кадра): 0xC0-0xCF кроме DHT, JPG и DAC
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+EXIF_HEADER = b'Exif\x00\x00'
+ORIENTATION_TAG = 0x0112
+TIFF_SHORT = 3
+TIFF_LONG = 4
+
+
+def is_jpeg(data):
+    """Проверка сигнатуры JPEG (SOI маркер)
+
+    Parameters
+    ----------
+    data : bytes | memoryview
+        Байты фото
+
+    Returns
+    -------
+    bool
+        Флаг JPEG файла
+    """
+
+    return len(data) >= 2 and data[0] == 0xFF and data[1] == 0xD8
+
+
+def iter_segments(data):
+    """Обход сегментов заголовка JPEG до начала данных изображения
+
+    Parameters
+    ----------
+    data : bytes | memoryview
+        Байты JPEG
+
+    Yields
+    ------
+    tuple
+        маркер, смещение данных сегмента, длина данных сегмента
+    """
+
+    position = 2
+    data_size = len(data)
+    while position + 4 <= data_size:
+        if data[position] != 0xFF:
+            return
+        marker = data[position + 1]
+        # Байты заполнения 0xFF перед маркером
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            position += 2
+            continue
+        if marker in (SOS_MARKER, EOI_MARKER):
+            return
+        segment_size = (data[position + 2] << 8) | data[position + 3]
+        if segment_size < 2:
+            return
+        yield marker, position + 4, segment_size - 2
+        position += 2 + segment_size
+
+
+def read_tiff_orientation(data, tiff_start, tiff_end):
+    """Чтение тега Orientation (0x0112) из IFD0 блока TIFF
+
+    Parameters
+    ----------
+    data : bytes | memoryview
+        Байты фото
+    tiff_start : int
+        Смещение заголовка TIFF
+    tiff_end : int
+        Конец блока TIFF
+
+    Returns
+    -------
+    int
+        Значение тега или None, если тега нет
+    """
+
+    if tiff_end - tiff_start < 8:
+        return None
+    byte_order = bytes(data[tiff_start:tiff_start + 2])
+    if byte_order == b'II':
+        endian = '<'
+    elif byte_order == b'MM':
+        endian = '>'
+    else:
+        return None
+
+    magic, ifd_offset = struct.unpack_from(f'{endian}HI', data, tiff_start + 2)
+    if magic != 42:
+        return None
+    ifd_start = tiff_start + ifd_offset
+    if ifd_start + 2 > tiff_end:
+        return None
+
+    (entries_count,) = struct.unpack_from(f'{endian}H', data, ifd_start)
+    entries_end = min(ifd_start + 2 + entries_count * 12, tiff_end - 11)
+    for entry_start in range(ifd_start + 2, entries_end, 12):
+        tag, value_type = struct.unpack_from(f'{endian}HH', data, entry_start)
+        if tag != ORIENTATION_TAG:
+            continue
+        if value_type == TIFF_SHORT:
+            return struct.unpack_from(f'{endian}H', data, entry_start + 8)[0]
+        if value_type == TIFF_LONG:
+            return struct.unpack_from(f'{endian}I', data, entry_start + 8)[0]
+        return None
+
+    return None
+
+
+def read_orientation(data):
+    """Чтение EXIF ориентации JPEG без разбора остальных тегов
+
+    Parameters
+    ----------
+    data : bytes | memoryview
+        Байты JPEG
+
+    Returns
+    -------
+    int
+        Значение тега Orientation или None, если тега нет
+    """
+
+    for marker, segment_start, segment_size in iter_segments(data):
+        if marker != APP1_MARKER or bytes(data[segment_start:segment_start + 6]) != EXIF_HEADER:
+            continue
+        segment_end = min(segment_start + segment_size, len(data))
+        try:
+            orientation = read_tiff_orientation(data, segment_start + 6, segment_end)
+        except struct.error:
+            orientation = None
+        if orientation is not None:
+            return orientation
+
+    return None
+
+
+def read_size(data):
+    """Размер JPEG из заголовка кадра (SOF) без декодирования
+
+    Parameters
+    ----------
+    data : bytes | memoryview
+        Байты JPEG
+
+    Returns
+    -------
+    tuple
+        высота, ширина или None, если заголовок кадра не найден
+    """
+
+    for marker, segment_start, segment_size in iter_segments(data):
+        if marker in SOF_MARKERS and segment_size >= 5 and segment_start + 5 <= len(data):
+            height, width = struct.unpack_from('>HH', data, segment_start + 1)
+            return height, width
+
+    return None
@@ -0,0 +1,56 @@
+import triton_python_backend_utils as pb_utils
+
+
+class Logger:
+    # Уровни логирования по возрастанию подробности
+    LEVELS = {"error": 0, "warn": 1, "info": 2, "verbose": 3}
+
+    def __init__(self, level="info"):
+        """Обертка над pb_utils.Logger с уровнем из конфига сервиса.
+        Сообщение форматируется в стиле logging (`msg % args`) только если уровень включен
+
+        Parameters
+        ----------
+        level : str, optional
+            Уровень логирования: error, warn, info или verbose, by default "info"
+        """
+        self.set_level(level)
+
+    def set_level(self, level):
+        """Установка уровня логирования
+
+        Parameters
+        ----------
+        level : str
+            Уровень логирования: error, warn, info или verbose
+
+        Raises
+        ------
+        ValueError
+            Неизвестный уровень логирования
+        """
+        if level not in self.LEVELS:
+            raise ValueError(f"Unknown log level: {level}; expected one of {list(self.LEVELS)}")
+        self.level = self.LEVELS[level]
+
+    def is_enabled(self, level):
+        return self.LEVELS[level] <= self.level
+
+    def verbose(self, msg, *args):
+        if self.level >= self.LEVELS["verbose"]:
+            pb_utils.Logger.log_verbose(msg % args if args else msg)
+
+    def info(self, msg, *args):
+        if self.level >= self.LEVELS["info"]:
+            pb_utils.Logger.log_info(msg % args if args else msg)
+
+    def warn(self, msg, *args):
+        if self.level >= self.LEVELS["warn"]:
+            pb_utils.Logger.log_warn(msg % args if args else msg)
+
+    def error(self, msg, *args):
+        pb_utils.Logger.log_error(msg % args if args else msg)
+
+
+# Логгер процесса модели, уровень задается в TritonPythonModel.initialize
+logger = Logger()
@@ -0,0 +1,171 @@
+import bisect
+import time
+
+import triton_python_backend_utils as pb_utils
+
+
+# Границы корзин задержки этапа в мс
+DEFAULT_LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class StageLatencyMetrics:
+    def __init__(self, model_name, model_version, enabled=False, buckets_ms=DEFAULT_LATENCY_BUCKETS_MS):
+        """Задержки этапов обработки в виде гистограммы prometheus из счетчиков:
+        накопительные корзины `*_bucket` с меткой `le`, сумма `*_sum` и количество `*_count`.
+        В Triton 23.09 нет типа HISTOGRAM, p50/p99 считаются через histogram_quantile по корзинам.
+        Если метрики выключены, замеры не делаются
+
+        Parameters
+        ----------
+        model_name : str
+            Имя модели
+        model_version : str
+            Версия модели
+        enabled : bool, optional
+            Флаг сбора метрик, by default False
+        buckets_ms : tuple(float), optional
+            Границы корзин в мс, by default DEFAULT_LATENCY_BUCKETS_MS
+        """
+        self.enabled = enabled
+        if not enabled:
+            return
+
+        self.labels = {"model": model_name, "version": model_version}
+        self.buckets_ns = [int(x * 1e+6) for x in buckets_ms]
+        self.bucket_labels = [f"{x:g}" for x in buckets_ms] + ["+Inf"]
+        self.bucket_family = pb_utils.MetricFamily(
+            name="passport_stage_latency_ms_bucket",
+            description="Stage latency histogram buckets, ms",
+            kind=pb_utils.MetricFamily.COUNTER,
+        )
+        self.sum_family = pb_utils.MetricFamily(
+            name="passport_stage_latency_ms_sum",
+            description="Stage latency sum, ms",
+            kind=pb_utils.MetricFamily.COUNTER,
+        )
+        self.count_family = pb_utils.MetricFamily(
+            name="passport_stage_latency_ms_count",
+            description="Stage latency observations count",
+            kind=pb_utils.MetricFamily.COUNTER,
+        )
+        self._stage_metrics = {}
+
+    def _get_stage_metrics(self, stage):
+        if stage not in self._stage_metrics:
+            labels = {**self.labels, "stage": stage}
+            self._stage_metrics[stage] = (
+                [self.bucket_family.Metric(labels={**labels, "le": x}) for x in self.bucket_labels],
+                self.sum_family.Metric(labels=labels),
+                self.count_family.Metric(labels=labels),
+            )
+        return self._stage_metrics[stage]
+
+    def new_timings(self, force=False):
+        """Словарь для замеров этапов в потоках пула и во вложенных функциях
+
+        Parameters
+        ----------
+        force : bool, optional
+            Замерять этапы при выключенных метриках, например для trace запроса, by default False
+
+        Returns
+        -------
+        dict
+            Пустой словарь этап -> время в нс или None, если метрики выключены
+        """
+        return {} if self.enabled or force else None
+
+    def start(self):
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def observe_since(self, stage, start_ns):
+        if self.enabled:
+            self.observe(stage, time.perf_counter_ns() - start_ns)
+
+    def observe(self, stage, duration_ns):
+        """Учет одного замера этапа
+
+        Parameters
+        ----------
+        stage : str
+            Название этапа
+        duration_ns : int
+            Длительность в нс
+        """
+        if not self.enabled:
+            return
+        bucket_metrics, sum_metric, count_metric = self._get_stage_metrics(stage)
+        # Корзины накопительные: замер попадает во все корзины с границей не меньше длительности
+        for metric in bucket_metrics[bisect.bisect_left(self.buckets_ns, duration_ns):]:
+            metric.increment(1)
+        sum_metric.increment(duration_ns / 1e+6)
+        count_metric.increment(1)
+
+    def observe_all(self, timings):
+        """Учет всех замеров словаря (см new_timings)
+
+        Parameters
+        ----------
+        timings : dict(str, int)
+            Длительности этапов в нс, может быть None
+        """
+        if not timings:
+            return
+        for stage, duration_ns in timings.items():
+            self.observe(stage, duration_ns)
+
+
+class TensorBytesMetrics:
+    def __init__(self, model_name, model_version):
+        """Объем тензоров, передаваемых из BLS в модели Triton.
+        Входы CPU тензоров pb_utils.Tensor копируются в разделяемую память Triton при каждом запросе (kind=input),
+        дополнительные копии в самом BLS учитываются отдельно (kind=stub_copy).
+        Выходы моделей читаются из разделяемой памяти без копии (as_numpy)
+
+        Parameters
+        ----------
+        model_name : str
+            Имя модели
+        model_version : str
+            Версия модели
+        """
+        self.labels = {"model": model_name, "version": model_version}
+        self.family = pb_utils.MetricFamily(
+            name="passport_bls_tensor_bytes",
+            description="Bytes of BLS tensors passed to Triton models",
+            kind=pb_utils.MetricFamily.COUNTER,
+        )
+        self._metrics = {}
+
+    def observe(self, target, kind, nbytes):
+        """Учет переданных байтов
+
+        Parameters
+        ----------
+        target : str
+            Модель назначения: detection или ключ модели распознавания
+        kind : str
+            input - копия входа в разделяемую память, stub_copy - дополнительная копия в BLS
+        nbytes : int
+            Количество байтов
+        """
+        key = (target, kind)
+        if key not in self._metrics:
+            self._metrics[key] = self.family.Metric(labels={**self.labels, "target": target, "kind": kind})
+        self._metrics[key].increment(nbytes)
+
+
+def record_since(timings, stage, start_ns):
+    """Запись длительности этапа в словарь замеров, если замеры включены
+
+    Parameters
+    ----------
+    timings : dict(str, int)
+        Словарь замеров или None
+    stage : str
+        Название этапа
+    start_ns : int
+        Начало этапа, time.perf_counter_ns()
+    """
+    if timings is not None:
+        timings[stage] = time.perf_counter_ns() - start_ns
@@ -1,15 +1,28 @@
+import asyncio
+import certifi
+import hashlib
+import itertools
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 import yaml
 import traceback
 import triton_python_backend_utils as pb_utils
 import numpy as np
 
 from detection import detect
+from detection.preprocess import (BatchBuffer, DetectorSlots, get_input_dtype, get_input_shapes, preprocess_into,
+                                  select_input_shape)
 from driver_license_side import DriverLicenseSide
+from http_client import HTTPConnectionPool
+from log import logger
+from metrics import DEFAULT_LATENCY_BUCKETS_MS, StageLatencyMetrics, TensorBytesMetrics, record_since
 from recognition import recognize
 from recognition.fields_recognition import ResultFieldRecognition
-from utils import download_transpose, ImageNotLoad
+from recognition.validation import get_validators
+from request_trace import RequestTrace
+from result_cache import get_result_cache
+from utils import decode_transpose, download_image_bytes, ImageNotLoad, DEFAULT_MAX_IMAGE_SIZE
 
 
 APP_CONFIG_PATH = "/app_configs/driver_license_config.yaml"
@@ -47,6 +60,50 @@ class ResultDriverLicenseRecognition:
         }
 
 
+class RequestContext:
+    def __init__(self, request, log_msg):
+        """Состояние обработки одного запроса из пакета
+
+        Parameters
+        ----------
+        request : pb_utils.InferenceRequest
+            Запрос к модели
+        log_msg : str
+            Шаблон строки лога запроса
+        """
+        self.request = request
+        self.log_msg = log_msg
+        self.img_guid = None
+        self.img_url = None
+        # Ожидаемый размер фото в байтах из поля size запроса
+        self.img_size = None
+        self.document_image = None
+        # Коэфф изменения размера и паддинг фото для детектора
+        self.scale_pad = None
+        # Индекс формы входа детектора и индекс фото в тензоре пакета этой формы
+        self.batch_index = None
+        self.detection_result = None
+        self.recognition_result = ResultDriverLicenseRecognition(is_driver_license_found=False,
+                                                                 side=DriverLicenseSide.NoneSide,
+                                                                 fields_recognition_result=[])
+        # Ответ на запрос, заполняется при ошибке или по окончании обработки
+        self.response = None
+        # Для итоговой строки лога запроса
+        self.start_time_ns = time.perf_counter_ns()
+        self.image_load_time = None
+        self.not_recognized_fields = []
+        self.error = None
+        # Временная шкала обработки, если запрошена флагом trace
+        self.trace = None
+        # Ключи кэша результатов: GUID фото и хэш содержимого
+        self.cache_keys = []
+        # Тип ключа, по которому результат найден в кэше
+        self.cache_hit = None
+        # Запрос того же GUID в пакете, результат которого получает этот запрос
+        self.leader = None
+        self.result_json = None
+
+
 class TritonPythonModel:
     """Каждая создаваемая модель Python должна иметь имя класса «TritonPythonModel»."""
 
@@ -82,6 +139,42 @@ class TritonPythonModel:
         # Custom app config
         with open(APP_CONFIG_PATH, "r", encoding="utf-8") as conf_f:
             self.config = yaml.load(conf_f, Loader=yaml.Loader)
+        # Log verbosity, step messages are only formatted on the verbose level
+        logger.set_level(self.config.get("logging", {}).get("level", "info"))
+        # Pool for image downloads, all images of a batch are loaded at once
+        download_workers = self.config["image_download"].get("max_workers", 8)
+        self.download_executor = ThreadPoolExecutor(
+            max_workers=download_workers,
+            thread_name_prefix="image_download",
+        )
+        # Keep-alive connections to the file server, shared by download workers; max_connections
+        # caps the idle connections kept per host, concurrent ones are bounded by max_workers.
+        # HTTP(S)_PROXY and NO_PROXY are honoured as in urllib
+        self.http_pool = HTTPConnectionPool(
+            max_connections_per_host=self.config["image_download"].get("max_connections", download_workers),
+            cafile=certifi.where(),
+        )
+        # Detector input tensors, one per input shape (a square img_size or input_shapes
+        # aspect buckets), reused between batches and grown only for a larger batch;
+        # uint8 and float16 inputs need a detector model that normalizes in its graph
+        detector_config = self.config["ru_driver_license_models"]["detector"]
+        self.detector_shapes = get_input_shapes(detector_config)
+        self.detector_buffers = [
+            BatchBuffer(input_shape, get_input_dtype(detector_config.get("input_dtype", "float32")))
+            for input_shape in self.detector_shapes
+        ]
+        # CTC decoders of every recognition model, greedy or constrained beam search
+        self.decoders = recognize.get_decoders(self.config["ru_driver_license_models"])
+        # OCR input tensors of every recognition model, reused between batches
+        self.crop_buffers = recognize.get_crop_buffers(self.config["ru_driver_license_models"])
+        # Validation function of every recognized field
+        self.validators = get_validators(self.config["ru_driver_license_models"]["recognized_fields"])
+        # Serialized results by image GUID and content hash, None when disabled
+        cache_config = self.config.get("result_cache", {})
+        self.result_cache = get_result_cache(cache_config)
+        self.cache_content_hash = self.result_cache is not None and cache_config.get("content_hash", False)
+        # Results of other model versions must not be shared through the common backend
+        self.cache_key_prefix = f"{self.model_name}/{self.model_version}"
 
         # Counter metrics
         self.metric_counter_family = pb_utils.MetricFamily(
@@ -129,8 +222,36 @@ class TritonPythonModel:
             labels={"model": self.model_name, "metric": "inference_request_failure"}
         )
 
-    def execute(self, requests):
-        """
+        # Requests of a batch answered by another request for the same GUID
+        self.metric_coalesced_requests = self.metric_counter_family.Metric(
+            labels={"model": self.model_name, "version": self.model_version, "metric": "coalesced_requests"}
+        )
+
+        # Result cache metrics, a miss is counted per GUID lookup whether or not the request succeeds
+        self.metric_result_cache_hit = self.metric_counter_family.Metric(
+            labels={"model": self.model_name, "version": self.model_version, "metric": "result_cache_hit"}
+        )
+        self.metric_result_cache_miss = self.metric_counter_family.Metric(
+            labels={"model": self.model_name, "version": self.model_version, "metric": "result_cache_miss"}
+        )
+
+        # Bytes of BLS input tensors copied to the Triton shared memory and extra copies in the stub
+        self.tensor_bytes = TensorBytesMetrics(self.model_name, self.model_version)
+
+        # Per-stage latency histograms, nothing is measured when disabled
+        metrics_config = self.config.get("metrics", {})
+        self.stage_latency = StageLatencyMetrics(
+            self.model_name,
+            self.model_version,
+            enabled=metrics_config.get("stage_latency", False),
+            buckets_ms=tuple(metrics_config.get("latency_buckets_ms", DEFAULT_LATENCY_BUCKETS_MS)),
+        )
+
+    async def execute(self, requests):
+        """Асинхронный execute: позволяет отправлять BLS запросы через async_exec.
+        Запросы пакета (dynamic batching) обрабатываются по этапам: загрузка всех фото,
+        детекция всех фото одним запросом, распознавание полей всех документов общими запросами к моделям OCR
+
         Parameters
         ----------
         requests : list
@@ -147,151 +268,648 @@ class TritonPythonModel:
         Exception
             Ошибки загрузки изображения, детекции и распознавания
         """
-        responses = []
-        for request in requests:
-            log_msg = f"{self.model_log} request_id: {request.request_id()};"
-            pb_utils.Logger.log_info(f"{log_msg} start process")
+        batch_contexts = [
+            RequestContext(request, f"{self.model_log} request_id: {request.request_id()};")
+            for request in requests
+        ]
+        logger.verbose("%s batch size: %d", self.model_log, len(batch_contexts))
+
+        # load images, all downloads start at once and every image is
+        # preprocessed for the detector in the pool as soon as it arrives
+        for context in batch_contexts:
+            logger.verbose("%s start process", context.log_msg)
             try:
-                recognition_result = ResultDriverLicenseRecognition(is_driver_license_found=False,
-                                                                    side=DriverLicenseSide.NoneSide,
-                                                                    fields_recognition_result=[])
-                # get INPUT
-                pb_utils.Logger.log_info(f"{log_msg} get input tensor")
-                input_request = pb_utils.get_input_tensor_by_name(
-                    request, "image_guid"
-                ).as_numpy()[0]
-                pb_utils.Logger.log_info(f"{log_msg} get request json")
-                img_guid = json.loads(input_request.decode())["guid"]
-                pb_utils.Logger.log_info(f"{log_msg} img_guid: {img_guid}")
-
-                # load image
-                img_url = self.config["image_download"]["url"].format(
-                    img_guid, self.config["image_download"]["token"]
-                )
-                pb_utils.Logger.log_verbose(f"{log_msg} img_url: {img_url}")
-                image_load_start_ns = time.time_ns()
-                img = download_transpose(
-                    img_url, self.config["image_download"]["timeout_sec"]
+                self.parse_request(context)
+            except Exception as err:
+                self.set_error_response(context, err)
+            else:
+                self.trace_stage([context], "parse", context.start_time_ns)
+                if self.result_cache is not None:
+                    self.check_result_cache(context)
+
+        # requests for the same GUID share one download and inference
+        contexts, followers = self.coalesce_requests(batch_contexts)
+
+        load_indexes = [index for index, context in enumerate(contexts) if context.response is None]
+        # every image goes to the input shape closest to its aspect ratio; loaded
+        # images take the slots of their shape in order of arrival, and the tensor
+        # of a shape is taken from its buffer only when the first image lands there
+        detector_slots = DetectorSlots(self.detector_buffers, len(load_indexes))
+        load_start_ns = time.perf_counter_ns()
+        loop = asyncio.get_running_loop()
+        load_results = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    self.download_executor,
+                    self.load_image,
+                    contexts[index].img_url,
+                    contexts[index].img_size,
+                    detector_slots,
+                    contexts[index].trace is not None,
                 )
-                if img is None:
-                    raise ImageNotLoad(f"Image with guid: {img_guid} is None")
-                image_load_end_ns = time.time_ns()
-                image_load_time = image_load_end_ns - image_load_start_ns
-                pb_utils.Logger.log_info(
-                    f"{log_msg} image load time: {image_load_time / 1e+6} ms"
+                for index in load_indexes
+            ],
+            return_exceptions=True,
+        )
+        for index, load_result in zip(load_indexes, load_results):
+            context = contexts[index]
+            if isinstance(load_result, Exception):
+                self.set_error_response(context, load_result)
+            else:
+                self.trace_stage([context], "load_image", load_start_ns, load_result[3])
+                self.save_loaded_image(context, *load_result)
+
+        # infer detection, images of one input shape go to the detector in one request
+        contexts_to_detect = sorted(
+            [x for x in contexts if x.response is None], key=lambda x: x.batch_index
+        )
+        await asyncio.gather(
+            *[
+                self.detect_documents(list(shape_contexts), detector_slots.batch(shape_index))
+                for shape_index, shape_contexts in itertools.groupby(
+                    contexts_to_detect, key=lambda x: x.batch_index[0]
                 )
-                self.metric_load_image_time.increment(image_load_time)
-                pb_utils.Logger.log_info(f"{log_msg} image shape: {img.shape}")
+            ]
+        )
 
-                # infer detection
-                pb_utils.Logger.log_info(f"{log_msg} infer detection")
-                detection_result = detect.infer_model(
-                    img, self.config["ru_driver_license_models"], log_msg
+        # full resolution images for the crops are decoded in the pool,
+        # only the field crops are rotated later
+        contexts_to_recognize = [
+            x for x in contexts
+            if x.response is None and x.recognition_result.side == DriverLicenseSide.FrontSide
+        ]
+        full_image_start_ns = time.perf_counter_ns()
+        recognition_imgs = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    self.download_executor,
+                    x.document_image.get_full_img,
                 )
-                if len(detection_result.predictions) > 0:
-
-                    min_detection_score = min(
-                        [x.score for x in detection_result.predictions]
-                    )
-                    pb_utils.Logger.log_info(
-                        f"{log_msg} min detection score: {min_detection_score}"
-                    )
-                    self.metric_detection_min_score.set(min_detection_score)
-                else:
-                    pb_utils.Logger.log_info(
-                        f"{log_msg} detection is empty"
-                    )
-
-                pb_utils.Logger.log_info(
-                    f"{log_msg} detection is correct: {detection_result.is_correct}"
+                for x in contexts_to_recognize
+            ],
+            return_exceptions=True,
+        )
+        for context, recognition_img in zip(contexts_to_recognize, recognition_imgs):
+            if isinstance(recognition_img, Exception):
+                self.set_error_response(context, recognition_img)
+            else:
+                context.detection_result.img = recognition_img
+                self.trace_stage([context], "full_image_decode", full_image_start_ns, shape=list(recognition_img.shape))
+
+        # infer recognition, fields of all documents are recognized together
+        contexts_to_recognize = [x for x in contexts_to_recognize if x.response is None]
+        if contexts_to_recognize:
+            recognition_start_ns = time.perf_counter_ns()
+            recognition_timings = self.stage_latency.new_timings(self.is_traced(contexts_to_recognize))
+            recognition_shapes = {}
+            recognition_bytes = {}
+            try:
+                fields_recognition_results = await self.fields_recognition(
+                    contexts_to_recognize, recognition_timings, recognition_shapes, recognition_bytes
                 )
-                if detection_result.is_correct:
-                    recognition_result.is_driver_license_found = True
-
-                    # infer recognition
-                    pb_utils.Logger.log_info(f"{log_msg} infer recognition")
-                    if detection_result.is_front_side:
-                        recognition_result.side = DriverLicenseSide.FrontSide
-                        recognition_result.fields_recognition_result = self.fields_recognition(detection_result, log_msg)
+            except Exception as err:
+                for context in contexts_to_recognize:
+                    self.set_error_response(context, err)
+            else:
+                # an error of one document fails only its request
+                for context, fields_recognition_result in zip(contexts_to_recognize, fields_recognition_results):
+                    if isinstance(fields_recognition_result, Exception):
+                        self.set_error_response(context, fields_recognition_result)
                     else:
-                        recognition_result.side = DriverLicenseSide.BackSide
-                    # collecting recognize metrics
-                    not_recognize_list = []
-                    min_word_score = 1
-                    for recognize_res in recognition_result.fields_recognition_result:
-                        if not recognize_res.is_ocr:
-                            not_recognize_list.append(recognize_res.field_name)
-                        elif recognize_res.field_text_score < min_word_score:
-                            min_word_score = recognize_res.field_text_score
-                    pb_utils.Logger.log_info(
-                        f"{log_msg} not recognize fields: {not_recognize_list}"
-                    )
-                    self.metric_recognition_failur.increment(len(not_recognize_list))
-                    self.metric_recognition_min_score.set(min_word_score)
-                else:
-                    self.metric_detection_failur.increment(1)
-                pb_utils.Logger.log_info(f"{log_msg} create response")
-                inference_response = pb_utils.InferenceResponse(
-                    output_tensors=[
-                        pb_utils.Tensor(
-                            "recognition_response",
-                            np.array(
-                                [json.dumps(recognition_result.to_dict())],
-                                dtype=self.output_dtype,
-                            ),
-                        )
-                    ]
-                )
-            except ImageNotLoad as img_load_err:
-                self.metric_load_image_failure.increment(1)
-                trace_msg = "".join(traceback.format_exception(img_load_err))
-                err_msg = f'{log_msg} Error loading image with guid {img_guid};'
-                pb_utils.Logger.log_error(f'{err_msg} Trace {trace_msg}')
-                inference_response = pb_utils.InferenceResponse(
-                    error=pb_utils.TritonError(f'{err_msg}', pb_utils.TritonError.INTERNAL)
+                        context.recognition_result.fields_recognition_result = fields_recognition_result
+            self.stage_latency.observe_all(recognition_timings)
+            for model_key, input_bytes in recognition_bytes.items():
+                self.tensor_bytes.observe(model_key, "input", input_bytes)
+            self.trace_stage(
+                contexts_to_recognize, "recognition", recognition_start_ns, recognition_timings,
+                shapes=recognition_shapes, input_bytes=recognition_bytes,
+            )
+
+        for context in contexts:
+            if context.response is None:
+                try:
+                    self.collect_recognition_metrics(context)
+                    serialization_start_ns = self.stage_latency.start()
+                    result_json = json.dumps(context.recognition_result.to_dict())
+                    context.result_json = result_json
+                    if self.result_cache is not None:
+                        self.result_cache.put(context.cache_keys, result_json)
+                    context.response = self.json_response(context, result_json)
+                    self.stage_latency.observe_since("serialization", serialization_start_ns)
+                except Exception as err:
+                    self.set_error_response(context, err)
+
+        for context in followers:
+            self.set_leader_response(context)
+
+        if logger.is_enabled("info"):
+            for context in batch_contexts:
+                self.log_summary(context)
+
+        return [x.response for x in batch_contexts]
+
+    def parse_request(self, context):
+        """Чтение входного тензора запроса
+
+        Parameters
+        ----------
+        context : RequestContext
+            Состояние обработки запроса
+
+        Raises
+        ------
+        ValueError
+            Во входном тензоре больше одной строки
+        """
+        log_msg = context.log_msg
+        # get INPUT
+        logger.verbose("%s get input tensor", log_msg)
+        input_tensor = pb_utils.get_input_tensor_by_name(context.request, "image_guid").as_numpy()
+        # one response row per request, a client batch [k, 1] with k > 1 would lose rows
+        if input_tensor.size != 1:
+            raise ValueError(f"image_guid must hold one photo per request, got shape {list(input_tensor.shape)}")
+        input_request = input_tensor.reshape(-1)[0]
+        logger.verbose("%s get request json", log_msg)
+        input_json = json.loads(input_request.decode())
+        context.img_guid = input_json["guid"]
+        if input_json.get("size"):
+            context.img_size = int(input_json["size"])
+        if input_json.get("trace"):
+            context.trace = RequestTrace(context.start_time_ns)
+        logger.verbose("%s img_guid: %s", log_msg, context.img_guid)
+
+        context.img_url = self.config["image_download"]["url"].format(
+            context.img_guid, self.config["image_download"]["token"]
+        )
+        logger.verbose("%s img_url: %s", log_msg, context.img_url)
+
+    def load_image(self, img_url, img_size, detector_slots, trace=False):
+        """Загрузка фото и предобработка для детектора.
+        Исполняется в пуле потоков, поэтому не пишет логи и метрики
+
+        Parameters
+        ----------
+        img_url : str
+            url загрузки фото
+        img_size : int
+            Ожидаемый размер фото в байтах или None
+        detector_slots : DetectorSlots
+            Слоты пакета детектора для каждой формы входа
+        trace : bool, optional
+            Замерять этапы загрузки для trace запроса, by default False
+
+        Returns
+        -------
+        tuple
+            загруженное фото utils.DocumentImage, (коэфф изменения размера полного фото,
+            (дельта ширины, дельта высоты)), время загрузки в нс, замеры этапов или None,
+            ключ кэша по хэшу содержимого или None, результат из кэша или None,
+            (индекс формы входа, индекс фото в пакете этой формы).
+            При попадании в кэш фото не декодируется: фото, коэфф изменения размера и индекс None
+
+        Raises
+        ------
+        ImageNotLoad
+            Ошибка загрузки изображения
+        """
+        detector_config = self.config["ru_driver_license_models"]["detector"]
+        timings = self.stage_latency.new_timings(trace)
+        image_load_start_ns = time.time_ns()
+        bytes_data = download_image_bytes(
+            img_url,
+            self.config["image_download"]["timeout_sec"],
+            self.http_pool,
+            expected_size=img_size,
+            max_size=self.config["image_download"].get("max_size_bytes", DEFAULT_MAX_IMAGE_SIZE),
+            timings=timings,
+        )
+        content_key = None
+        if self.cache_content_hash:
+            content_key = f"{self.cache_key_prefix}/sha256/{hashlib.sha256(bytes_data).hexdigest()}"
+            cached_result = self.result_cache.get(content_key)
+            if cached_result is not None:
+                return None, None, time.time_ns() - image_load_start_ns, timings, content_key, cached_result, None
+        # detector.reduced_decode (off by default) decodes a JPEG DCT-reduced for the detector;
+        # a front side document is then decoded a second time at full resolution for the crops:
+        # on a 12 MP JPEG about 86 ms + 141 ms against 141 ms for one full decode (resize to the
+        # detector input is ~6 ms either way). It only pays off when fewer than ~40% of photos
+        # need the full image (back sides, no document found)
+        document_image = decode_transpose(
+            bytes_data,
+            detector_img_size=max(map(max, self.detector_shapes)) if detector_config.get("reduced_decode", False) else None,
+            timings=timings,
+        )
+        image_load_time = time.time_ns() - image_load_start_ns
+        preprocess_start_ns = time.perf_counter_ns()
+        shape_index = select_input_shape(document_image.detection_img.shape, self.detector_shapes)
+        detector_batch, index = detector_slots.take(shape_index)
+        batch_index = (shape_index, index)
+        scale, (dw, dh) = preprocess_into(document_image.detection_img, detector_batch, index)
+        record_since(timings, "detection_preprocess", preprocess_start_ns)
+        # bboxes are scaled straight to the full resolution image
+        scale_pad = (scale / document_image.detection_scale, (dw, dh))
+
+        return document_image, scale_pad, image_load_time, timings, content_key, None, batch_index
+
+    def save_loaded_image(self, context, document_image, scale_pad, image_load_time, timings, content_key,
+                          cached_result, batch_index):
+        """Сохранение загруженного фото и сбор метрик загрузки
+
+        Parameters
+        ----------
+        context : RequestContext
+            Состояние обработки запроса
+        document_image : utils.DocumentImage
+            Загруженное фото
+        scale_pad : tuple
+            Коэфф изменения размера и паддинг фото для детектора
+        image_load_time : int
+            Время загрузки фото в нс
+        timings : dict
+            Замеры этапов загрузки в нс или None
+        content_key : str
+            Ключ кэша по хэшу содержимого или None
+        cached_result : str
+            Результат из кэша по хэшу содержимого или None
+        batch_index : tuple
+            Индекс формы входа детектора и индекс фото в тензоре пакета этой формы или None
+        """
+        self.metric_load_image_time.increment(image_load_time)
+        self.stage_latency.observe_all(timings)
+        context.image_load_time = image_load_time
+        if cached_result is not None:
+            # the next retry of this GUID is served without a download
+            self.result_cache.put(context.cache_keys, cached_result)
+            self.set_cached_response(context, cached_result, "content")
+            return
+        if content_key is not None:
+            context.cache_keys.append(content_key)
+        logger.verbose(
+            "%s image shape: %s; detection image shape: %s",
+            context.log_msg, document_image.shape, document_image.detection_img.shape,
+        )
+        context.document_image = document_image
+        context.batch_index = batch_index
+        context.scale_pad = scale_pad
+
+    def save_detection_result(self, context, detection_result):
+        """Сохранение результата детекции и сбор метрик детекции
+
+        Parameters
+        ----------
+        context : RequestContext
+            Состояние обработки запроса
+        detection_result : ResultDetection
+            Результат детекции
+        """
+        log_msg = context.log_msg
+        context.detection_result = detection_result
+        if len(detection_result.predictions) > 0:
+            min_detection_score = float(min(
+                [x.score for x in detection_result.predictions]
+            ))
+            logger.verbose("%s min detection score: %s", log_msg, min_detection_score)
+            self.metric_detection_min_score.set(min_detection_score)
+        else:
+            logger.verbose("%s detection is empty", log_msg)
+
+        logger.verbose("%s detection is correct: %s", log_msg, detection_result.is_correct)
+        if detection_result.is_correct:
+            context.recognition_result.is_driver_license_found = True
+            if detection_result.is_front_side:
+                context.recognition_result.side = DriverLicenseSide.FrontSide
+            else:
+                context.recognition_result.side = DriverLicenseSide.BackSide
+        else:
+            self.metric_detection_failur.increment(1)
+
+    def collect_recognition_metrics(self, context):
+        """Сбор метрик распознавания
+
+        Parameters
+        ----------
+        context : RequestContext
+            Состояние обработки запроса
+        """
+        if not context.recognition_result.is_driver_license_found:
+            return
+        not_recognize_list = []
+        min_word_score = 1
+        for recognize_res in context.recognition_result.fields_recognition_result:
+            if not recognize_res.is_ocr:
+                not_recognize_list.append(recognize_res.field_name)
+            elif recognize_res.field_text_score < min_word_score:
+                min_word_score = recognize_res.field_text_score
+        context.not_recognized_fields = not_recognize_list
+        self.metric_recognition_failur.increment(len(not_recognize_list))
+        self.metric_recognition_min_score.set(min_word_score)
+
+    def is_traced(self, contexts):
+        return any(x.trace is not None for x in contexts)
+
+    def trace_stage(self, contexts, stage, start_ns, durations=None, **details):
+        """Запись этапа во временные шкалы запросов с флагом trace
+
+        Parameters
+        ----------
+        contexts : list(RequestContext)
+            Запросы, участвовавшие в этапе
+        stage : str
+            Название этапа
+        start_ns : int
+            Начало этапа, time.perf_counter_ns()
+        durations : dict(str, int), optional
+            Длительности вложенных этапов в нс, by default None
+        **details
+            Дополнительные сведения этапа
+        """
+        end_ns = time.perf_counter_ns()
+        for context in contexts:
+            if context.trace is not None:
+                context.trace.add_stage(stage, start_ns, end_ns, durations, **details)
+
+    def json_response(self, context, result_json):
+        """Ответ на запрос из сериализованного результата, с временной шкалой обработки по флагу trace
+
+        Parameters
+        ----------
+        context : RequestContext
+            Состояние обработки запроса
+        result_json : str
+            Сериализованный ResultDriverLicenseRecognition
+
+        Returns
+        -------
+        pb_utils.InferenceResponse
+            Ответ на запрос
+        """
+        if context.trace is not None:
+            response_dict = json.loads(result_json)
+            response_dict["trace"] = context.trace.to_dict()
+            result_json = json.dumps(response_dict)
+        return pb_utils.InferenceResponse(
+            output_tensors=[
+                pb_utils.Tensor(
+                    "recognition_response",
+                    np.array([[result_json]], dtype=self.output_dtype),
                 )
-            except Exception as err:
-                trace_msg = "".join(traceback.format_exception(err))
-                err_msg = f'Exception: {log_msg} Error message: "{str(err)} {trace_msg}'
-                self.failed_requests_metric.increment(1)
-                pb_utils.Logger.log_error(err_msg)
-                inference_response = pb_utils.InferenceResponse(
-                    error=pb_utils.TritonError(f'{err_msg}', pb_utils.TritonError.INTERNAL)
+            ]
+        )
+
+    def coalesce_requests(self, contexts):
+        """Объединение запросов пакета с одинаковым GUID: фото загружается и распознается
+        только для первого запроса (ведущего), остальные получают его результат
+
+        Parameters
+        ----------
+        contexts : list(RequestContext)
+            Все запросы пакета
+
+        Returns
+        -------
+        tuple(list(RequestContext), list(RequestContext))
+            Запросы для обработки и запросы, ожидающие результат ведущего
+        """
+        leaders = {}
+        followers = []
+        for context in contexts:
+            if context.response is not None:
+                continue
+            leader = leaders.setdefault(context.img_guid, context)
+            if leader is not context:
+                context.leader = leader
+                followers.append(context)
+        if not followers:
+            return contexts, followers
+        return [x for x in contexts if x.leader is None], followers
+
+    def set_leader_response(self, context):
+        """Ответ на объединенный запрос по результату ведущего запроса того же GUID
+
+        Parameters
+        ----------
+        context : RequestContext
+            Состояние обработки объединенного запроса
+        """
+        leader = context.leader
+        self.metric_coalesced_requests.increment(1)
+        logger.verbose("%s coalesced with request_id: %s", context.log_msg, leader.request.request_id())
+        self.trace_stage([context], "coalesced", time.perf_counter_ns(), leader_request_id=leader.request.request_id())
+        context.image_load_time = leader.image_load_time
+        context.detection_result = leader.detection_result
+        context.recognition_result = leader.recognition_result
+        context.not_recognized_fields = leader.not_recognized_fields
+        context.cache_hit = leader.cache_hit
+        if leader.result_json is None:
+            context.error = leader.error
+            context.response = pb_utils.InferenceResponse(
+                error=pb_utils.TritonError(
+                    f"{context.log_msg} Error in coalesced request_id: {leader.request.request_id()}; {leader.error}",
+                    pb_utils.TritonError.INTERNAL,
                 )
-            responses.append(inference_response)
-        return responses
+            )
+        else:
+            context.response = self.json_response(context, leader.result_json)
+
+    def check_result_cache(self, context):
+        """Поиск результата в кэше по GUID фото, при попадании ответ формируется без загрузки фото
+
+        Parameters
+        ----------
+        context : RequestContext
+            Состояние обработки запроса
+        """
+        guid_key = f"{self.cache_key_prefix}/guid/{context.img_guid}"
+        context.cache_keys.append(guid_key)
+        cached_result = self.result_cache.get(guid_key)
+        if cached_result is not None:
+            self.set_cached_response(context, cached_result, "guid")
+        else:
+            self.metric_result_cache_miss.increment(1)
+
+    def set_cached_response(self, context, cached_result, cache_key_type):
+        """Формирование ответа из кэша результатов
+
+        Parameters
+        ----------
+        context : RequestContext
+            Состояние обработки запроса
+        cached_result : str
+            Сериализованный результат из кэша
+        cache_key_type : str
+            Тип ключа, по которому найден результат: guid или content
+        """
+        logger.verbose("%s result cache hit by %s", context.log_msg, cache_key_type)
+        self.metric_result_cache_hit.increment(1)
+        context.cache_hit = cache_key_type
+        context.result_json = cached_result
+        self.trace_stage([context], "result_cache", time.perf_counter_ns(), hit=cache_key_type)
+        context.response = self.json_response(context, cached_result)
+
+    def log_summary(self, context):
+        """Итоговая строка лога запроса
+
+        Parameters
+        ----------
+        context : RequestContext
+            Состояние обработки запроса
+        """
+        load_time_ms = context.image_load_time / 1e+6 if context.image_load_time is not None else -1
+        logger.info(
+            "%s guid: %s; status: %s; cache hit: %s; side: %s; angle: %s; not recognize fields: %s; "
+            "image load time: %.1f ms; total time: %.1f ms",
+            context.log_msg,
+            context.img_guid,
+            "ok" if context.error is None else type(context.error).__name__,
+            context.cache_hit,
+            context.recognition_result.side.value,
+            context.detection_result.angle if context.detection_result is not None else None,
+            context.not_recognized_fields,
+            load_time_ms,
+            (time.perf_counter_ns() - context.start_time_ns) / 1e+6,
+        )
+
+    def set_error_response(self, context, err):
+        """Формирование ответа с ошибкой
+
+        Parameters
+        ----------
+        context : RequestContext
+            Состояние обработки запроса
+        err : Exception
+            Ошибка обработки запроса
+        """
+        log_msg = context.log_msg
+        trace_msg = "".join(traceback.format_exception(err))
+        if isinstance(err, ImageNotLoad):
+            self.metric_load_image_failure.increment(1)
+            err_msg = f'{log_msg} Error loading image with guid {context.img_guid};'
+            logger.error('%s Trace %s', err_msg, trace_msg)
+        else:
+            err_msg = f'Exception: {log_msg} Error message: "{str(err)} {trace_msg}'
+            self.failed_requests_metric.increment(1)
+            logger.error(err_msg)
+        context.error = err
+        context.response = pb_utils.InferenceResponse(
+            error=pb_utils.TritonError(f'{err_msg}', pb_utils.TritonError.INTERNAL)
+        )
 
-    def fields_recognition(self, detection_result, log_msg=""):
+    async def detect_documents(self, contexts, detector_batch):
+        """Детекция документов на фото одной формы входа детектора одним запросом
+
+        Parameters
+        ----------
+        contexts : list(RequestContext)
+            Состояния обработки запросов, отсортированные по индексу фото в пакете
+        detector_batch : numpy.array
+            Тензор пакета детектора этой формы входа
+        """
+        detect_indexes = [x.batch_index[1] for x in contexts]
+        if detect_indexes[-1] == len(detect_indexes) - 1:
+            detector_batch = detector_batch[:len(detect_indexes)]
+        else:
+            # a slot was taken by an image that failed in preprocessing
+            detector_batch = detector_batch[detect_indexes]
+            self.tensor_bytes.observe("detection", "stub_copy", detector_batch.nbytes)
+        self.tensor_bytes.observe("detection", "input", detector_batch.nbytes)
+        detection_start_ns = time.perf_counter_ns()
+        detection_timings = self.stage_latency.new_timings(self.is_traced(contexts))
+        try:
+            detection_results = await detect.infer_model(
+                [x.document_image.shape for x in contexts],
+                detector_batch,
+                [x.scale_pad for x in contexts],
+                self.config["ru_driver_license_models"],
+                self.model_log,
+                detection_timings,
+            )
+        except Exception as err:
+            for context in contexts:
+                self.set_error_response(context, err)
+        else:
+            for context, detection_result in zip(contexts, detection_results):
+                self.save_detection_result(context, detection_result)
+        self.stage_latency.observe_all(detection_timings)
+        self.trace_stage(
+            contexts, "detection", detection_start_ns, detection_timings,
+            shape=list(detector_batch.shape), input_bytes=detector_batch.nbytes,
+        )
+
+    async def fields_recognition(self, contexts, timings=None, shapes=None, input_bytes=None):
+        """Распознавание полей пакета документов
+
+        Parameters
+        ----------
+        contexts : list(RequestContext)
+            Запросы с найденной лицевой стороной ВУ
+        timings : dict, optional
+            Словарь замеров этапов распознавания в нс, by default None
+        shapes : dict, optional
+            Словарь для форм пакетов фрагментов по ключу модели, by default None
+        input_bytes : dict, optional
+            Словарь для размеров пакетов фрагментов в байтах по ключу модели, by default None
+
+        Returns
+        -------
+        list(list(ResultFieldRecognition) or Exception)
+            Для каждого документа список результатов распознавания полей или ошибка распознавания
+        """
         recognized_fields = self.config["ru_driver_license_models"]["recognized_fields"]
-        result_dict = dict()
-        for field in recognized_fields.keys():
-            result_dict[field] = ResultFieldRecognition(field)
+        documents = []
+        documents_fields_detection = []
+        for context in contexts:
+            logger.verbose("%s infer recognition", context.log_msg)
+            fields_detection_result = [
+                x for x in context.detection_result.predictions if x.field_name in recognized_fields
+            ]
+            documents_fields_detection.append(fields_detection_result)
+            documents.append((
+                context.detection_result,
+                [(x.field_name, x.bbox) for x in fields_detection_result],
+                context.log_msg,
+            ))
 
-        for field_detection_result in detection_result.predictions:
-            if field_detection_result.field_name in recognized_fields:
+        # Все поля одной модели со всех документов распознаются одним запросом
+        text_recognition_results = await recognize.infer_models(
+            documents,
+            self.config["ru_driver_license_models"],
+            self.decoders,
+            self.validators,
+            self.crop_buffers,
+            timings,
+            shapes,
+            input_bytes,
+        )
+
+        results = []
+        for context, fields_detection_result, document_results in zip(
+            contexts, documents_fields_detection, text_recognition_results
+        ):
+            if isinstance(document_results, Exception):
+                results.append(document_results)
+                continue
+            result_dict = dict()
+            for field in recognized_fields.keys():
+                result_dict[field] = ResultFieldRecognition(field)
+            for field_detection_result in fields_detection_result:
                 field_name = field_detection_result.field_name
-                field_bbox = field_detection_result.bbox
-                text_recognition_result = recognize.infer_model(
-                    detection_result,
-                    field_name,
-                    field_bbox,
-                    self.config["ru_driver_license_models"],
-                    log_msg,
-                )
+                if field_name not in document_results:
+                    logger.verbose("%s field_name: %s; empty crop is not recognized", context.log_msg, field_name)
                 result_dict = self.save_field_recognition_result(
                     result_dict,
                     field_name,
                     field_detection_result,
-                    text_recognition_result,
+                    document_results.get(field_name),
                 )
-        return list(result_dict.values())
+            results.append(list(result_dict.values()))
+        return results
 
     def save_field_recognition_result(self, result_dict, field_name, field_detection_result, text_recognition_result):
         result_dict[field_name].is_detection = True
         result_dict[field_name].field_bbox = field_detection_result.bbox
         result_dict[field_name].field_detect_score = field_detection_result.score
 
-        if text_recognition_result.is_correct:
+        if text_recognition_result is not None and text_recognition_result.is_correct:
             result_dict[field_name].is_ocr = text_recognition_result.is_correct
             result_dict[field_name].field_text = text_recognition_result.predict_word
             result_dict[field_name].field_text_score = text_recognition_result.word_score
@@ -304,4 +922,6 @@ class TritonPythonModel:
         Implementing `finalize` function is OPTIONAL. This function allows
         the model to perform any necessary clean ups before exit.
         """
+        self.download_executor.shutdown(wait=False, cancel_futures=True)
+        self.http_pool.close()
         print("Cleaning up...")
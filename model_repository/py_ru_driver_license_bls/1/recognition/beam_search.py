@@ -0,0 +1,300 @@
+import numpy as np
+
+
+# Минимальная вероятность перед логарифмом
+MIN_PROBABILITY = 1e-30
+DIGITS = '0123456789'
+
+
+def parse_template(template):
+    """Разбор шаблона поля на множества допустимых символов по позициям.
+    `#` - любая цифра, `[...]` - множество символов (поддерживаются диапазоны `0-3`),
+    любой другой символ - сам символ
+
+    Parameters
+    ----------
+    template : str
+        Шаблон, например `[0-3]#.[01]#.####` для даты
+
+    Returns
+    -------
+    list(str)
+        Допустимые символы для каждой позиции
+
+    Raises
+    ------
+    ValueError
+        Незакрытая скобка в шаблоне
+    """
+
+    positions = []
+    index = 0
+    while index < len(template):
+        symbol = template[index]
+        if symbol == '#':
+            positions.append(DIGITS)
+        elif symbol == '[':
+            end = template.find(']', index)
+            if end < 0:
+                raise ValueError(f'Unclosed "[" in template: {template}')
+            group = template[index + 1:end]
+            symbols = ''
+            group_index = 0
+            while group_index < len(group):
+                if group_index + 2 < len(group) and group[group_index + 1] == '-':
+                    symbols += ''.join(chr(x) for x in range(ord(group[group_index]), ord(group[group_index + 2]) + 1))
+                    group_index += 3
+                else:
+                    symbols += group[group_index]
+                    group_index += 1
+            positions.append(symbols)
+            index = end
+        else:
+            positions.append(symbol)
+        index += 1
+
+    return positions
+
+
+class TemplateAutomaton:
+    def __init__(self, template, vocabulary):
+        """Линейный автомат шаблона поля: состояние - количество выведенных символов,
+        из состояния k допустимы переходы только по символам позиции k шаблона
+
+        Parameters
+        ----------
+        template : str
+            Шаблон поля (см parse_template)
+        vocabulary : list(str)
+            Словарь символов модели
+
+        Raises
+        ------
+        ValueError
+            Шаблон пустой, символа шаблона нет в словаре или шаблон слишком длинный для ключей префиксов
+        """
+        vocabulary = list(vocabulary)
+        positions = parse_template(template)
+        if not positions:
+            raise ValueError('Template is empty')
+        self.length = len(positions)
+        self.classes_count = len(vocabulary) + 1
+        if self.classes_count ** self.length >= 2 ** 62:
+            raise ValueError(f'Template is too long for vocabulary size: {template}')
+
+        max_allowed = max([len(x) for x in positions] + [1])
+        # Допустимые индексы символов по состоянию, -1 - нет перехода. Последнее состояние конечное
+        self.allowed = np.full((self.length + 1, max_allowed), -1, dtype=np.int64)
+        for position, symbols in enumerate(positions):
+            for symbol_index, symbol in enumerate(symbols):
+                if symbol not in vocabulary:
+                    raise ValueError(f'Symbol "{symbol}" of template {template} is not in vocabulary')
+                self.allowed[position, symbol_index] = vocabulary.index(symbol)
+
+
+def keep_best_beams(samples, scores, beam_width):
+    """Индексы лучших beam_width гипотез каждого фрагмента
+
+    Parameters
+    ----------
+    samples : numpy.array
+        Индекс фрагмента каждой гипотезы
+    scores : numpy.array
+        Логарифм вероятности гипотезы
+    beam_width : int
+        Ширина луча
+
+    Returns
+    -------
+    numpy.array
+        Индексы оставленных гипотез
+    """
+
+    order = np.lexsort((-scores, samples))
+    sorted_samples = samples[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_samples, sorted_samples)
+    order = order[(rank < beam_width) & (scores[order] > -np.inf)]
+
+    return order
+
+
+def beam_search(log_probs, automaton, beam_width):
+    """CTC prefix beam search, ограниченный автоматом шаблона.
+    Гипотезы всех фрагментов пакета обрабатываются одним массивом
+
+    Parameters
+    ----------
+    log_probs : numpy.array
+        Логарифмы вероятностей [B, T, C], последний класс - пустой символ CTC
+    automaton : TemplateAutomaton
+        Автомат шаблона
+    beam_width : int
+        Ширина луча
+
+    Returns
+    -------
+    numpy.array
+        Индексы символов лучшего полного префикса [B, L], строка -1 если полного префикса нет
+    """
+    batch_size, steps, classes_count = log_probs.shape
+    blank = classes_count - 1
+    length = automaton.length
+
+    # Гипотезы: фрагмент, ключ префикса, префикс, длина, последний символ, log p(blank), log p(не blank)
+    samples = np.arange(batch_size)
+    keys = np.zeros(batch_size, dtype=np.int64)
+    prefixes = np.full((batch_size, length), -1, dtype=np.int64)
+    lengths = np.zeros(batch_size, dtype=np.int64)
+    last = np.full(batch_size, -1, dtype=np.int64)
+    log_pb = np.zeros(batch_size)
+    log_pnb = np.full(batch_size, -np.inf)
+
+    for step in range(steps):
+        step_log_probs = log_probs[samples, step]
+        log_total = np.logaddexp(log_pb, log_pnb)
+
+        # Префикс не меняется: пустой символ или повтор последнего символа
+        stay_pb = log_total + step_log_probs[:, blank]
+        last_log_prob = np.take_along_axis(step_log_probs, np.maximum(last, 0)[:, None], axis=1)[:, 0]
+        stay_pnb = np.where(last >= 0, log_pnb + last_log_prob, -np.inf)
+
+        # Продление префикса допустимым по шаблону символом,
+        # повтор символа возможен только через пустой символ
+        allowed = automaton.allowed[lengths]
+        parents, columns = np.nonzero(allowed >= 0)
+        symbols = allowed[parents, columns]
+        symbol_log_probs = step_log_probs[parents, symbols]
+        extend_base = np.where(symbols == last[parents], log_pb[parents], log_total[parents])
+
+        child_prefixes = prefixes[parents]
+        child_prefixes[np.arange(len(parents)), lengths[parents]] = symbols
+
+        samples = np.concatenate([samples, samples[parents]])
+        keys = np.concatenate([keys, keys[parents] * classes_count + symbols + 1])
+        prefixes = np.concatenate([prefixes, child_prefixes])
+        lengths = np.concatenate([lengths, lengths[parents] + 1])
+        last = np.concatenate([last, symbols])
+        log_pb = np.concatenate([stay_pb, np.full(len(parents), -np.inf)])
+        log_pnb = np.concatenate([stay_pnb, extend_base + symbol_log_probs])
+
+        # Объединение одинаковых префиксов
+        order = np.lexsort((keys, samples))
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = (np.diff(samples[order]) != 0) | (np.diff(keys[order]) != 0)
+        group_starts = np.flatnonzero(is_first)
+        log_pb = np.logaddexp.reduceat(log_pb[order], group_starts)
+        log_pnb = np.logaddexp.reduceat(log_pnb[order], group_starts)
+        unique = order[group_starts]
+        samples, keys, prefixes, lengths, last = (
+            samples[unique], keys[unique], prefixes[unique], lengths[unique], last[unique]
+        )
+
+        # Префиксы, которые не успеют дойти до конца шаблона, не нужны
+        scores = np.where(length - lengths <= steps - 1 - step, np.logaddexp(log_pb, log_pnb), -np.inf)
+        best = keep_best_beams(samples, scores, beam_width)
+        samples, keys, prefixes, lengths, last, log_pb, log_pnb = (
+            samples[best], keys[best], prefixes[best], lengths[best], last[best], log_pb[best], log_pnb[best]
+        )
+
+    labels = np.full((batch_size, length), -1, dtype=np.int64)
+    scores = np.where(lengths == length, np.logaddexp(log_pb, log_pnb), -np.inf)
+    best = keep_best_beams(samples, scores, 1)
+    labels[samples[best]] = prefixes[best]
+
+    return labels
+
+
+def align_symbols(probabilities, labels, blank):
+    """Viterbi выравнивание меток по кадрам и скоры символов.
+    Скор символа - средняя вероятность символа на его кадрах, как при жадном декодировании
+
+    Parameters
+    ----------
+    probabilities : numpy.array
+        Вероятности [B, T, C]
+    labels : numpy.array
+        Индексы символов [B, L]
+    blank : int
+        Индекс пустого символа
+
+    Returns
+    -------
+    numpy.array
+        Скоры символов [B, L]
+    """
+    batch_size, steps = probabilities.shape[:2]
+    length = labels.shape[1]
+    log_probs = np.log(np.maximum(probabilities, MIN_PROBABILITY))
+
+    # Расширенная последовательность: blank, l1, blank, l2, ..., blank
+    states = np.full((batch_size, 2 * length + 1), blank, dtype=np.int64)
+    states[:, 1::2] = labels
+    states_count = states.shape[1]
+    can_skip = np.zeros((batch_size, states_count), dtype=bool)
+    can_skip[:, 3::2] = labels[:, 1:] != labels[:, :-1]
+
+    batch_indexes = np.arange(batch_size)[:, None]
+    alpha = np.full((batch_size, states_count), -np.inf)
+    alpha[:, :2] = log_probs[batch_indexes, 0, states[:, :2]]
+    backpointers = np.zeros((steps, batch_size, states_count), dtype=np.int64)
+    state_indexes = np.arange(states_count)
+    for step in range(1, steps):
+        stay = alpha
+        move = np.concatenate([np.full((batch_size, 1), -np.inf), alpha[:, :-1]], axis=1)
+        skip = np.concatenate([np.full((batch_size, 2), -np.inf), alpha[:, :-2]], axis=1)
+        skip = np.where(can_skip, skip, -np.inf)
+        candidates = np.stack([stay, move, skip])
+        choice = np.argmax(candidates, axis=0)
+        backpointers[step] = state_indexes - choice
+        alpha = np.take_along_axis(candidates, choice[None], axis=0)[0] + log_probs[batch_indexes, step, states]
+
+    # Путь заканчивается последним символом или пустым символом после него
+    state = np.where(alpha[:, -1] >= alpha[:, -2], states_count - 1, states_count - 2)
+    sums = np.zeros((batch_size, length))
+    counts = np.zeros((batch_size, length))
+    for step in range(steps - 1, -1, -1):
+        is_symbol = state % 2 == 1
+        symbol_positions = (state - 1) // 2
+        frame_probs = probabilities[np.arange(batch_size), step, states[np.arange(batch_size), state]]
+        np.add.at(sums, (np.flatnonzero(is_symbol), symbol_positions[is_symbol]), frame_probs[is_symbol])
+        np.add.at(counts, (np.flatnonzero(is_symbol), symbol_positions[is_symbol]), 1)
+        state = backpointers[step, np.arange(batch_size), state]
+
+    return sums / np.maximum(counts, 1)
+
+
+def decode_batch_constrained(predictions, vocabulary_lookup, automaton, beam_width):
+    """Декодирование пакета результатов модели с ограничением шаблоном поля
+
+    Parameters
+    ----------
+    predictions : numpy.array
+        Результаты модели распознования [B, T, C]
+    vocabulary_lookup : numpy.array
+        Массив символов словаря
+    automaton : TemplateAutomaton
+        Автомат шаблона
+    beam_width : int
+        Ширина луча
+
+    Returns
+    -------
+    list(tuple)
+        Для каждого фрагмента: текст, скоры символов, минимальный скор символов.
+        None, если подходящей под шаблон строки нет
+    """
+    log_probs = np.log(np.maximum(predictions, MIN_PROBABILITY))
+    labels = beam_search(log_probs, automaton, beam_width)
+
+    results = [None] * len(predictions)
+    found = np.flatnonzero(labels[:, 0] >= 0)
+    if len(found) == 0:
+        return results
+
+    symbol_scores = align_symbols(predictions[found], labels[found], predictions.shape[2] - 1)
+    for index, sample_labels, sample_scores in zip(found, labels[found], symbol_scores):
+        word_symbol_scores = sample_scores.tolist()
+        word_score = min(word_symbol_scores) if word_symbol_scores else 0.0
+        results[index] = (''.join(vocabulary_lookup[sample_labels]), word_symbol_scores, word_score)
+
+    return results
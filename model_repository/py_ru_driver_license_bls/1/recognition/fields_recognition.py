@@ -14,8 +14,8 @@ class ResultFieldRecognition:
         return {
             "field_name": self.field_name,
             "is_detection": self.is_detection,
-            "field_bbox": self.field_bbox,
-            "field_detect_score": self.field_detect_score,
+            "field_bbox": [int(x) for x in self.field_bbox],
+            "field_detect_score": float(self.field_detect_score),
             "is_ocr": self.is_ocr,
             "field_text": self.field_text,
             "field_text_score": self.field_text_score,
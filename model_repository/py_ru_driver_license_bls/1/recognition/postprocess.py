@@ -1,5 +1,8 @@
 import numpy as np
 
+from recognition.beam_search import TemplateAutomaton, decode_batch_constrained
+from recognition.validation import validate_batch
+
 
 class ResultRecognition:
     def __init__(self, predict_word, symbol_scores, word_score, is_correct):
@@ -31,97 +34,181 @@ class ResultRecognition:
         }
 
 
-def postprocess(prediction, vocabulary, threshold, validation):
-    """Постобработка результатов модели.
+def postprocess_batch(predictions, decoder, threshold, validations):
+    """Постобработка результатов модели для пакета фрагментов
 
     Parameters
     ----------
-    prediction : numpy.array
-        Результат модели
-    model : dict
-        Конфиг модели из конфига сервиса
-    validation : callable()
-        Функция валидации
+    predictions : numpy.array
+        Результат модели [B, T, C]
+    decoder : CTCDecoder
+        Декодер модели
+    threshold : float
+        Порог скора распознавания
+    validations : list(callable())
+        Функция валидации для каждого фрагмента (см validation.get_validators)
 
     Returns
     -------
-    ResultRecognition
-        Результат распознования поля паспорта
+    list(ResultRecognition)
+        Результаты распознавания фрагментов
     """
 
-    predict_word, symbol_scores, word_score = decode_predict_with_scores(prediction, vocabulary)
-    is_correct = check_recognition_correct(predict_word, word_score, threshold, validation)
-    result = ResultRecognition(predict_word=predict_word, symbol_scores=symbol_scores, 
-                               word_score=word_score, is_correct=is_correct)
-    return result
+    results = []
+    decoded, is_valid = decoder.decode_validated(predictions, validations)
+    for (predict_word, symbol_scores, word_score), is_valid_word in zip(decoded, is_valid):
+        is_correct = word_score > threshold and is_valid_word
+        results.append(ResultRecognition(predict_word=predict_word, symbol_scores=symbol_scores,
+                                         word_score=word_score, is_correct=is_correct))
+    return results
 
 
-def decode_predict_with_scores(prediction, vocabulary):
-    """Преобразование результатов детекции в текст
+def scatter_results(groups, models_results, documents_count):
+    """Раскладка результатов моделей распознавания по документам пакета
 
     Parameters
     ----------
-    prediction : numpy.array
-        Результаты модели распознования
-    vocabulary : list(str)
-        Словарь символов
+    groups : dict(str, list(tuple(int, str, list(int))))
+        Поля по ключу модели (см preprocess.group_fields_by_model)
+    models_results : list(list(ResultRecognition))
+        Результаты каждой модели в порядке groups, по одному на поле группы
+    documents_count : int
+        Количество документов пакета
 
     Returns
     -------
-    tuple
-        Текст, Скоры символов, Минимальный скор символов
+    list(dict(str, ResultRecognition))
+        Для каждого документа результаты распознавания по наименованию поля
     """
-    prediction = prediction[0]
-    # index and max score for each predicted character
-    predicted_symbols = np.argmax(prediction, axis=1)
-    predicted_scores = np.max(prediction, axis=1)
 
-    word_symbols = []
-    word_symbol_scores = []
+    results = [{} for _ in range(documents_count)]
+    for model_fields, model_results in zip(groups.values(), models_results):
+        for (document_index, field_name, _), result in zip(model_fields, model_results):
+            results[document_index][field_name] = result
+    return results
 
-    symbol_start_index = 0
-    for index in range(len(predicted_symbols)):
-        # is end of prediction or is end of repeating symbol
-        if index == len(prediction) - 1 or predicted_symbols[index] != predicted_symbols[index + 1]:
-            # is not blank
-            if predicted_symbols[index] != len(vocabulary):
-                symbol_scores = predicted_scores[symbol_start_index: index + 1]
-                symbol_mean_score = np.mean(symbol_scores).item()
-                word_symbol_scores.append(symbol_mean_score)
-                word_symbols.append(predicted_symbols[index])
-            symbol_start_index = index + 1
 
-    word = ''
-    for item in word_symbols:
-        word += vocabulary[item]
+def get_vocabulary_lookup(vocabulary):
+    """Массив символов словаря для декодирования индексов одной операцией
 
-    word_score = np.min(word_symbol_scores).item()
+    Parameters
+    ----------
+    vocabulary : list(str)
+        Словарь символов
 
-    return word, word_symbol_scores, word_score
+    Returns
+    -------
+    numpy.array
+        Символ по индексу, индекс len(vocabulary) - пустой символ CTC
+    """
 
+    return np.array(list(vocabulary))
 
 
-def check_recognition_correct(predict_word, word_score, threshold, validation):
-    """Проверка корректности распознавания с помощью порога
+def decode_batch_with_scores(predictions, vocabulary_lookup):
+    """Жадное CTC декодирование пакета результатов модели
 
     Parameters
     ----------
-    predict_word : str
-        Текст распознавания
-    word_score : float
-        Скор распознавания слова
-    threshold : float
-        Порог скора распознавания
-    validation : callable()
-        Фнкция валидации распознавания
+    predictions : numpy.array
+        Результаты модели распознования [B, T, C]
+    vocabulary_lookup : numpy.array
+        Массив символов словаря (см get_vocabulary_lookup)
 
     Returns
     -------
-    bool
-        Флаг корректности распознавания
+    list(tuple)
+        Для каждого фрагмента: текст, скоры символов, минимальный скор символов (0.0 для пустого текста)
     """
+    batch_size, steps = predictions.shape[:2]
+    # index and max score for each predicted character
+    predicted_symbols = np.argmax(predictions, axis=2).ravel()
+    predicted_scores = np.max(predictions, axis=2).ravel()
+
+    # end of repeating symbol or end of prediction
+    is_run_end = np.empty(len(predicted_symbols), dtype=bool)
+    is_run_end[:-1] = np.diff(predicted_symbols) != 0
+    is_run_end[steps - 1::steps] = True
+    run_ends = np.flatnonzero(is_run_end)
+    run_starts = np.empty_like(run_ends)
+    run_starts[:1] = 0
+    run_starts[1:] = run_ends[:-1] + 1
+
+    # skip blank
+    is_symbol = predicted_symbols[run_ends] != len(vocabulary_lookup)
+    run_starts, run_ends = run_starts[is_symbol], run_ends[is_symbol]
+    run_lengths = run_ends - run_starts + 1
+
+    # Среднее по серии считается np.mean по серии одной длины, порядок суммирования как у np.mean по срезу
+    symbol_scores = np.empty(len(run_ends), dtype=predicted_scores.dtype)
+    for run_length in np.unique(run_lengths):
+        is_length = run_lengths == run_length
+        runs_indexes = run_starts[is_length, None] + np.arange(run_length)
+        symbol_scores[is_length] = np.mean(predicted_scores[runs_indexes], axis=1)
+
+    word_symbols = vocabulary_lookup[predicted_symbols[run_ends]]
+    bounds = np.searchsorted(run_ends // steps, np.arange(batch_size + 1))
+
+    results = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        word_symbol_scores = symbol_scores[start:end].tolist()
+        word_score = min(word_symbol_scores) if word_symbol_scores else 0.0
+        results.append((''.join(word_symbols[start:end]), word_symbol_scores, word_score))
+
+    return results
+
+
+class CTCDecoder:
+    def __init__(self, vocabulary, decoding_config=None):
+        """Декодер результатов модели распознавания.
+        По умолчанию жадное декодирование, в режиме `beam` - beam search, ограниченный шаблоном поля,
+        для фрагментов с невалидным жадным текстом (см decode_validated)
 
-    is_correct = word_score > threshold
-    is_valid = validation(predict_word)
+        Parameters
+        ----------
+        vocabulary : list(str)
+            Словарь символов
+        decoding_config : dict, optional
+            Настройки декодирования модели: mode (greedy | beam), beam_width, template
+            (см beam_search.parse_template), by default None
+        """
+        decoding_config = decoding_config or {}
+        self.vocabulary_lookup = get_vocabulary_lookup(vocabulary)
+        self.automaton = None
+        self.beam_width = decoding_config.get('beam_width', 8)
+        if decoding_config.get('mode', 'greedy') == 'beam':
+            self.automaton = TemplateAutomaton(decoding_config['template'], vocabulary)
+
+    def decode_validated(self, predictions, validations):
+        """Декодирование пакета результатов модели с валидацией текстов.
+        Beam search, ограниченный шаблоном, запускается только для фрагментов,
+        жадный текст которых не прошел валидацию
 
-    return is_correct and is_valid
+        Parameters
+        ----------
+        predictions : numpy.array
+            Результаты модели распознования [B, T, C]
+        validations : list(callable())
+            Функция валидации для каждого фрагмента (см validation.get_validators)
+
+        Returns
+        -------
+        tuple
+            Для каждого фрагмента (текст, скоры символов, минимальный скор символов)
+            и флаг корректности текста
+        """
+        results = decode_batch_with_scores(predictions, self.vocabulary_lookup)
+        is_valid = validate_batch([predict_word for predict_word, _, _ in results], validations)
+        invalid_indexes = [index for index, is_valid_word in enumerate(is_valid) if not is_valid_word]
+        if self.automaton is None or not invalid_indexes:
+            return results, is_valid
+
+        # Если подходящей под шаблон строки нет, остается результат жадного декодирования
+        constrained_results = decode_batch_constrained(
+            predictions[invalid_indexes], self.vocabulary_lookup, self.automaton, self.beam_width
+        )
+        for index, constrained_result in zip(invalid_indexes, constrained_results):
+            if constrained_result is not None:
+                results[index] = constrained_result
+                is_valid[index] = validations[index](constrained_result[0])
+        return results, is_valid
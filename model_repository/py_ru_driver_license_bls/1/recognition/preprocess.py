@@ -1,25 +1,29 @@
 import cv2
 import numpy as np
-from utils import crop_img
+from utils import crop_rotated_img, get_crop_shape
 
 
-def resize_with_pad(img, img_size):
-    """Изменение размера фото для модели
+PAD_VALUE = np.float32(114 / 255.)
+NORM_DIVISOR = np.float32(255.)
+
+
+def get_resize_params(img_shape, img_size):
+    """Параметры letterbox фрагмента: размер после изменения и отступы паддинга
 
     Parameters
     ----------
-    img : numpy.array
-        Фото паспорта
-    img_size : int
-        Размер фото к которому нужно привести
+    img_shape : tuple
+        Форма фрагмента
+    img_size : tuple(int, int)
+        Высота и ширина входа модели
 
     Returns
     -------
-    numpy.array
-        Фото нужного размера
+    tuple
+        (ширина, высота) после изменения размера, (отступ слева, отступ сверху)
     """
 
-    img_height, img_width = img.shape[:2]
+    img_height, img_width = img_shape[:2]
     new_img_height, new_img_width = img_size
 
     if new_img_width / img_width < new_img_height / img_height:
@@ -31,52 +35,164 @@ def resize_with_pad(img, img_size):
         resized_height = new_img_height
         resized_width = int(img_width * scale)
 
-    img = cv2.resize(img, (resized_width, resized_height))
+    return (resized_width, resized_height), ((new_img_width - resized_width) // 2, (new_img_height - resized_height) // 2)
+
+
+def letterbox_gray_into(gray, out, img_size):
+    """Изменение размера серого фрагмента с паддингом и нормализацией с записью в тензор.
+    Размер меняется на uint8, деление на 255 в float32
+
+    Parameters
+    ----------
+    gray : numpy.array
+        Серый фрагмент [H, W] uint8
+    out : numpy.array
+        Тензор [height, width] float32 для записи, может быть транспонированным представлением
+    img_size : tuple(int, int)
+        Высота и ширина входа модели
+    """
+
+    (resized_width, resized_height), (pad_width, pad_height) = get_resize_params(gray.shape, img_size)
+    resized = cv2.resize(gray, (resized_width, resized_height))
 
-    delta_width = new_img_width - resized_width
-    delta_height = new_img_height - resized_height
-    pad_width = delta_width // 2
-    pad_height = delta_height // 2
+    bottom = pad_height + resized_height
+    right = pad_width + resized_width
+    out[:pad_height] = PAD_VALUE
+    out[bottom:] = PAD_VALUE
+    out[pad_height:bottom, :pad_width] = PAD_VALUE
+    out[pad_height:bottom, right:] = PAD_VALUE
+    np.divide(resized, NORM_DIVISOR, out=out[pad_height:bottom, pad_width:right], casting='unsafe')
 
-    img = img.astype(np.float32)
-    img /= 255.
-    img = np.pad(img, [(pad_height, delta_height - pad_height), (pad_width, delta_width - pad_width)],
-                 mode='constant', constant_values=(114 / 255., 114 / 255.))
 
-    return img
+class CropBatchBuffer:
+    def __init__(self, img_size):
+        """Переиспользуемый тензор под пакет фрагментов одной модели распознавания.
+        Память выделяется заново только при росте размера пакета
 
+        Parameters
+        ----------
+        img_size : tuple(int, int)
+            Высота и ширина входа модели
+        """
+        self.img_size = img_size
+        self._buffer = np.empty((0, img_size[1], img_size[0], 1), dtype=np.float32)
 
-def preprocessing_img(img_readed, img_size):
-    """Предобработка фото, изменение размера и типа данных, паддинг и транспонирование
+    def get(self, batch_size):
+        """Тензор numpy([N, W, H, 1]) под пакет фрагментов
+
+        Parameters
+        ----------
+        batch_size : int
+            Количество фрагментов в пакете
+
+        Returns
+        -------
+        numpy.array
+            Непрерывный тензор пакета, значения не инициализированы
+        """
+        if len(self._buffer) < batch_size:
+            self._buffer = np.empty((batch_size, self.img_size[1], self.img_size[0], 1), dtype=np.float32)
+        return self._buffer[:batch_size]
+
+
+def to_gray(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def is_valid_crop(img_shape, bbox, angle, img_size):
+    """Проверка, что фрагмент поля не пустой и не вырождается в ноль пикселей при изменении размера
 
     Parameters
     ----------
-    img : numpy.array
-        Фото паспорта
-    image_height : int
-        Требуемая высота изоюражени
-    image_width : int
-        Требуемая ширина изображения
-        
+    img_shape : tuple
+        Высота и ширина фото документа до поворота
+    bbox : list(int)
+        Координаты рамки поля на повернутом фото
+    angle : int
+        Угол поворота документа
+    img_size : tuple(int, int)
+        Высота и ширина входа модели
+
+    Returns
+    -------
+    bool
+        Флаг корректности фрагмента
+    """
+
+    crop_shape = get_crop_shape(img_shape, bbox, angle)
+    if min(crop_shape) == 0:
+        return False
+    (resized_width, resized_height), _ = get_resize_params(crop_shape, img_size)
+
+    return resized_width > 0 and resized_height > 0
+
+
+def group_fields_by_model(documents_fields, config, documents_shapes=None):
+    """Группировка распознаваемых полей всех документов пакета по моделям распознавания
+
+    Parameters
+    ----------
+    documents_fields : list(list(tuple(str, list(int))))
+        Для каждого документа список пар (наименование поля, координаты рамки поля)
+    config : dict
+        Конфиг сервиса
+    documents_shapes : list(tuple(tuple, int)), optional
+        Для каждого документа форма фото до поворота и угол поворота, поля с пустым или вырожденным
+        фрагментом не попадают в группы (см is_valid_crop), by default None - без проверки
+
+    Returns
+    -------
+    dict(str, list(tuple(int, str, list(int))))
+        Словарь: ключ модели из конфига -> список (индекс документа, наименование поля, координаты рамки)
+    """
+
+    groups = {}
+    for document_index, fields_bboxes in enumerate(documents_fields):
+        for field_name, field_bbox in fields_bboxes:
+            model_name = config['recognized_fields'][field_name]
+            if documents_shapes is not None:
+                img_shape, angle = documents_shapes[document_index]
+                img_size = (config[model_name]['image_height'], config[model_name]['image_width'])
+                if not is_valid_crop(img_shape, field_bbox, angle, img_size):
+                    continue
+            groups.setdefault(model_name, []).append((document_index, field_name, field_bbox))
+
+    return groups
+
+
+def preprocess_batch(crops, buffer, errors=None):
+    """Предобработка пакета фрагментов полей одной модели с записью в тензор пакета:
+    фрагмент переводится в серый до поворота (перевод попиксельный, поэтому результат совпадает
+    с переводом повернутого фрагмента, а поворачивается один канал), letterbox и нормализация,
+    транспонирование в [W, H]
+
+    Parameters
+    ----------
+    crops : list(tuple(numpy.array, list(int), int))
+        Для каждого фрагмента: фото документа до поворота, координаты рамки поля на повернутом фото
+        и угол поворота документа
+    buffer : CropBatchBuffer
+        Тензор пакета модели
+    errors : dict, optional
+        Словарь для ошибок предобработки по индексу фрагмента: слот такого фрагмента заполняется
+        паддингом и остается в пакете, by default None - ошибка пробрасывается
+
     Returns
     -------
     numpy.array
-        Предобработанное фото
+        Непрерывный тензор пакета [N, W, H, 1]
     """
 
-    # to gray scale
-    gray = cv2.cvtColor(img_readed, cv2.COLOR_BGR2GRAY)
-    # resize & preprocessing
-    img_resized = resize_with_pad(gray, img_size)
-    # add dimension
-    img = np.expand_dims(img_resized, -1)
-    img = np.expand_dims(img, 0)
-    # transpose
-    img = np.transpose(img, (0, 2, 1, 3))
-
-    return img
-
-    
-def preprocess(img, bbox, img_size):
-    img = crop_img(img, bbox)
-    return preprocessing_img(img, img_size)
\ No newline at end of file
+    batch_tensor = buffer.get(len(crops))
+    for index, (img, bbox, angle) in enumerate(crops):
+        try:
+            gray = crop_rotated_img(img, bbox, angle, convert=to_gray)
+            # [W, H] слот пакета, запись через транспонированное представление [H, W]
+            letterbox_gray_into(gray, batch_tensor[index, :, :, 0].T, buffer.img_size)
+        except Exception as err:
+            if errors is None:
+                raise
+            batch_tensor[index] = PAD_VALUE
+            errors[index] = err
+
+    return batch_tensor
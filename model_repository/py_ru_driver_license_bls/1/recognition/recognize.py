@@ -1,60 +1,195 @@
+import asyncio
+import time
+
 import triton_python_backend_utils as pb_utils
 
-from recognition.postprocess import postprocess
-from recognition.preprocess import preprocess
-from recognition.validation import validation_recognition
+from log import logger
+from metrics import record_since
+from recognition.postprocess import CTCDecoder, postprocess_batch, scatter_results
+from recognition.preprocess import CropBatchBuffer, group_fields_by_model, preprocess_batch
+
+
+def get_decoders(config):
+    """Декодеры всех моделей распознавания, создаются один раз при загрузке модели
+
+    Parameters
+    ----------
+    config : dict
+        Конфиг сервиса
+
+    Returns
+    -------
+    dict(str, CTCDecoder)
+        Декодер по ключу модели из конфига
+    """
+
+    return {
+        model_name: CTCDecoder(config[model_name]['vocabulary'], config[model_name].get('decoding'))
+        for model_name in set(config['recognized_fields'].values())
+    }
+
+
+def get_crop_buffers(config):
+    """Переиспользуемые тензоры пакетов фрагментов всех моделей распознавания,
+    создаются один раз при загрузке модели
+
+    Parameters
+    ----------
+    config : dict
+        Конфиг сервиса
+
+    Returns
+    -------
+    dict(str, CropBatchBuffer)
+        Тензор пакета по ключу модели из конфига
+    """
+
+    return {
+        model_name: CropBatchBuffer((config[model_name]['image_height'], config[model_name]['image_width']))
+        for model_name in set(config['recognized_fields'].values())
+    }
 
 
-def infer_model(detection_result, field_name, field_bbox, config, log_msg=''):
-    """Исполнение моделей детекции
+async def infer_model(model_name, crops_tensor, log_msg='', timings=None, stage=None):
+    """Асинхронное исполнение модели распознавания на пакете фрагментов
 
     Parameters
     ----------
-    detection_result : _type_
-        Результат детекции
-    field_name : _type_
-        Наименование поля
-    field_bbox : _type_
-        Координаты рамки поля
-    config : _type_
-        Конфик сервиса
+    model_name : str
+        Имя модели в Triton
+    crops_tensor : numpy.array
+        Пакет предобработанных фрагментов [N, W, H, 1]
     log_msg : str, optional
         Шаблон строки лога, by default ''
+    timings : dict, optional
+        Словарь замеров этапов в нс, by default None
+    stage : str, optional
+        Название этапа исполнения модели в timings, by default None
 
     Returns
     -------
-    ResultRecognition
-        Результат распознавания поля
+    numpy.array
+        Результат модели [N, T, C]
 
     Raises
     ------
     pb_utils.TritonModelException
         Ошибка исполнения модели распознавания
     """
-    log_msg = f'{log_msg} module: recognition; field_name: {field_name};'
-    model_name = config['recognized_fields'][field_name]
-    model = config[model_name]
-    # Определяем какой функцией будем валидировать результат распознавания
-    pb_utils.Logger.log_info(f'{log_msg} get validation func')
-    validation = validation_recognition(field_name)
-    pb_utils.Logger.log_info(f'{log_msg} preprocess')
-    crop_tensor = preprocess(detection_result.img,
-                             field_bbox, (model['image_height'], model['image_width']))
-
     text_recognition_request = pb_utils.InferenceRequest(
-        model_name=model['model_name'],
+        model_name=model_name,
         requested_output_names=["output"],
-        inputs=[pb_utils.Tensor("input", crop_tensor)],
+        inputs=[pb_utils.Tensor("input", crops_tensor)],
     )
-    pb_utils.Logger.log_info(f'{log_msg} send request to model {model_name}')
-    text_recognition_response = text_recognition_request.exec()
+    logger.verbose('%s send request to model %s; batch size: %d', log_msg, model_name, len(crops_tensor))
+    start_ns = time.perf_counter_ns() if timings is not None else 0
+    text_recognition_response = await text_recognition_request.async_exec()
     if text_recognition_response.has_error():
         raise pb_utils.TritonModelException(
             text_recognition_response.error().message())
+    record_since(timings, stage, start_ns)
 
-    prediction = pb_utils.get_output_tensor_by_name(
+    return pb_utils.get_output_tensor_by_name(
         text_recognition_response, 'output').as_numpy()
-    pb_utils.Logger.log_info(f'{log_msg} postprocess')
-    result = postprocess(prediction, model['vocabulary'], model['threshold'], validation)
-    pb_utils.Logger.log_info(f'{log_msg} result: text: {result.predict_word} correct: {result.is_correct} min_score: {result.word_score}')
-    return result
+
+
+async def infer_models(documents, config, decoders, validators, crop_buffers, timings=None, shapes=None,
+                       input_bytes=None):
+    """Распознавание полей пакета документов.
+    Фрагменты всех полей одной модели со всех документов отправляются в модель одним запросом,
+    запросы к разным моделям исполняются одновременно
+
+    Parameters
+    ----------
+    documents : list(tuple(ResultDetection, list(tuple(str, list(int))), str))
+        Для каждого документа: результат детекции, список пар (наименование поля, координаты рамки поля)
+        и шаблон строки лога
+    config : dict
+        Конфиг сервиса
+    decoders : dict(str, CTCDecoder)
+        Декодеры по ключу модели (см get_decoders)
+    validators : dict(str, callable())
+        Функции валидации по наименованию поля (см validation.get_validators)
+    crop_buffers : dict(str, CropBatchBuffer)
+        Тензоры пакетов фрагментов по ключу модели (см get_crop_buffers)
+    timings : dict, optional
+        Словарь замеров этапов <ключ модели>_preprocess, _infer и _decode в нс, by default None
+    shapes : dict, optional
+        Словарь для форм пакетов фрагментов по ключу модели, by default None
+    input_bytes : dict, optional
+        Словарь для размеров пакетов фрагментов в байтах по ключу модели, by default None
+
+    Returns
+    -------
+    list(dict(str, ResultRecognition) or Exception)
+        Для каждого документа результаты распознавания по наименованию поля или ошибка.
+        Поля с пустым или вырожденным фрагментом не распознаются и в результат не попадают.
+        Ошибка предобработки фрагмента относится только к его документу, ошибка модели -
+        к документам с фрагментами в ее запросе
+    """
+    groups = group_fields_by_model(
+        [fields_bboxes for _, fields_bboxes, _ in documents],
+        config,
+        [(detection_result.img.shape, detection_result.angle) for detection_result, _, _ in documents],
+    )
+    documents_errors = {}
+
+    crops_tensors = {}
+    for model_name, model_fields in groups.items():
+        start_ns = time.perf_counter_ns() if timings is not None else 0
+        # Фрагменты переводятся в серый до поворота и пишутся сразу в непрерывный тензор пакета,
+        # Triton получает его без копии
+        crops_errors = {}
+        crops_tensors[model_name] = preprocess_batch(
+            [(documents[document_index][0].img, field_bbox, documents[document_index][0].angle)
+             for document_index, _, field_bbox in model_fields],
+            crop_buffers[model_name],
+            crops_errors,
+        )
+        for index, err in crops_errors.items():
+            documents_errors.setdefault(model_fields[index][0], err)
+        record_since(timings, f'{model_name}_preprocess', start_ns)
+        if shapes is not None:
+            shapes[model_name] = list(crops_tensors[model_name].shape)
+        if input_bytes is not None:
+            input_bytes[model_name] = crops_tensors[model_name].nbytes
+
+    # Запросы ко всем моделям отправляются сразу, ожидаем самый долгий
+    predictions = await asyncio.gather(
+        *[infer_model(config[model_name]['model_name'], crops_tensors[model_name], 'module: recognition;',
+                      timings, f'{model_name}_infer')
+          for model_name in groups],
+        return_exceptions=True,
+    )
+
+    models_results = []
+    for (model_name, model_fields), prediction in zip(groups.items(), predictions):
+        model_results = []
+        if not isinstance(prediction, Exception):
+            # Определяем какой функцией будем валидировать результат распознавания
+            validations = [validators[field_name] for _, field_name, _ in model_fields]
+            # Все фрагменты модели декодируются одним вызовом
+            start_ns = time.perf_counter_ns() if timings is not None else 0
+            try:
+                model_results = postprocess_batch(
+                    prediction, decoders[model_name], config[model_name]['threshold'], validations
+                )
+            except Exception as err:
+                prediction = err
+            record_since(timings, f'{model_name}_decode', start_ns)
+        if isinstance(prediction, Exception):
+            for document_index, _, _ in model_fields:
+                documents_errors.setdefault(document_index, prediction)
+        models_results.append(model_results)
+
+    results = scatter_results(groups, models_results, len(documents))
+    for document_index, err in documents_errors.items():
+        results[document_index] = err
+    for (_, _, log_msg), document_results in zip(documents, results):
+        if isinstance(document_results, Exception):
+            continue
+        for field_name, result in document_results.items():
+            logger.verbose('%s module: recognition; field_name: %s; result: text: %s correct: %s min_score: %s',
+                           log_msg, field_name, result.predict_word, result.is_correct, result.word_score)
+
+    return results
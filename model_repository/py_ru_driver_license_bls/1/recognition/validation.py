@@ -1,51 +1,31 @@
+import calendar
 import re
-from datetime import datetime
 
 from driver_license_classes import DriverLicenseClass
 
 
-def validation_recognition(class_name):
-    """Выбор функции валидации
-
-    Parameters
-    ----------
-    field_name : str
-        НАименования распознаваемого поля
-
-    Returns
-    -------
-    callable()
-        Фнкция проверки результата распознавания
-    """
-
-    if class_name in [DriverLicenseClass.datein.name, DriverLicenseClass.dateout.name,
-                      DriverLicenseClass.birthday.name]:
-        return date_validation
-
-    if class_name == DriverLicenseClass.front_serial.name:
-        return serial_validation
-
-    if class_name in [DriverLicenseClass.surname.name, DriverLicenseClass.name.name,
-                      DriverLicenseClass.middle_name.name]:
-        return fio_validation
+SERIAL_PATTERN = re.compile(r'([0-9]{2}\s{1}[0-9]{2}\s{1}[0-9]{6})')
+# Те же варианты дня, месяца и года, что принимает datetime.strptime для формата '%d.%m.%Y'
+DATE_PATTERN = re.compile(r'(3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])\.(1[0-2]|0[1-9]|[1-9])\.(\d\d\d\d)')
+DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
 
 
 def fio_validation(predict_word):
-    """Валидация ФИО 
+    """Валидация ФИО
     """
 
     return True
 
 
-def serial_validation(predict_word, pattern=r'([0-9]{2}\s{1}[0-9]{2}\s{1}[0-9]{6})'):
+def serial_validation(predict_word, pattern=SERIAL_PATTERN):
     """Валидация серии и номера ВУ
 
     Parameters
     ----------
     predict_word : str
         Предсказанный текст
-    pattern : regexp, optional
-        Шаблон серии и номера ВУ, by default r'([0-9]{2}\s{1}[0-9]{2}\s{1}[0-9]{6})'
+    pattern : re.Pattern, optional
+        Скомпилированный шаблон серии и номера ВУ, by default SERIAL_PATTERN
 
     Returns
     -------
@@ -53,21 +33,19 @@ def serial_validation(predict_word, pattern=r'([0-9]{2}\s{1}[0-9]{2}\s{1}[0-9]{6
         Флаг совпадения шаблоны
     """
 
-    match = re.fullmatch(pattern, predict_word)
-    valid = match is not None
-
-    return valid
+    return pattern.fullmatch(predict_word) is not None
 
 
-def date_validation(date, date_format='%d.%m.%Y'):
-    """Валидация даты
+def date_validation(date, pattern=DATE_PATTERN):
+    """Валидация даты в формате '%d.%m.%Y' без исключений:
+    проверка структуры шаблоном и проверка дня по календарю
 
     Parameters
     ----------
     date : str
         Распознанный текст даты
-    date_format : str, optional
-        Шаблон формата даты, by default '%d.%m.%Y'
+    pattern : re.Pattern, optional
+        Скомпилированный шаблон даты (день, месяц, год), by default DATE_PATTERN
 
     Returns
     -------
@@ -75,9 +53,90 @@ def date_validation(date, date_format='%d.%m.%Y'):
         Флаг корректности
     """
 
-    try:
-        valid = bool(datetime.strptime(date, date_format))
-    except ValueError:
-        valid = False
+    match = pattern.fullmatch(date)
+    if match is None:
+        return False
+
+    day, month, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+    if year < 1:
+        return False
+    days_in_month = 29 if month == 2 and calendar.isleap(year) else DAYS_IN_MONTH[month]
+
+    return day <= days_in_month
+
+
+# Функция валидации по наименованию поля
+FIELD_VALIDATIONS = {
+    DriverLicenseClass.datein.name: date_validation,
+    DriverLicenseClass.dateout.name: date_validation,
+    DriverLicenseClass.birthday.name: date_validation,
+    DriverLicenseClass.front_serial.name: serial_validation,
+    DriverLicenseClass.surname.name: fio_validation,
+    DriverLicenseClass.name.name: fio_validation,
+    DriverLicenseClass.middle_name.name: fio_validation,
+}
+
+
+def validation_recognition(class_name):
+    """Выбор функции валидации
+
+    Parameters
+    ----------
+    field_name : str
+        НАименования распознаваемого поля
+
+    Returns
+    -------
+    callable()
+        Фнкция проверки результата распознавания
+    """
+
+    return FIELD_VALIDATIONS.get(class_name)
+
+
+def get_validators(recognized_fields):
+    """Реестр функций валидации распознаваемых полей, создается один раз при загрузке модели
+
+    Parameters
+    ----------
+    recognized_fields : dict(str, str)
+        Распознаваемые поля из конфига сервиса: наименование поля -> ключ модели
+
+    Returns
+    -------
+    dict(str, callable())
+        Функция валидации по наименованию поля
+
+    Raises
+    ------
+    ValueError
+        Для поля нет функции валидации
+    """
+
+    validators = {}
+    for field_name in recognized_fields:
+        validation = validation_recognition(field_name)
+        if validation is None:
+            raise ValueError(f'No validation for recognized field: {field_name}')
+        validators[field_name] = validation
+
+    return validators
+
+
+def validate_batch(words, validations):
+    """Валидация пакета распознанных текстов
+
+    Parameters
+    ----------
+    words : list(str)
+        Распознанные тексты
+    validations : list(callable())
+        Функция валидации для каждого текста (см get_validators)
+
+    Returns
+    -------
+    list(bool)
+        Флаг корректности каждого текста
+    """
 
-    return valid
\ No newline at end of file
+    return [validation(word) for word, validation in zip(words, validations)]
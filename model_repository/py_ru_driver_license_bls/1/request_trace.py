@@ -0,0 +1,60 @@
+import time
+
+
+def ns_to_ms(duration_ns):
+    return round(duration_ns / 1e+6, 3)
+
+
+class RequestTrace:
+    def __init__(self, start_ns):
+        """Временная шкала обработки одного запроса, возвращается клиенту в ответе по флагу trace запроса.
+        Этапы пакета общие для всех запросов пакета, смещения этапов считаются от начала обработки запроса
+
+        Parameters
+        ----------
+        start_ns : int
+            Начало обработки запроса, time.perf_counter_ns()
+        """
+        self.start_ns = start_ns
+        self.stages = []
+
+    def add_stage(self, stage, start_ns, end_ns=None, durations=None, **details):
+        """Добавление этапа обработки
+
+        Parameters
+        ----------
+        stage : str
+            Название этапа
+        start_ns : int
+            Начало этапа, time.perf_counter_ns()
+        end_ns : int, optional
+            Окончание этапа, by default текущее время
+        durations : dict(str, int), optional
+            Длительности вложенных этапов и запросов к моделям Triton в нс, by default None
+        **details
+            Дополнительные сведения этапа, например формы тензоров
+        """
+        if end_ns is None:
+            end_ns = time.perf_counter_ns()
+        stage_dict = {
+            "stage": stage,
+            "start_ms": ns_to_ms(start_ns - self.start_ns),
+            "end_ms": ns_to_ms(end_ns - self.start_ns),
+        }
+        if durations:
+            stage_dict["durations_ms"] = {name: ns_to_ms(value) for name, value in durations.items()}
+        stage_dict.update(details)
+        self.stages.append(stage_dict)
+
+    def to_dict(self):
+        """Сереализация временной шкалы в словарь для отправки в json
+
+        Returns
+        -------
+        dict
+            Общее время обработки в мс на момент сериализации и список этапов
+        """
+        return {
+            "total_ms": ns_to_ms(time.perf_counter_ns() - self.start_ns),
+            "stages": self.stages,
+        }
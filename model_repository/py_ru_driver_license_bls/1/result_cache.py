@@ -0,0 +1,225 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class FileCacheBackend:
+    def __init__(self, directory, ttl_sec, max_files=10000, prune_interval=256):
+        """Общее хранилище результатов в каталоге, через него кэш делят несколько экземпляров модели.
+        Каталог в /dev/shm хранит результаты в разделяемой памяти.
+        Каждая запись - отдельный файл, срок жизни считается от времени изменения файла
+
+        Parameters
+        ----------
+        directory : str
+            Каталог хранилища
+        ttl_sec : float
+            Срок жизни записи в секундах
+        max_files : int, optional
+            Максимальное количество записей, by default 10000
+        prune_interval : int, optional
+            Через сколько записей удалять устаревшие и лишние файлы, by default 256
+        """
+        self.directory = directory
+        self.ttl_sec = ttl_sec
+        self.max_files = max_files
+        self.prune_interval = prune_interval
+        self._puts = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+    def get(self, key):
+        """Чтение записи
+
+        Parameters
+        ----------
+        key : str
+            Ключ записи
+
+        Returns
+        -------
+        tuple(str, float)
+            Значение и оставшийся срок жизни в секундах или None, если записи нет или она устарела
+        """
+        path = self._path(key)
+        try:
+            remaining_sec = os.stat(path).st_mtime + self.ttl_sec - time.time()
+            if remaining_sec <= 0:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as cache_f:
+                return cache_f.read(), remaining_sec
+        except OSError:
+            return None
+
+    def put(self, key, value):
+        """Запись значения: файл пишется во временный и атомарно переименовывается
+
+        Parameters
+        ----------
+        key : str
+            Ключ записи
+        value : str
+            Значение
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as cache_f:
+                cache_f.write(value)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        self._puts += 1
+        if self._puts % self.prune_interval == 0:
+            self.prune()
+
+    def prune(self):
+        """Удаление устаревших записей и самых старых записей сверх max_files"""
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+                if mtime + self.ttl_sec <= now:
+                    os.remove(entry.path)
+                else:
+                    entries.append((mtime, entry.path))
+            except OSError:
+                continue
+
+        entries.sort()
+        for _, path in entries[:max(len(entries) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+
+class ResultCache:
+    def __init__(self, max_entries=1024, max_bytes=64 << 20, ttl_sec=600, backend=None):
+        """Кэш сериализованных результатов распознавания с вытеснением LRU, сроком жизни записи
+        и ограничением количества записей и суммарного размера.
+        Потокобезопасный: по хэшу содержимого проверяется из пула загрузки
+
+        Parameters
+        ----------
+        max_entries : int, optional
+            Максимальное количество записей, by default 1024
+        max_bytes : int, optional
+            Максимальный суммарный размер значений в байтах, by default 64 MiB
+        ttl_sec : float, optional
+            Срок жизни записи в секундах, by default 600
+        backend : FileCacheBackend, optional
+            Общее хранилище, проверяется при промахе локального кэша, by default None
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self.backend = backend
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Чтение значения, найденная запись становится самой свежей для LRU
+
+        Parameters
+        ----------
+        key : str
+            Ключ записи
+
+        Returns
+        -------
+        str
+            Значение или None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return value
+                self._remove(key)
+
+        if self.backend is None:
+            return None
+        backend_entry = self.backend.get(key)
+        if backend_entry is None:
+            return None
+        value, remaining_sec = backend_entry
+        with self._lock:
+            self._insert(key, value, remaining_sec)
+        return value
+
+    def put(self, keys, value):
+        """Запись одного значения под несколькими ключами
+
+        Parameters
+        ----------
+        keys : list(str)
+            Ключи записи, например GUID фото и хэш содержимого
+        value : str
+            Значение, json строка (ASCII, размер в символах равен размеру в байтах)
+        """
+        with self._lock:
+            for key in keys:
+                self._insert(key, value, self.ttl_sec)
+        if self.backend is not None:
+            for key in keys:
+                self.backend.put(key, value)
+
+    def _insert(self, key, value, ttl_sec):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl_sec, value)
+        self.size_bytes += len(value)
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self.size_bytes -= len(value)
+
+
+def get_result_cache(cache_config):
+    """Кэш результатов по конфигу сервиса
+
+    Parameters
+    ----------
+    cache_config : dict
+        Раздел result_cache конфига сервиса
+
+    Returns
+    -------
+    ResultCache
+        Кэш результатов или None, если кэш выключен
+    """
+    if not cache_config.get('enabled', False):
+        return None
+
+    ttl_sec = cache_config.get('ttl_sec', 600)
+    backend = None
+    if cache_config.get('shared_dir'):
+        backend = FileCacheBackend(cache_config['shared_dir'], ttl_sec, cache_config.get('shared_max_files', 10000))
+    return ResultCache(
+        max_entries=cache_config.get('max_entries', 1024),
+        max_bytes=cache_config.get('max_bytes', 64 << 20),
+        ttl_sec=ttl_sec,
+        backend=backend,
+    )
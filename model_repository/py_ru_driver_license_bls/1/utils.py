@@ -1,10 +1,16 @@
-import certifi
 import cv2
 import exifread
+import io
 import numpy as np
-import socket
-from io import BytesIO
-from urllib.request import urlopen
+import time
+
+import jpeg
+
+
+# Начальный размер буфера, если размер фото заранее неизвестен
+DEFAULT_BUFFER_SIZE = 1 << 20
+# Максимальный размер фото по умолчанию
+DEFAULT_MAX_IMAGE_SIZE = 30 << 20
 
 
 class ImageNotLoad(Exception):
@@ -13,15 +19,76 @@ class ImageNotLoad(Exception):
         super().__init__(self.message)
 
 
+class MemoryViewReader(io.RawIOBase):
+    def __init__(self, view):
+        """Файловый интерфейс чтения поверх memoryview, буфер не копируется
+
+        Parameters
+        ----------
+        view : memoryview
+            Байты фото
+        """
+        super().__init__()
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = max(0, min(len(buffer), len(self._view) - self._position))
+        buffer[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
 
 def convert_from_bytes_to_cv2(bytes_data):
-    img_download = cv2.imdecode(np.asarray(bytes_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    img_download = cv2.imdecode(np.frombuffer(bytes_data, dtype=np.uint8), cv2.IMREAD_COLOR)
 
     return img_download
 
 
 def get_exif_img(bytes_data):
-    return exifread.process_file(BytesIO(bytes_data), details=False, stop_tag='Image Orientation')
+    return exifread.process_file(MemoryViewReader(memoryview(bytes_data)), details=False,
+                                 stop_tag='Image Orientation')
+
+
+def get_img_orientation(bytes_data):
+    """EXIF ориентация фото.
+    Для JPEG тег читается напрямую из APP1 сегмента, остальные форматы разбирает exifread
+
+    Parameters
+    ----------
+    bytes_data : memoryview
+        Байты фото
+
+    Returns
+    -------
+    int
+        Значение тега Orientation, 1 если тега нет
+    """
+
+    if jpeg.is_jpeg(bytes_data):
+        orientation = jpeg.read_orientation(bytes_data)
+    else:
+        img_exif = get_exif_img(bytes_data)
+        orientation = img_exif['Image Orientation'].values[0] if 'Image Orientation' in img_exif else None
+
+    return 1 if orientation is None else orientation
 
 
 def img_exif_transpose(img, orientation):
@@ -55,54 +122,237 @@ def img_exif_transpose(img, orientation):
     return img
 
 
-def download_transpose(url, timeout_download_s):
-    img = None
-    try:
-        bytes_data = download_bytes(url, timeout_download_s)
+# Коэффициенты уменьшения при декодировании JPEG (DCT scaling) и флаги cv2
+REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+
+class DocumentImage:
+    def __init__(self, bytes_data, orientation, detection_img, reduce_factor=1, jpeg_size=None):
+        """Загруженное фото документа.
+        Фото для детектора может быть декодировано в уменьшенном размере,
+        тогда фото в полном разрешении декодируется из байтов по требованию
+
+        Parameters
+        ----------
+        bytes_data : memoryview
+            Байты фото
+        orientation : int
+            EXIF ориентация фото
+        detection_img : numpy.array
+            Фото для детектора
+        reduce_factor : int, optional
+            Во сколько раз уменьшено фото для детектора, by default 1
+        jpeg_size : tuple, optional
+            Высота и ширина JPEG из заголовка, нужны при reduce_factor > 1, by default None
+        """
+        self.orientation = orientation
+        self.detection_img = detection_img
+        self.reduce_factor = reduce_factor
+        if reduce_factor == 1:
+            self.bytes_data = None
+            self._full_img = detection_img
+            self.shape = detection_img.shape[:2]
+        else:
+            self.bytes_data = bytes_data
+            self._full_img = None
+            height, width = jpeg_size
+            # Уменьшенное фото прошло те же повороты, что получит полное
+            reduced_shape = (-(-height // reduce_factor), -(-width // reduce_factor))
+            self.shape = (height, width) if detection_img.shape[:2] == reduced_shape else (width, height)
+
+    @property
+    def detection_scale(self):
+        """Коэфф перевода координат фото для детектора в координаты полного фото"""
+        return max(self.shape) / max(self.detection_img.shape[:2])
+
+    def get_full_img(self):
+        """Фото в полном разрешении, декодируется один раз
+
+        Returns
+        -------
+        numpy.array
+            Фото документа
+        """
+        if self._full_img is None:
+            img_download = convert_from_bytes_to_cv2(self.bytes_data)
+            self._full_img = img_exif_transpose(img_download, self.orientation)
+            self.bytes_data = None
+        return self._full_img
+
+
+def get_reduce_factor(jpeg_size, target_size):
+    """Максимальный коэфф уменьшения JPEG, при котором большая сторона не меньше размера детектора
+
+    Parameters
+    ----------
+    jpeg_size : tuple
+        Высота и ширина JPEG
+    target_size : int
+        Размер входа детектора
+
+    Returns
+    -------
+    int
+        Коэфф уменьшения: 1, 2, 4 или 8
+    """
+
+    max_side = max(jpeg_size)
+    for reduce_factor in REDUCED_DECODE_FLAGS:
+        if max_side / reduce_factor >= target_size:
+            return reduce_factor
 
+    return 1
+
+
+def decode_document_image(bytes_data, detector_img_size=None, timings=None):
+    """Декодирование фото и EXIF поворот
+
+    Parameters
+    ----------
+    bytes_data : memoryview
+        Байты фото
+    detector_img_size : int, optional
+        Размер входа детектора. Если задан, JPEG для детектора декодируется
+        в уменьшенном размере (не меньше размера детектора), by default None.
+        Полное фото тогда декодируется второй раз (см DocumentImage.get_full_img),
+        для документа с распознаванием полей это медленнее одного полного декодирования
+    timings : dict, optional
+        Словарь замеров этапов decode и exif_transpose в нс, by default None
+
+    Returns
+    -------
+    DocumentImage
+        Загруженное фото
+    """
+
+    start_ns = time.perf_counter_ns() if timings is not None else 0
+    img_orientation = get_img_orientation(bytes_data)
+
+    reduce_factor = 1
+    jpeg_size = None
+    if detector_img_size is not None and jpeg.is_jpeg(bytes_data):
+        jpeg_size = jpeg.read_size(bytes_data)
+        if jpeg_size is not None:
+            reduce_factor = get_reduce_factor(jpeg_size, detector_img_size)
+
+    if reduce_factor == 1:
         img_download = convert_from_bytes_to_cv2(bytes_data)
-        img_download_exif = get_exif_img(bytes_data)
+    else:
+        img_download = cv2.imdecode(np.frombuffer(bytes_data, dtype=np.uint8), REDUCED_DECODE_FLAGS[reduce_factor])
+
+    if timings is not None:
+        decoded_ns = time.perf_counter_ns()
+        timings['decode'] = decoded_ns - start_ns
+    img = img_exif_transpose(img_download, img_orientation)
+    if timings is not None:
+        timings['exif_transpose'] = time.perf_counter_ns() - decoded_ns
+
+    return DocumentImage(bytes_data, img_orientation, img, reduce_factor, jpeg_size)
 
-        img_orientation = img_download_exif['Image Orientation'].values[
-            0] if 'Image Orientation' in img_download_exif else 1
 
-        img = img_exif_transpose(img_download, img_orientation)
-    
+def download_image_bytes(url, timeout_download_s, http_pool, expected_size=None,
+                         max_size=DEFAULT_MAX_IMAGE_SIZE, timings=None):
+    """Загрузка байтов фото
+
+    Parameters
+    ----------
+    url : str
+        url загрузки фото
+    timeout_download_s : float
+        timeout загрузки фото
+    http_pool : http_client.HTTPConnectionPool
+        Пул keep-alive соединений
+    expected_size : int, optional
+        Ожидаемый размер фото, by default None
+    max_size : int, optional
+        Максимальный размер фото в байтах, by default DEFAULT_MAX_IMAGE_SIZE
+    timings : dict, optional
+        Словарь замеров этапа download в нс, by default None
+
+    Returns
+    -------
+    memoryview
+        Байты фото
+
+    Raises
+    ------
+    ImageNotLoad
+        Ошибка загрузки фото
+    """
+    try:
+        start_ns = time.perf_counter_ns() if timings is not None else 0
+        bytes_data = download_bytes(url, timeout_download_s, http_pool, expected_size, max_size)
+        if timings is not None:
+            timings['download'] = time.perf_counter_ns() - start_ns
     except Exception as e:
         raise ImageNotLoad(f'Message: {str(e)}')
 
-    return img
+    return bytes_data
 
 
-def rotate_img_with_bboxes(img, bboxes, angle):
-    """Поворот фото и рамок
+def decode_transpose(bytes_data, detector_img_size=None, timings=None):
+    """Декодирование и EXIF поворот загруженного фото
+
+    Parameters
+    ----------
+    bytes_data : memoryview
+        Байты фото
+    detector_img_size : int, optional
+        Размер входа детектора для уменьшенного декодирования (см decode_document_image), by default None
+    timings : dict, optional
+        Словарь замеров этапов decode и exif_transpose в нс, by default None
+
+    Returns
+    -------
+    DocumentImage
+        Загруженное фото
+
+    Raises
+    ------
+    ImageNotLoad
+        Ошибка декодирования фото
+    """
+    try:
+        document_image = decode_document_image(bytes_data, detector_img_size, timings)
+        if document_image.detection_img is None:
+            raise ValueError('Image can not be decoded')
+    except Exception as e:
+        raise ImageNotLoad(f'Message: {str(e)}')
+
+    return document_image
+
+
+def rotate_bboxes(bboxes, angle, img_shape):
+    """Поворот рамок вместе с фото
 
     Parameters
     ----------
-    img : numpy.array
-        Фото паспорта
     bboxes : numpy.array
         Координаты рамок
     angle : int
         Угол поворота
+    img_shape : tuple
+        Высота и ширина фото до поворота
 
     Returns
     -------
-    tuple
-        Повернутые изображение и рамки
+    numpy.array
+        Повернутые рамки
     """
 
-    w, h = img.shape[1], img.shape[0]
+    h, w = img_shape[:2]
     cx, cy = w // 2, h // 2
 
-    img = rotate_img(img, angle)
-
     corners = get_corners(bboxes[:, :4])
     corners = np.hstack((corners, bboxes[:, 4:]))
     corners[:, :8] = rotate_box(corners[:, :8], angle, cx, cy, h, w)
     new_bbox = get_enclosing_box(corners)
 
-    return img, new_bbox
+    return new_bbox
 
 
 def rotate_img(img, angle):
@@ -258,23 +508,171 @@ def crop_img(img, bbox):
     return crop
 
 
-def download_bytes(url, timeout_s):
-    """Загрузка фото байтами
+def get_crop_shape(img_shape, bbox, angle):
+    """Высота и ширина фрагмента повернутого фото без вырезания (см crop_rotated_img)
+
+    Parameters
+    ----------
+    img_shape : tuple
+        Высота и ширина фото документа до поворота
+    bbox : list(int)
+        Координаты рамки на повернутом фото
+    angle : int
+        Угол поворота (см rotate_img)
+
+    Returns
+    -------
+    tuple(int, int)
+        Высота и ширина фрагмента, 0 для пустого фрагмента
+    """
+
+    h, w = img_shape[:2]
+    rotated_h, rotated_w = (w, h) if angle in (90, 270) else (h, w)
+    xmin, ymin, xmax, ymax = bbox
+    # Семантика срезов python: отрицательные индексы и выход за границы
+    row_start, row_stop, _ = slice(ymin, ymax).indices(rotated_h)
+    col_start, col_stop, _ = slice(xmin, xmax).indices(rotated_w)
+
+    return max(row_stop - row_start, 0), max(col_stop - col_start, 0)
+
+
+def crop_rotated_img(img, bbox, angle, convert=None):
+    """Фрагмент повернутого фото без поворота всего фото.
+    Рамка в координатах повернутого фото переводится в координаты исходного,
+    вырезается и поворачивается только фрагмент. Результат совпадает с
+    crop_img(rotate_img(img, angle), bbox)
+
+    Parameters
+    ----------
+    img : numpy.array
+        Фото документа до поворота
+    bbox : list(int)
+        Координаты рамки на повернутом фото
+    angle : int
+        Угол поворота (см rotate_img)
+    convert : callable(), optional
+        Попиксельное преобразование фрагмента до поворота, например перевод в серый, by default None
+
+    Returns
+    -------
+    numpy.array
+        Повернутый фрагмент фото
+    """
+
+    if angle not in (90, 180, 270):
+        crop = crop_img(img, bbox)
+        return crop if convert is None else convert(crop)
+
+    h, w = img.shape[:2]
+    rotated_h, rotated_w = (h, w) if angle == 180 else (w, h)
+    xmin, ymin, xmax, ymax = bbox
+    # Семантика срезов python: отрицательные индексы и выход за границы
+    row_start, row_stop, _ = slice(ymin, ymax).indices(rotated_h)
+    col_start, col_stop, _ = slice(xmin, xmax).indices(rotated_w)
+    row_stop = max(row_start, row_stop)
+    col_stop = max(col_start, col_stop)
+
+    if angle == 90:
+        crop = img[col_start:col_stop, w - row_stop:w - row_start]
+    elif angle == 180:
+        crop = img[h - row_stop:h - row_start, w - col_stop:w - col_start]
+    else:
+        crop = img[h - col_stop:h - col_start, row_start:row_stop]
+
+    if crop.size == 0:
+        crop = np.empty((row_stop - row_start, col_stop - col_start) + img.shape[2:], dtype=img.dtype)
+        return crop if convert is None else convert(crop)
+    if convert is not None:
+        crop = convert(crop)
+
+    return rotate_img(crop, angle)
+
+
+def read_into_buffer(response, size, max_size, initial_size=DEFAULT_BUFFER_SIZE):
+    """Потоковое чтение тела ответа в один буфер
+
+    Parameters
+    ----------
+    response : http.client.HTTPResponse
+        Ответ сервера
+    size : int, optional
+        Точный размер тела (Content-Length) или None
+    max_size : int
+        Максимальный размер тела
+    initial_size : int, optional
+        Ожидаемый размер тела, если точный размер неизвестен, by default DEFAULT_BUFFER_SIZE
+
+    Returns
+    -------
+    memoryview
+        Прочитанные байты
+
+    Raises
+    ------
+    ValueError
+        Размер тела больше максимального или тело прочитано не полностью
+    """
+
+    if size is not None:
+        if size > max_size:
+            raise ValueError(f'Image size {size} bytes exceeds limit {max_size} bytes')
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        n_read = 0
+        while n_read < size:
+            chunk_size = response.readinto(view[n_read:])
+            if not chunk_size:
+                raise ValueError(f'Incomplete image body: {n_read} of {size} bytes')
+            n_read += chunk_size
+        return view
+
+    # Размер заранее неизвестен: буфер растет удвоением до max_size + 1. Лишний байт
+    # позволяет определить превышение лимита, а при точном ожидаемом размере - увидеть
+    # конец тела без увеличения буфера и копии
+    buffer = bytearray(min(max(initial_size, 1), max_size) + 1)
+    n_read = 0
+    while True:
+        with memoryview(buffer) as view:
+            chunk_size = response.readinto(view[n_read:])
+        if not chunk_size:
+            break
+        n_read += chunk_size
+        if n_read > max_size:
+            raise ValueError(f'Image size exceeds limit {max_size} bytes')
+        if n_read == len(buffer):
+            buffer.extend(bytes(min(len(buffer), max_size + 1 - len(buffer))))
+    return memoryview(buffer)[:n_read]
+
+
+def download_bytes(url, timeout_s, http_pool, expected_size=None, max_size=DEFAULT_MAX_IMAGE_SIZE):
+    """Потоковая загрузка фото в один буфер.
+    Размер буфера берется из Content-Length, а если его нет - из ожидаемого размера фото
 
     Parameters
     ----------
     url : str
         url загрузки фото
-    timeout_download_s : _type_
+    timeout_s : float
         timeout загрузки фото
+    http_pool : http_client.HTTPConnectionPool
+        Пул keep-alive соединений
+    expected_size : int, optional
+        Ожидаемый размер фото (поле size запроса), by default None
+    max_size : int, optional
+        Максимальный размер фото в байтах, by default DEFAULT_MAX_IMAGE_SIZE
 
     Returns
     -------
-    bytearray
-        Массив байтов фото
+    memoryview
+        Байты фото
     """
 
-    socket.setdefaulttimeout(timeout_s)
-    bytes_data = None
-    bytes_data = bytearray(urlopen(url, cafile=certifi.where()).read())
+    with http_pool.get(url, timeout_s) as response:
+        content_length = response.getheader('Content-Length')
+        bytes_data = read_into_buffer(
+            response,
+            int(content_length) if content_length is not None else None,
+            max_size,
+            initial_size=expected_size or DEFAULT_BUFFER_SIZE,
+        )
     return bytes_data
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Бенчмарки импортируют модули BLS модели так же, как их видит python backend Triton
+BLS_MODEL_DIR = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'model_repository', 'py_ru_driver_license_bls', '1'
+)
+sys.path.insert(0, os.path.abspath(BLS_MODEL_DIR))
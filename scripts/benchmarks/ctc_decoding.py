@@ -0,0 +1,62 @@
+"""Сравнение жадного CTC декодирования и beam search с шаблоном поля.
+
+Запуск из корня репозитория:
+    python -m scripts.benchmarks.ctc_decoding --batch-size 16 --beam-width 8
+Используются синтетические выходы модели дат [B, 24, 12] с зашумленными кадрами.
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from recognition.postprocess import CTCDecoder
+from recognition.validation import date_validation
+
+
+VOCABULARY = '0123456789.'
+TEMPLATE = '[0-3]#.[01]#.####'
+
+
+def make_predictions(batch_size, steps, noise, rng):
+    classes_count = len(VOCABULARY) + 1
+    predictions = np.empty((batch_size, steps, classes_count), dtype=np.float32)
+    for index in range(batch_size):
+        date = f'{rng.integers(1, 29):02d}.{rng.integers(1, 13):02d}.{rng.integers(1950, 2030)}'
+        frames = []
+        for symbol in date:
+            frames += [VOCABULARY.index(symbol), classes_count - 1]
+        frames += [classes_count - 1] * (steps - len(frames))
+        logits = rng.normal(0, noise, (steps, classes_count))
+        logits[np.arange(steps), frames] += 3
+        probabilities = np.exp(logits)
+        predictions[index] = probabilities / probabilities.sum(axis=1, keepdims=True)
+    return predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CTC decoding benchmark')
+    parser.add_argument('--batch-size', type=int, default=16, help='Количество фрагментов в пакете')
+    parser.add_argument('--steps', type=int, default=24, help='Количество кадров выхода модели')
+    parser.add_argument('--noise', type=float, default=1.5, help='Шум логитов')
+    parser.add_argument('--beam-width', type=int, default=8, help='Ширина луча')
+    parser.add_argument('--repeat', type=int, default=50, help='Количество повторов')
+    args = parser.parse_args()
+
+    predictions = make_predictions(args.batch_size, args.steps, args.noise, np.random.default_rng(0))
+    greedy = CTCDecoder(VOCABULARY)
+    constrained = CTCDecoder(VOCABULARY, {'mode': 'beam', 'beam_width': args.beam_width, 'template': TEMPLATE})
+
+    # Beam search запускается только для фрагментов с невалидным жадным текстом, как в сервисе
+    validations = [date_validation] * args.batch_size
+
+    for name, decoder in [('greedy', greedy), (f'beam {args.beam_width}', constrained)]:
+        decode_time = timeit.timeit(
+            lambda: decoder.decode_validated(predictions, validations), number=args.repeat
+        ) / args.repeat
+        valid = sum(decoder.decode_validated(predictions, validations)[1])
+        print(f'{name:>8}: {decode_time * 1e3:.2f} ms per batch of {args.batch_size}; '
+              f'valid dates: {valid}/{args.batch_size}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Сравнение типов входа детектора: float32, float16 и uint8 с нормализацией в графе модели
+(см scripts/export_detection_input.py). Для каждого типа - время предобработки, байты тензора,
+которые копируются в разделяемую память Triton, и расхождение входа модели с float32 после нормализации.
+
+Запуск из корня репозитория:
+    python -m scripts.benchmarks.detection_input_dtype --images-dir <папка с фото>
+Без --images-dir используется синтетическое фото 4000x3000.
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from detection.preprocess import NORM_SCALE, BatchBuffer, get_input_dtype, preprocess_into
+from scripts.benchmarks.detection_preprocess import load_images
+
+
+def model_input(batch):
+    # Вход float32 модели после обертки export_detection_input
+    if batch.dtype == np.uint8:
+        return batch.astype(np.float32) * NORM_SCALE
+    return batch.astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detection input dtype benchmark')
+    parser.add_argument('--images-dir', type=str, default=None, help='Папка с фото')
+    parser.add_argument('--img-size', type=int, default=1280, help='Размер входа детектора')
+    parser.add_argument('--repeat', type=int, default=10, help='Количество повторов на пакет')
+    args = parser.parse_args()
+
+    if args.images_dir:
+        images = load_images(args.images_dir)
+    else:
+        images = [np.random.default_rng(0).integers(0, 256, (3000, 4000, 3), dtype=np.uint8)]
+
+    batches = {}
+    for input_dtype in ['float32', 'float16', 'uint8']:
+        buffer = BatchBuffer(args.img_size, get_input_dtype(input_dtype))
+
+        def run():
+            batch = buffer.get(len(images))
+            for index, img in enumerate(images):
+                preprocess_into(img, batch, index)
+            return batch
+
+        batches[input_dtype] = run()
+        elapsed = timeit.timeit(run, number=args.repeat) / (args.repeat * len(images))
+        max_diff = np.abs(model_input(batches[input_dtype]) - batches['float32']).max()
+        print(f'{input_dtype:>7}: {elapsed * 1e3:.1f} ms per image; '
+              f'{batches[input_dtype].nbytes // len(images):,} bytes per image; '
+              f'max abs diff with float32 model input: {max_diff:.2e}')
+
+
+if __name__ == '__main__':
+    main()
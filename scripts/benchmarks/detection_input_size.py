@@ -0,0 +1,163 @@
+"""Точность и задержка детектора на входах разной формы: квадрат 1280, 960, 640 и входы
+по соотношению сторон фото (detector.input_shapes конфига BLS).
+
+Каждое фото предобрабатывается как в BLS, отправляется в модель детекции Triton, рамки переводятся
+обратно в пиксели фото (detection.postprocess.scale_bboxes). Точность - доля размеченных полей
+(разметка YOLO из labels_path), найденных с IoU >= --iou; фото без разметки сравниваются с рамками
+первого варианта. Модель детекции должна принимать вход [-1, -1, -1, 3].
+
+Запуск из корня репозитория:
+    python -m scripts.benchmarks.detection_input_size --config scripts/config/driver_license_detection.yaml \
+        --variants 1280 960 640 1280,960x1280,1280x960
+Вариант - размер квадратного входа или список входов высотаxширина через запятую.
+С --offline модель не вызывается: только время предобработки и размер тензора,
+при отсутствии images_path используется синтетическое фото 4000x3000.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import requests
+import yaml
+
+from detection.postprocess import scale_bboxes, select_bboxes
+from detection.preprocess import BatchBuffer, get_input_shapes, preprocess_into, select_input_shape
+
+
+OUTPUT_NAMES = ['detection_boxes', 'detection_classes', 'detection_scores']
+TRITON_DTYPES = {'FP32': np.float32, 'FP16': np.float16, 'UINT8': np.uint8, 'INT64': np.int64}
+
+
+def parse_variant(variant):
+    shapes = [[int(x) for x in shape.split('x')] if 'x' in shape else int(shape) for shape in variant.split(',')]
+    return get_input_shapes({'img_size': shapes[0], 'input_shapes': shapes})
+
+
+def infer(session, url, model_name, batch):
+    # Бинарное расширение HTTP API Triton: json заголовок и сырые байты тензоров
+    header = json.dumps({
+        'inputs': [{
+            'name': 'inputs', 'shape': list(batch.shape), 'datatype': 'FP32',
+            'parameters': {'binary_data_size': batch.nbytes},
+        }],
+        'outputs': [{'name': name, 'parameters': {'binary_data': True}} for name in OUTPUT_NAMES],
+    }).encode()
+    response = session.post(
+        f'http://{url}/v2/models/{model_name}/infer', data=header + batch.tobytes(),
+        headers={'Inference-Header-Content-Length': str(len(header))},
+    )
+    response.raise_for_status()
+    offset = int(response.headers['Inference-Header-Content-Length'])
+    outputs = {}
+    for output in json.loads(response.content[:offset])['outputs']:
+        size = output['parameters']['binary_data_size']
+        outputs[output['name']] = np.frombuffer(
+            response.content[offset:offset + size], dtype=TRITON_DTYPES[output['datatype']]
+        ).reshape(output['shape'])
+        offset += size
+    return outputs
+
+
+def load_labels(path, img_shape, processor):
+    # Разметка YOLO: класс, центр и размер рамки в долях фото
+    img_height, img_width = img_shape[:2]
+    labels = {}
+    with open(path, 'r', encoding='utf-8') as labels_f:
+        for line in labels_f:
+            if not line.strip():
+                continue
+            label_class, cx, cy, width, height = line.split()[:5]
+            cx, width = float(cx) * img_width, float(width) * img_width
+            cy, height = float(cy) * img_height, float(height) * img_height
+            labels[processor[int(label_class)]] = [cx - width / 2, cy - height / 2, cx + width / 2, cy + height / 2]
+    return labels
+
+
+def iou(first, second):
+    width = min(first[2], second[2]) - max(first[0], second[0])
+    height = min(first[3], second[3]) - max(first[1], second[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    area = (first[2] - first[0]) * (first[3] - first[1]) + (second[2] - second[0]) * (second[3] - second[1])
+    return intersection / (area - intersection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detection input size benchmark')
+    parser.add_argument('--config', type=str, default='scripts/config/driver_license_detection.yaml',
+                        help='Конфиг оценки детектора')
+    parser.add_argument('--variants', nargs='+', default=['1280', '960', '640', '1280,960x1280,1280x960'],
+                        help='Варианты входа детектора')
+    parser.add_argument('--threshold', type=float, default=0.5, help='Порог скора детекции')
+    parser.add_argument('--iou', type=float, default=0.5, help='Порог IoU совпадения рамок')
+    parser.add_argument('--offline', action='store_true', help='Без вызова модели')
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as conf_f:
+        config = yaml.safe_load(conf_f)
+    variants = [parse_variant(x) for x in args.variants]
+    buffers = [[BatchBuffer(shape) for shape in input_shapes] for input_shapes in variants]
+    processor = {int(k): int(v) for k, v in config.get('processor', {}).items()}
+    session = requests.Session()
+
+    image_paths = sorted(glob.glob(os.path.join(config.get('images_path', ''), '*')))
+    if not image_paths:
+        image_paths = [None]
+    stats = [{'preprocess': [], 'infer': [], 'bytes': [], 'found': 0, 'total': 0, 'ious': []} for _ in variants]
+    for path in image_paths:
+        img = (np.random.default_rng(0).integers(0, 256, (3000, 4000, 3), dtype=np.uint8) if path is None
+               else cv2.imread(path))
+        if img is None:
+            continue
+        reference = None
+        if path is not None and config.get('labels_path'):
+            labels_path = os.path.join(config['labels_path'], os.path.splitext(os.path.basename(path))[0] + '.txt')
+            if os.path.exists(labels_path):
+                reference = load_labels(labels_path, img.shape, processor)
+
+        for input_shapes, variant_buffers, variant_stats in zip(variants, buffers, stats):
+            start = time.perf_counter()
+            shape_index = select_input_shape(img.shape, input_shapes)
+            batch = variant_buffers[shape_index].get(1)
+            scale, (dw, dh) = preprocess_into(img, batch, 0)
+            variant_stats['preprocess'].append(time.perf_counter() - start)
+            variant_stats['bytes'].append(batch.nbytes)
+            if args.offline:
+                continue
+
+            start = time.perf_counter()
+            outputs = infer(session, config['model']['url'], config['model']['endpoint'], batch)
+            variant_stats['infer'].append(time.perf_counter() - start)
+            bboxes, scores, classes = select_bboxes(
+                outputs['detection_boxes'], outputs['detection_scores'], outputs['detection_classes'])
+            bboxes = scale_bboxes(img.shape, bboxes, scale, dw, dh, detector_img_size=batch.shape[1:3])
+            detected = {int(x): bbox for x, bbox, score in zip(classes, bboxes, scores) if score >= args.threshold}
+            if reference is None:
+                # без разметки опорные рамки дает первый вариант
+                reference = detected
+            for field_class, bbox in reference.items():
+                field_iou = iou(bbox, detected[field_class]) if field_class in detected else 0.0
+                variant_stats['found'] += field_iou >= args.iou
+                variant_stats['total'] += 1
+                variant_stats['ious'].append(field_iou)
+
+    print(f'images: {len(image_paths)}')
+    for variant, variant_stats in zip(args.variants, stats):
+        line = (f'{variant:>24}: preprocess {np.mean(variant_stats["preprocess"]) * 1e3:.1f} ms, '
+                f'{np.mean(variant_stats["bytes"]) / 2**20:.1f} MiB per image')
+        if variant_stats['infer']:
+            line += (f'; infer p50 {np.median(variant_stats["infer"]) * 1e3:.1f} ms, '
+                     f'p95 {np.percentile(variant_stats["infer"], 95) * 1e3:.1f} ms; '
+                     f'fields found {variant_stats["found"]}/{variant_stats["total"]} '
+                     f'({variant_stats["found"] / max(variant_stats["total"], 1):.3f}), '
+                     f'mean IoU {np.mean(variant_stats["ious"]):.3f}')
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Сравнение предобработки фото для детектора: изменение размера на float32 и на uint8.
+
+Запуск из корня репозитория:
+    python -m scripts.benchmarks.detection_preprocess --images-dir <папка с фото>
+Без --images-dir используется синтетическое фото 4000x3000.
+"""
+import argparse
+import glob
+import os
+import timeit
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from detection.preprocess import BatchBuffer, preprocess_into
+
+
+def legacy_preprocess(img, img_size):
+    img_height, img_width = img.shape[:2]
+    scale = img_size / max(img_height, img_width)
+    resized_width = img_size if img_width >= img_height else int(img_width * scale)
+    resized_height = img_size if img_height > img_width else int(img_height * scale)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.
+    img = cv2.resize(img, (resized_width, resized_height))
+    delta_width, delta_height = img_size - resized_width, img_size - resized_height
+    img = np.pad(img, [(delta_height // 2, delta_height - delta_height // 2),
+                       (delta_width // 2, delta_width - delta_width // 2), (0, 0)],
+                 mode='constant', constant_values=(114 / 255.0, 114 / 255.0))
+    return np.expand_dims(img, axis=0)
+
+
+def load_images(images_dir):
+    images = []
+    for path in sorted(glob.glob(os.path.join(images_dir, '*'))):
+        img = cv2.imread(path)
+        if img is not None:
+            images.append(img)
+    return images
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detection preprocessing benchmark')
+    parser.add_argument('--images-dir', type=str, default=None, help='Папка с фото')
+    parser.add_argument('--img-size', type=int, default=1280, help='Размер входа детектора')
+    parser.add_argument('--repeat', type=int, default=10, help='Количество повторов на пакет')
+    args = parser.parse_args()
+
+    if args.images_dir:
+        images = load_images(args.images_dir)
+    else:
+        images = [np.random.default_rng(0).integers(0, 256, (3000, 4000, 3), dtype=np.uint8)]
+    buffer = BatchBuffer(args.img_size)
+
+    def run_legacy():
+        return np.concatenate([legacy_preprocess(img, args.img_size) for img in images])
+
+    def run_current():
+        batch = buffer.get(len(images))
+        for index, img in enumerate(images):
+            preprocess_into(img, batch, index)
+        return batch
+
+    max_diff = np.abs(run_legacy() - run_current()).max()
+    legacy_time = timeit.timeit(run_legacy, number=args.repeat)
+    current_time = timeit.timeit(run_current, number=args.repeat)
+    calls = args.repeat * len(images)
+
+    print(f'images: {len(images)}; max abs diff: {max_diff:.6f}')
+    print(f'float32 resize: {legacy_time / calls * 1e3:.1f} ms per image, '
+          f'peak {peak_memory(run_legacy) / 2**20:.1f} MiB per batch')
+    print(f'uint8 resize:   {current_time / calls * 1e3:.1f} ms per image, '
+          f'peak {peak_memory(run_current) / 2**20:.1f} MiB per batch')
+    print(f'speedup: {legacy_time / current_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
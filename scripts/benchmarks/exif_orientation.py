@@ -0,0 +1,70 @@
+"""Сравнение чтения EXIF ориентации: exifread и jpeg.read_orientation.
+
+Запуск из корня репозитория:
+    python -m scripts.benchmarks.exif_orientation --images-dir <папка с фото>
+Без --images-dir используется синтетическое фото 4000x3000 с EXIF.
+"""
+import argparse
+import glob
+import os
+import struct
+import timeit
+
+import cv2
+import numpy as np
+
+import jpeg
+from utils import get_exif_img, get_img_orientation
+
+
+def make_synthetic_jpeg(orientation=6):
+    img = np.random.default_rng(0).integers(0, 255, (3000, 4000, 3), dtype=np.uint8)
+    _, encoded = cv2.imencode('.jpg', img)
+    tiff = b'II' + struct.pack('<HI', 42, 8) + struct.pack('<H', 1)
+    tiff += struct.pack('<HHIHH', 0x0112, 3, 1, orientation, 0) + struct.pack('<I', 0)
+    payload = b'Exif\x00\x00' + tiff
+    segment = struct.pack('>BBH', 0xFF, 0xE1, len(payload) + 2) + payload
+    encoded = encoded.tobytes()
+    return {'synthetic.jpg': encoded[:2] + segment + encoded[2:]}
+
+
+def load_images(images_dir):
+    images = {}
+    for path in sorted(glob.glob(os.path.join(images_dir, '*'))):
+        if path.lower().endswith(('.jpg', '.jpeg')):
+            with open(path, 'rb') as f:
+                images[os.path.basename(path)] = f.read()
+    return images
+
+
+def exifread_orientation(data):
+    img_exif = get_exif_img(memoryview(data))
+    return img_exif['Image Orientation'].values[0] if 'Image Orientation' in img_exif else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXIF orientation benchmark')
+    parser.add_argument('--images-dir', type=str, default=None, help='Папка с JPEG фото')
+    parser.add_argument('--repeat', type=int, default=200, help='Количество повторов на фото')
+    args = parser.parse_args()
+
+    images = load_images(args.images_dir) if args.images_dir else make_synthetic_jpeg()
+
+    mismatches = [
+        name for name, data in images.items()
+        if get_img_orientation(memoryview(data)) != exifread_orientation(data)
+    ]
+
+    views = [memoryview(data) for data in images.values()]
+    exifread_time = timeit.timeit(lambda: [exifread_orientation(x) for x in views], number=args.repeat)
+    parser_time = timeit.timeit(lambda: [jpeg.read_orientation(x) for x in views], number=args.repeat)
+    calls = args.repeat * len(views)
+
+    print(f'images: {len(images)}; parity mismatches: {len(mismatches)} {mismatches}')
+    print(f'exifread:              {exifread_time / calls * 1e6:.1f} us per image')
+    print(f'jpeg.read_orientation: {parser_time / calls * 1e6:.1f} us per image')
+    print(f'speedup: {exifread_time / parser_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
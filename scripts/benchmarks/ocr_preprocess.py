@@ -0,0 +1,88 @@
+"""Сравнение предобработки фрагментов полей для OCR: по одному фрагменту с np.concatenate
+и запись пакета в переиспользуемый непрерывный тензор с переводом фрагментов в серый до поворота.
+
+Запуск из корня репозитория:
+    python -m scripts.benchmarks.ocr_preprocess --batch-size 12
+Используется синтетическое фото 4000x3000 и рамки полей размера строки ФИО.
+"""
+import argparse
+import timeit
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from recognition.preprocess import CropBatchBuffer, preprocess_batch
+from utils import crop_rotated_img
+
+
+def legacy_preprocess(img, img_size):
+    # Предобработка фрагмента до записи в тензор пакета
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    img_height, img_width = img.shape[:2]
+    new_img_height, new_img_width = img_size
+    if new_img_width / img_width < new_img_height / img_height:
+        scale = new_img_width / img_width
+        resized_height, resized_width = int(img_height * scale), new_img_width
+    else:
+        scale = new_img_height / img_height
+        resized_height, resized_width = new_img_height, int(img_width * scale)
+    img = cv2.resize(img, (resized_width, resized_height)).astype(np.float32)
+    img /= 255.
+    delta_width, delta_height = new_img_width - resized_width, new_img_height - resized_height
+    img = np.pad(img, [(delta_height // 2, delta_height - delta_height // 2),
+                       (delta_width // 2, delta_width - delta_width // 2)],
+                 mode='constant', constant_values=(114 / 255., 114 / 255.))
+    return np.transpose(img[None, :, :, None], (0, 2, 1, 3))
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR crops preprocessing benchmark')
+    parser.add_argument('--batch-size', type=int, default=12, help='Количество фрагментов в пакете')
+    parser.add_argument('--image-height', type=int, default=32, help='Высота входа модели')
+    parser.add_argument('--image-width', type=int, default=200, help='Ширина входа модели')
+    parser.add_argument('--angle', type=int, default=0, choices=[0, 90, 180, 270], help='Угол поворота документа')
+    parser.add_argument('--repeat', type=int, default=200, help='Количество повторов')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (3000, 4000, 3), dtype=np.uint8)
+    crops = []
+    for _ in range(args.batch_size):
+        x, y = int(rng.integers(0, 3000)), int(rng.integers(0, 2800))
+        crops.append((img, [x, y, x + int(rng.integers(300, 900)), y + int(rng.integers(80, 160))], args.angle))
+    img_size = (args.image_height, args.image_width)
+    buffer = CropBatchBuffer(img_size)
+
+    def run_legacy():
+        # Как до пакетной предобработки: транспонированные представления и копия при concatenate,
+        # ascontiguousarray - копия, которую делал Triton для непрерывного входа
+        return np.ascontiguousarray(np.concatenate(
+            [legacy_preprocess(crop_rotated_img(x, bbox, angle), img_size) for x, bbox, angle in crops], axis=0
+        ))
+
+    def run_current():
+        return preprocess_batch(crops, buffer)
+
+    max_diff = np.abs(run_legacy() - run_current()).max()
+    legacy_time = timeit.timeit(run_legacy, number=args.repeat)
+    current_time = timeit.timeit(run_current, number=args.repeat)
+
+    print(f'crops: {args.batch_size}; input: {img_size}; max abs diff: {max_diff}')
+    print(f'per crop + concatenate: {legacy_time / args.repeat * 1e3:.2f} ms per batch, '
+          f'peak {peak_memory(run_legacy) / 2**10:.0f} KiB')
+    print(f'batch buffer:           {current_time / args.repeat * 1e3:.2f} ms per batch, '
+          f'peak {peak_memory(run_current) / 2**10:.0f} KiB')
+    print(f'speedup: {legacy_time / current_time:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Экспорт модели детекции со входом uint8 или float16: приведение типа и нормализация
+переносятся в граф SavedModel, BLS отправляет в модель тензор меньшего размера.
+
+Запуск из корня репозитория (нужен tensorflow той же версии, что в Triton):
+    python -m scripts.export_detection_input --input-dtype uint8
+
+Создает model_repository/<name>/1/model.savedmodel и config.pbtxt, после чего в конфиге сервиса:
+    ru_driver_license_models:
+      detector:
+        input_dtype: uint8
+        model_name: tf_ru_driver_license_detection_uint8
+
+Для прямоугольного входа или входов по соотношению сторон (detector.input_shapes) размер входа
+задается --input-shape высотаxширина, -1 - любой размер по оси, например --input-shape -1x-1.
+Исходная SavedModel должна принимать такой вход.
+"""
+import argparse
+import os
+
+import numpy as np
+import tensorflow as tf
+
+
+OUTPUT_NAMES = ['detection_boxes', 'detection_classes', 'detection_scores']
+CONFIG_TEMPLATE = '''name: "{name}"
+platform: "tensorflow_savedmodel"
+max_batch_size: 0
+input [
+  {{
+    name: "inputs"
+    data_type: {data_type}
+    dims: [-1, {img_height}, {img_width}, 3]
+  }}
+]
+output [
+  {{
+    name: "detection_boxes"
+    dims: [-1, 20, 4]
+  }},
+  {{
+    name: "detection_classes"
+    dims: [-1, 20]
+  }},
+  {{
+    name: "detection_scores"
+    dims: [-1, 20]
+  }}
+]
+'''
+INPUT_DTYPES = {
+    'uint8': (tf.uint8, 'TYPE_UINT8'),
+    'float16': (tf.float16, 'TYPE_FP16'),
+}
+
+
+class NormalizedInputModel(tf.Module):
+    def __init__(self, model, input_dtype, input_shape):
+        """Обертка модели детекции: вход uint8 (0..255) или float16 (уже нормализованный),
+        в граф добавляются приведение к float32 и для uint8 умножение на 1 / 255 - как в
+        detection/preprocess.py BLS, поэтому вход float32 модели совпадает с прежним
+
+        Parameters
+        ----------
+        model : tf.Module
+            Загруженная SavedModel детекции со входом float32
+        input_dtype : str
+            uint8 или float16
+        input_shape : tuple(int, int)
+            Высота и ширина входа детектора, -1 - любой размер по оси
+        """
+        super().__init__()
+        self.model = model
+        self.input_dtype = input_dtype
+        self.serve = tf.function(
+            self._serve,
+            input_signature=[tf.TensorSpec(
+                [None] + [None if x < 0 else x for x in input_shape] + [3], INPUT_DTYPES[input_dtype][0], name='inputs'
+            )],
+        )
+
+    def _serve(self, inputs):
+        x = tf.cast(inputs, tf.float32)
+        if self.input_dtype == 'uint8':
+            x = x * np.float32(1 / 255.0)
+        outputs = self.model.signatures['serving_default'](inputs=x)
+        return {name: outputs[name] for name in OUTPUT_NAMES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export detection model with uint8 / float16 input')
+    parser.add_argument('--input-dtype', choices=list(INPUT_DTYPES), default='uint8', help='Тип входа модели')
+    parser.add_argument('--repository', default='model_repository', help='Папка model_repository')
+    parser.add_argument('--source', default='tf_ru_driver_license_detection', help='Исходная модель float32')
+    parser.add_argument('--name', default=None, help='Имя новой модели, по умолчанию <source>_<input-dtype>')
+    parser.add_argument('--img-size', type=int, default=1280, help='Размер квадратного входа детектора')
+    parser.add_argument('--input-shape', type=str, default=None,
+                        help='Вход высотаxширина вместо квадратного, -1 - любой размер по оси')
+    args = parser.parse_args()
+    if args.input_shape:
+        img_height, img_width = (int(x) for x in args.input_shape.split('x'))
+    else:
+        img_height, img_width = args.img_size, args.img_size
+
+    name = args.name or f'{args.source}_{args.input_dtype}'
+    source_path = os.path.join(args.repository, args.source, '1', 'model.savedmodel')
+    model_dir = os.path.join(args.repository, name)
+    export_path = os.path.join(model_dir, '1', 'model.savedmodel')
+
+    wrapper = NormalizedInputModel(tf.saved_model.load(source_path), args.input_dtype, (img_height, img_width))
+    tf.saved_model.save(wrapper, export_path, signatures={'serving_default': wrapper.serve})
+    with open(os.path.join(model_dir, 'config.pbtxt'), 'w', encoding='utf-8') as config_f:
+        config_f.write(CONFIG_TEMPLATE.format(
+            name=name, data_type=INPUT_DTYPES[args.input_dtype][1], img_height=img_height, img_width=img_width
+        ))
+
+    # Проверка: выход обертки на uint8 совпадает с выходом исходной модели на нормализованном входе
+    rng = np.random.default_rng(0)
+    sample_shape = [args.img_size if x < 0 else x for x in (img_height, img_width)]
+    sample = rng.integers(0, 256, (1, *sample_shape, 3), dtype=np.uint8)
+    normalized = sample.astype(np.float32) * np.float32(1 / 255.0)
+    wrapper_input = sample if args.input_dtype == 'uint8' else normalized.astype(np.float16)
+    expected = wrapper.model.signatures['serving_default'](inputs=tf.constant(normalized))
+    exported = tf.saved_model.load(export_path).signatures['serving_default'](inputs=tf.constant(wrapper_input))
+    for output_name in OUTPUT_NAMES:
+        diff = np.abs(exported[output_name].numpy() - expected[output_name].numpy()).max()
+        print(f'{output_name}: max abs diff {diff}')
+    print(f'exported {export_path}')
+
+
+if __name__ == '__main__':
+    main()
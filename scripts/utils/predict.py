@@ -36,7 +36,8 @@ def recognize_driver_license(
     """Запрос на распознавание паспорта к Triton Inference Server.
     API Triton расширяет шаблоны KServe, которые заточены на стандартизацию взаимодействия с моделями машинного обучения.
     API Triton предполагает пакетную обработку и все данные запросов/ответов представляются виде списков.
-    Текущие модели распознавания не поддерживают пакетную обработку, поэтому данные должны быть представлены как список с одним элементов.
+    Модель поддерживает динамический батчинг на стороне Triton: запрос содержит пакет из одного фото формы [1, 1],
+    Triton сам объединяет одновременные запросы в пакет.
     На одно фото - один запрос.
 
     Parameters
@@ -59,7 +60,7 @@ def recognize_driver_license(
                     {
                         'name': 'recognition_response',
                         'datatype': 'BYTES',
-                        'shape': [1],
+                        'shape': [1, 1],
                         'data': [!!! Строка с результатами распознавания, которую нужно десериализовать !!!]
                     }
                 ]
@@ -91,7 +92,7 @@ def recognize_driver_license(
 
     input_json = {
         "name": "image_guid",
-        "shape": [1],
+        "shape": [1, 1],
         "datatype": "BYTES",
         "data": [json.dumps({"guid": photo_guid})],
     }
@@ -1,4 +1,5 @@
 import logging
+import threading
 import traceback
 
 from fastapi import APIRouter, HTTPException, Depends
@@ -6,7 +7,7 @@ from prometheus_client import Counter, Histogram, Gauge
 from ml_toolkit.pipelines.cv_detection import CVDetectionPipeline
 from ml_toolkit.pipelines.cv_recognition import CVRecognitionPipeline
 from ml_toolkit.loaders.image_loader import download_transpose, ImageLoadException
-from typing import Dict
+from typing import Dict, List
 
 from app_settings import settings
 from dependencies.pipelines import get_cv_detection_pipeline, get_ocr_pipelines
@@ -15,6 +16,7 @@ from schemes.v1.requests import DocumentRequest
 from schemes.v1.responses import DriverLicenceResponse
 
 from core.driver_licence_recognition import driver_licence_recognize as driver_licence_recognize_func
+from core.single_flight import SingleFlight
 
 
 logger = logging.getLogger("uvicorn")
@@ -30,6 +32,35 @@ LOAD_BY_SIZE_TIME = Histogram("load_by_size_time", "Time spent loading image by
 EXCEPTION_IMAGE_DOWNLOAD_COUNT = Counter(
     "exception_image_download_count", "Total number of image exceptions"
 )
+COALESCED_REQUEST_COUNT = Counter(
+    "coalesced_request_count", "Requests served by an in-flight recognition of the same guid"
+)
+
+# Одновременные запросы одного GUID делят одну загрузку и одно распознавание
+recognition_flight = SingleFlight()
+# Распознавание исполняется в пуле потоков, а пайплайны ml_toolkit и их клиенты tritonclient
+# общие для всех запросов и не гарантируют потокобезопасность: распознавания разных GUID
+# идут по одному, параллельно с ними идут только загрузки фото
+pipelines_lock = threading.Lock()
+
+
+def load_and_recognize(
+    guid: str,
+    detection_pipeline: CVDetectionPipeline,
+    ocr_pipelines: Dict[str, CVRecognitionPipeline]
+) -> List[dict]:
+    image_token = config['image_download']['token']
+    with LOAD_BY_SIZE_TIME.time():
+        url = config['image_download']['url'].format(guid, image_token)
+        timeout_sec = config['image_download']['timeout_sec']
+        image = download_transpose(url, timeout_download_s=timeout_sec)
+
+    logger.info(f"Image loaded: {guid}")
+    with pipelines_lock, DOCUMENT_FIELDS_RECOGNITION_PIPELINE_TIME.time():
+        results = driver_licence_recognize_func(image, config['pipeline_config'], detection_pipeline, ocr_pipelines)
+
+    return [result.to_dict() for result in results]
+
 
 @router.post(
     "/recognize/driver_licence", 
@@ -41,24 +72,15 @@ async def driver_licence_recognize(
     detection_pipeline: CVDetectionPipeline = Depends(get_cv_detection_pipeline),
     ocr_pipelines: Dict[str, CVRecognitionPipeline] = Depends(get_ocr_pipelines)
 ) -> DriverLicenceResponse:
-    image_token = config['image_download']['token']
     try:
         logger.info(f"Driver Licence recognition request: {request.request_id}")
 
-        with LOAD_BY_SIZE_TIME.time():
-            url = config['image_download']['url'].format(request.guid, image_token)
-            timeout_sec = config['image_download']['timeout_sec']
-            image = download_transpose(url, timeout_download_s=timeout_sec)
-
-        
-        logger.info(f"Image loaded: {request.request_id}")
-        logger.info(f"Recognizing photo: {request.request_id}")
-        with DOCUMENT_FIELDS_RECOGNITION_PIPELINE_TIME.time():
-            results = driver_licence_recognize_func(image, config['pipeline_config'], detection_pipeline, ocr_pipelines)
-        dl_fields = []
-
-        for result in results:
-            dl_fields.append(result.to_dict())
+        dl_fields, coalesced = await recognition_flight.do(
+            request.guid, load_and_recognize, request.guid, detection_pipeline, ocr_pipelines
+        )
+        if coalesced:
+            COALESCED_REQUEST_COUNT.inc()
+            logger.info(f"Request {request.request_id} coalesced with in-flight guid: {request.guid}")
 
         logger.info(
             f"Image has been recognized. request_id: {request.request_id}"
@@ -0,0 +1,42 @@
+import asyncio
+
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Объединение одновременных вызовов с одинаковым ключом: пока вызов исполняется,
+    запросы с тем же ключом ждут его результат (или исключение) вместо повторного исполнения.
+    Функция исполняется в пуле потоков, event loop остается свободным для новых запросов.
+    Отмена ожидающего запроса не отменяет общий вызов
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable, *args) -> Tuple[Any, bool]:
+        """
+        Исполнение func(*args) или ожидание уже исполняемого вызова с тем же ключом
+
+        Parameters
+        ----------
+        key : Hashable
+            Ключ вызова, например GUID фото
+        func : Callable
+            Блокирующая функция
+        *args
+            Аргументы функции
+
+        Returns
+        -------
+        Tuple[Any, bool]
+            Результат функции и флаг того, что результат получен от чужого вызова
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if not shared:
+            call = asyncio.ensure_future(run_in_threadpool(func, *args))
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(call), shared
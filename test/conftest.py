@@ -0,0 +1,161 @@
+import importlib.util
+import os
+import sys
+import types
+
+import numpy as np
+
+# Модули BLS модели импортируются так же, как их видит python backend Triton
+BLS_MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'model_repository', 'py_ru_driver_license_bls', '1')
+sys.path.insert(0, os.path.abspath(BLS_MODEL_DIR))
+
+
+class TritonError:
+    INTERNAL = 'INTERNAL'
+
+    def __init__(self, message, code=INTERNAL):
+        self._message = message
+        self.code = code
+
+    def message(self):
+        return self._message
+
+
+class TritonModelException(Exception):
+    pass
+
+
+class Tensor:
+    def __init__(self, name, value):
+        self._name = name
+        self._value = value
+
+    def name(self):
+        return self._name
+
+    def as_numpy(self):
+        return self._value
+
+
+class InferenceResponse:
+    def __init__(self, output_tensors=None, error=None):
+        self._output_tensors = output_tensors or []
+        self._error = error
+
+    def has_error(self):
+        return self._error is not None
+
+    def error(self):
+        return self._error
+
+    def output_tensors(self):
+        return self._output_tensors
+
+
+class InferenceRequest:
+    # Модели Triton для BLS запросов: имя модели -> функция (входы по имени) -> выходы по имени,
+    # задаются тестом; исключение функции возвращается ответом с ошибкой
+    models = {}
+
+    def __init__(self, model_name='', requested_output_names=None, inputs=None, request_id=''):
+        self.model_name = model_name
+        self.requested_output_names = requested_output_names or []
+        self._inputs = inputs or []
+        self._request_id = request_id
+
+    def request_id(self):
+        return self._request_id
+
+    def inputs(self):
+        return self._inputs
+
+    async def async_exec(self):
+        try:
+            outputs = self.models[self.model_name]({x.name(): x.as_numpy() for x in self._inputs})
+        except Exception as err:
+            return InferenceResponse(error=TritonError(str(err)))
+        return InferenceResponse([Tensor(name, outputs[name]) for name in self.requested_output_names])
+
+
+class Metric:
+    def __init__(self, labels):
+        self.labels = labels
+        self.value = 0
+
+    def increment(self, value):
+        self.value += value
+
+    def set(self, value):
+        self.value = value
+
+
+class MetricFamily:
+    COUNTER = 'COUNTER'
+    GAUGE = 'GAUGE'
+
+    def __init__(self, name, description, kind):
+        self.name = name
+        self.kind = kind
+        self.metrics = []
+
+    def Metric(self, labels):
+        metric = Metric(labels)
+        self.metrics.append(metric)
+        return metric
+
+
+class Logger:
+    messages = []
+
+    @classmethod
+    def log(cls, level, msg):
+        cls.messages.append((level, msg))
+
+    @classmethod
+    def log_verbose(cls, msg):
+        cls.log('verbose', msg)
+
+    @classmethod
+    def log_info(cls, msg):
+        cls.log('info', msg)
+
+    @classmethod
+    def log_warn(cls, msg):
+        cls.log('warn', msg)
+
+    @classmethod
+    def log_error(cls, msg):
+        cls.log('error', msg)
+
+
+def get_tensor_by_name(tensors, name):
+    return next((x for x in tensors if x.name() == name), None)
+
+
+def get_output_config_by_name(model_config, name):
+    return next((x for x in model_config.get('output', []) if x['name'] == name), {})
+
+
+def triton_string_to_numpy(triton_type):
+    return {'TYPE_STRING': np.object_, 'TYPE_FP32': np.float32, 'TYPE_UINT8': np.uint8}[triton_type]
+
+
+# python backend Triton есть только в контейнере сервера, вне его модули BLS модели
+# импортируют заглушку с BLS запросами к моделям из InferenceRequest.models
+if importlib.util.find_spec('triton_python_backend_utils') is None:
+    pb_utils_stub = types.ModuleType('triton_python_backend_utils')
+    pb_utils_stub.__dict__.update(
+        TritonError=TritonError,
+        TritonModelException=TritonModelException,
+        Tensor=Tensor,
+        InferenceRequest=InferenceRequest,
+        InferenceResponse=InferenceResponse,
+        MetricFamily=MetricFamily,
+        Logger=Logger,
+        get_input_tensor_by_name=lambda request, name: get_tensor_by_name(request.inputs(), name),
+        get_output_tensor_by_name=lambda response, name: get_tensor_by_name(response.output_tensors(), name),
+        get_output_config_by_name=get_output_config_by_name,
+        triton_string_to_numpy=triton_string_to_numpy,
+        is_stub=True,
+    )
+    sys.modules['triton_python_backend_utils'] = pb_utils_stub
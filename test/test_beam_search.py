@@ -0,0 +1,147 @@
+import itertools
+import re
+
+import numpy as np
+import pytest
+
+from recognition.beam_search import TemplateAutomaton, decode_batch_constrained, parse_template
+from recognition import postprocess
+from recognition.postprocess import CTCDecoder, decode_batch_with_scores, get_vocabulary_lookup
+
+
+DATE_VOCABULARY = '0123456789.'
+DATE_DECODING = {'mode': 'beam', 'beam_width': 8, 'template': '[0-3]#.[01]#.####'}
+
+
+def ctc_log_likelihood(log_probs, labels, blank):
+    # Прямой алгоритм CTC для одной строки
+    states = [blank]
+    for label in labels:
+        states += [label, blank]
+    alpha = np.full(len(states), -np.inf)
+    alpha[0] = log_probs[0, states[0]]
+    alpha[1] = log_probs[0, states[1]]
+    for step in range(1, len(log_probs)):
+        new_alpha = np.full(len(states), -np.inf)
+        for state in range(len(states)):
+            value = alpha[state]
+            if state >= 1:
+                value = np.logaddexp(value, alpha[state - 1])
+            if state >= 2 and states[state] != blank and states[state] != states[state - 2]:
+                value = np.logaddexp(value, alpha[state - 2])
+            new_alpha[state] = value + log_probs[step, states[state]]
+        alpha = new_alpha
+    return np.logaddexp(alpha[-1], alpha[-2])
+
+
+def make_date_prediction(text, rng, noise=0.05, frames_per_symbol=2):
+    classes_count = len(DATE_VOCABULARY) + 1
+    frames = []
+    for symbol in text:
+        frames += [DATE_VOCABULARY.index(symbol)] * frames_per_symbol + [classes_count - 1]
+    prediction = rng.uniform(0, noise, (len(frames), classes_count))
+    prediction[np.arange(len(frames)), frames] += 1
+    return (prediction / prediction.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_parse_template():
+    assert parse_template('[0-3]#.[01]# x') == ['0123', '0123456789', '.', '01', '0123456789', ' ', 'x']
+    with pytest.raises(ValueError):
+        parse_template('[0-3#')
+    with pytest.raises(ValueError):
+        TemplateAutomaton('##-##', DATE_VOCABULARY)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_wide_beam_finds_best_valid_string(seed):
+    # При ширине луча больше числа префиксов поиск точный: сравниваем с перебором всех строк шаблона
+    rng = np.random.default_rng(seed)
+    vocabulary = '01.'
+    predictions = rng.dirichlet(np.ones(len(vocabulary) + 1) * 0.5, (1, 7)).astype(np.float32)
+    automaton = TemplateAutomaton('[01].[01]', vocabulary)
+    log_probs = np.log(np.maximum(predictions[0], 1e-30))
+
+    candidates = [''.join(x) for x in itertools.product('01', '.', '01')]
+    best = max(candidates, key=lambda x: ctc_log_likelihood(log_probs, [vocabulary.index(s) for s in x], 3))
+
+    result = decode_batch_constrained(predictions, get_vocabulary_lookup(vocabulary), automaton, beam_width=64)
+    assert result[0][0] == best
+
+
+def never_valid(word):
+    # Beam search для каждого фрагмента пакета
+    return False
+
+
+def test_constrained_fixes_invalid_greedy_date():
+    rng = np.random.default_rng(0)
+    prediction = make_date_prediction('12.05.2019', rng)
+    # Точка читается как цифра 1 с небольшим перевесом
+    dot_frame = 6
+    prediction[dot_frame:dot_frame + 2, DATE_VOCABULARY.index('.')] = 0.4
+    prediction[dot_frame:dot_frame + 2, DATE_VOCABULARY.index('1')] = 0.45
+
+    greedy = CTCDecoder(DATE_VOCABULARY).decode_validated(prediction[None], [never_valid])[0][0]
+    constrained = CTCDecoder(DATE_VOCABULARY, DATE_DECODING).decode_validated(prediction[None], [never_valid])[0][0]
+
+    assert greedy[0] == '12105.2019'
+    assert constrained[0] == '12.05.2019'
+    assert len(constrained[1]) == 10
+    assert constrained[2] == min(constrained[1])
+    assert constrained[1][2] == pytest.approx(0.4, abs=0.01)
+
+
+def test_clean_prediction_matches_greedy():
+    rng = np.random.default_rng(1)
+    predictions = np.stack([make_date_prediction(x, rng) for x in ['01.01.2000', '31.12.1999', '07.10.2023']])
+
+    greedy = decode_batch_with_scores(predictions, get_vocabulary_lookup(DATE_VOCABULARY))
+    constrained, _ = CTCDecoder(DATE_VOCABULARY, DATE_DECODING).decode_validated(
+        predictions, [never_valid] * len(predictions))
+
+    for greedy_result, constrained_result in zip(greedy, constrained):
+        assert constrained_result[0] == greedy_result[0]
+        np.testing.assert_allclose(constrained_result[1], greedy_result[1], rtol=1e-6)
+
+
+def test_fallback_to_greedy_without_valid_string():
+    # Кадров меньше, чем символов в шаблоне
+    prediction = make_date_prediction('1.1', np.random.default_rng(2), frames_per_symbol=1)[None]
+
+    assert decode_batch_constrained(
+        prediction, get_vocabulary_lookup(DATE_VOCABULARY), TemplateAutomaton(DATE_DECODING['template'], DATE_VOCABULARY), 8
+    ) == [None]
+    assert CTCDecoder(DATE_VOCABULARY, DATE_DECODING).decode_validated(prediction, [never_valid]) == (
+        decode_batch_with_scores(prediction, get_vocabulary_lookup(DATE_VOCABULARY)), [False])
+
+
+def is_date(word):
+    return re.fullmatch(r'[0-3]\d\.[01]\d\.\d{4}', word) is not None
+
+
+def test_beam_only_for_invalid_greedy(monkeypatch):
+    rng = np.random.default_rng(3)
+    valid = make_date_prediction('01.01.2000', rng)
+    misread = make_date_prediction('12.05.2019', rng)
+    misread[6:8, DATE_VOCABULARY.index('.')] = 0.4
+    misread[6:8, DATE_VOCABULARY.index('1')] = 0.45
+    beam_batches = []
+
+    def counting_decode(predictions, *args):
+        beam_batches.append(len(predictions))
+        return decode_batch_constrained(predictions, *args)
+
+    monkeypatch.setattr(postprocess, 'decode_batch_constrained', counting_decode)
+    decoder = CTCDecoder(DATE_VOCABULARY, DATE_DECODING)
+
+    # Жадный текст прошел валидацию - beam search не запускается
+    results, is_valid = decoder.decode_validated(valid[None], [is_date])
+    assert beam_batches == []
+    assert results == decode_batch_with_scores(valid[None], get_vocabulary_lookup(DATE_VOCABULARY))
+    assert is_valid == [True]
+
+    # В пакете beam search запускается только для фрагмента с невалидным жадным текстом
+    results, is_valid = decoder.decode_validated(np.stack([valid, misread]), [is_date, is_date])
+    assert beam_batches == [1]
+    assert [word for word, _, _ in results] == ['01.01.2000', '12.05.2019']
+    assert is_valid == [True, True]
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from utils import crop_img, crop_rotated_img, get_crop_shape, rotate_bboxes, rotate_img
+
+
+IMG_SHAPES = [(61, 40, 3), (40, 61, 3), (32, 32, 3), (37, 53)]
+
+
+@pytest.mark.parametrize('angle', [0, 90, 180, 270])
+@pytest.mark.parametrize('img_shape', IMG_SHAPES)
+def test_parity_with_full_rotation(img_shape, angle):
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, img_shape, dtype=np.uint8)
+    rotated = rotate_img(img, angle)
+    rotated_h, rotated_w = rotated.shape[:2]
+
+    bboxes = [[0, 0, rotated_w, rotated_h], [3, 5, 20, 17], [-10, -7, -2, -1], [5, 5, 100, 100], [10, 10, 4, 4]]
+    for _ in range(50):
+        xmin, xmax = sorted(rng.integers(0, rotated_w + 1, 2).tolist())
+        ymin, ymax = sorted(rng.integers(0, rotated_h + 1, 2).tolist())
+        bboxes.append([xmin, ymin, xmax, ymax])
+
+    for bbox in bboxes:
+        expected = crop_img(rotated, bbox)
+        crop = crop_rotated_img(img, bbox, angle)
+        assert crop.shape == expected.shape
+        assert get_crop_shape(img.shape, bbox, angle) == expected.shape[:2]
+        np.testing.assert_array_equal(crop, expected)
+
+
+@pytest.mark.parametrize('angle', [90, 180, 270])
+def test_detected_bboxes(angle):
+    # Рамки после rotate_bboxes дают тот же фрагмент, что и при повороте всего фото
+    img = np.random.default_rng(1).integers(0, 256, (301, 200, 3), dtype=np.uint8)
+    bboxes = np.array([[0, 0, 200, 301], [10, 20, 150, 60], [199, 300, 200, 301], [0, 0, 1, 1]])
+    rotated_bboxes = rotate_bboxes(bboxes, angle, img.shape).tolist()
+    rotated = rotate_img(img, angle)
+
+    for bbox in rotated_bboxes:
+        np.testing.assert_array_equal(crop_rotated_img(img, bbox, angle), crop_img(rotated, bbox))
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from recognition.postprocess import CTCDecoder, decode_batch_with_scores, get_vocabulary_lookup, postprocess_batch
+
+
+VOCABULARY = '0123456789.'
+
+
+def legacy_decode_predict_with_scores(prediction, vocabulary):
+    prediction = prediction[0]
+    predicted_symbols = np.argmax(prediction, axis=1)
+    predicted_scores = np.max(prediction, axis=1)
+    word_symbols, word_symbol_scores = [], []
+    symbol_start_index = 0
+    for index in range(len(predicted_symbols)):
+        if index == len(prediction) - 1 or predicted_symbols[index] != predicted_symbols[index + 1]:
+            if predicted_symbols[index] != len(vocabulary):
+                symbol_scores = predicted_scores[symbol_start_index: index + 1]
+                word_symbol_scores.append(np.mean(symbol_scores).item())
+                word_symbols.append(predicted_symbols[index])
+            symbol_start_index = index + 1
+    word = ''
+    for item in word_symbols:
+        word += vocabulary[item]
+    word_score = np.min(word_symbol_scores).item()
+    return word, word_symbol_scores, word_score
+
+
+def legacy_check_recognition_correct(predict_word, word_score, threshold, validation):
+    return word_score > threshold and validation(predict_word)
+
+
+def legacy_postprocess(prediction, vocabulary, threshold, validation):
+    predict_word, symbol_scores, word_score = legacy_decode_predict_with_scores(prediction, vocabulary)
+    is_correct = legacy_check_recognition_correct(predict_word, word_score, threshold, validation)
+    return predict_word, symbol_scores, word_score, is_correct
+
+
+def make_predictions(rng, batch_size, steps=24, classes=len(VOCABULARY) + 1, blank_rate=0.4, repeat_rate=0.5):
+    symbols = rng.integers(0, classes, (batch_size, steps))
+    symbols[rng.uniform(size=symbols.shape) < blank_rate] = classes - 1
+    # Длинные серии одинаковых символов
+    for step in range(1, steps):
+        repeat = rng.uniform(size=batch_size) < repeat_rate
+        symbols[repeat, step] = symbols[repeat, step - 1]
+    predictions = rng.uniform(0, 0.5, (batch_size, steps, classes)).astype(np.float32)
+    np.put_along_axis(predictions, symbols[..., None], rng.uniform(0.5, 1, (batch_size, steps, 1)), axis=2)
+    return predictions
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_parity_with_legacy(seed):
+    rng = np.random.default_rng(seed)
+    predictions = make_predictions(rng, 32, repeat_rate=rng.uniform(0.2, 0.95))
+    lookup = get_vocabulary_lookup(VOCABULARY)
+
+    decoded = decode_batch_with_scores(predictions, lookup)
+
+    assert len(decoded) == len(predictions)
+    for index, result in enumerate(decoded):
+        prediction = predictions[index:index + 1]
+        if result[0] == '':
+            continue
+        assert result == legacy_decode_predict_with_scores(prediction, VOCABULARY)
+
+
+def test_empty_word():
+    predictions = np.zeros((3, 24, len(VOCABULARY) + 1), dtype=np.float32)
+    predictions[:, :, -1] = 0.9
+    predictions[1, 5:9, 3] = 1.0
+
+    # Раньше np.min пустого списка скоров падал с ошибкой
+    with pytest.raises(ValueError):
+        legacy_decode_predict_with_scores(predictions[:1], VOCABULARY)
+
+    decoded = decode_batch_with_scores(predictions, get_vocabulary_lookup(VOCABULARY))
+    assert decoded[0] == ('', [], 0.0)
+    assert decoded[1] == legacy_decode_predict_with_scores(predictions[1:2], VOCABULARY) == ('3', [1.0], 1.0)
+    assert decoded[2] == ('', [], 0.0)
+
+
+def test_runs_do_not_cross_samples():
+    # Один и тот же символ в конце одного и в начале следующего фрагмента - две разные серии
+    predictions = np.zeros((2, 4, len(VOCABULARY) + 1), dtype=np.float32)
+    predictions[0, :, -1] = 1.0
+    predictions[0, 3, :] = 0
+    predictions[0, 3, 7] = 0.5
+    predictions[1, :, 7] = 0.25
+
+    decoded = decode_batch_with_scores(predictions, get_vocabulary_lookup(VOCABULARY))
+
+    assert decoded == [('7', [0.5], 0.5), ('7', [0.25], 0.25)]
+
+
+def test_postprocess_batch_parity_with_legacy():
+    predictions = make_predictions(np.random.default_rng(7), 32)
+    validations = [lambda word: len(word) % 2 == 0] * len(predictions)
+
+    results = postprocess_batch(predictions, CTCDecoder(VOCABULARY), 0.5, validations)
+    for index, result in enumerate(results):
+        if result.predict_word == '':
+            continue
+        legacy = legacy_postprocess(predictions[index:index + 1], VOCABULARY, 0.5, validations[index])
+        assert (result.predict_word, result.symbol_scores, result.word_score, result.is_correct) == legacy
@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+
+from driver_license_classes import DriverLicenseClass
+from detection.complete import complete_predictions
+from detection.postprocess import get_class_rows, postprocess_batch, scale_bboxes, select_bboxes
+from detection.rotate import get_angle, rotate_doc_with_bboxes
+from utils import rotate_bboxes
+
+
+def legacy_select_bboxes(bboxes, scores, classes):
+    bboxes, scores, classes = bboxes[0], scores[0], classes[0]
+    sorted_indexes = np.lexsort((-scores, classes))
+    scores, classes, bboxes = scores[sorted_indexes], classes[sorted_indexes], bboxes[sorted_indexes]
+    classes, uniq_indexes = np.unique(classes, return_index=True)
+    scores, bboxes = scores[uniq_indexes], bboxes[uniq_indexes]
+    bboxes = bboxes[np.where(scores > 0)]
+    classes = classes[np.where(scores > 0)]
+    scores = scores[np.where(scores > 0)]
+    return bboxes.tolist(), scores.tolist(), classes.tolist()
+
+
+def legacy_scale_bboxes(img_shape, bboxes, scale, dw, dh, detector_img_size=1280):
+    img_height, img_width = img_shape[:2]
+    new_bboxes = []
+    for x1, y1, x2, y2 in bboxes:
+        xmin = max(0, int((x1 * detector_img_size - dw / 2) / scale))
+        ymin = max(0, int((y1 * detector_img_size - dh / 2) / scale))
+        xmax = min(img_width, int((x2 * detector_img_size - dw / 2) / scale))
+        ymax = min(img_height, int((y2 * detector_img_size - dh / 2) / scale))
+        new_bboxes.append([xmin, ymin, xmax, ymax])
+    return new_bboxes
+
+
+def legacy_rotate_doc_with_bboxes(img_shape, bboxes, classes):
+    rotate_angle = 0
+    pairs = [(DriverLicenseClass.photo, DriverLicenseClass.birthday),
+             (DriverLicenseClass.mrc, DriverLicenseClass.back_serial)]
+    for first, second in pairs:
+        if first.value in classes and second.value in classes:
+            rotate_angle = get_angle(bboxes[classes.index(first.value)], bboxes[classes.index(second.value)])
+    if rotate_angle != 0:
+        bboxes = rotate_bboxes(np.array(bboxes), rotate_angle, img_shape).tolist()
+    return bboxes, rotate_angle
+
+
+def make_model_output(rng, boxes_count=20):
+    corners = np.sort(rng.uniform(-0.05, 1.05, (boxes_count, 2, 2)), axis=1)
+    bboxes = corners.transpose(0, 2, 1).reshape(boxes_count, 4)[:, [0, 2, 1, 3]].astype(np.float32)
+    classes = rng.integers(0, len(DriverLicenseClass), boxes_count).astype(np.float32)
+    scores = rng.uniform(0, 1, boxes_count).astype(np.float32)
+    scores[rng.uniform(0, 1, boxes_count) < 0.3] = 0
+    return bboxes[None], scores[None], classes[None]
+
+
+def make_rotated_output(angle):
+    # Фото слева от даты рождения на документе, повернутом на angle
+    photo, birthday = [0.1, 0.3, 0.3, 0.6], [0.5, 0.4, 0.8, 0.45]
+    rotate = {
+        0: lambda b: b,
+        270: lambda b: [b[1], 1 - b[2], b[3], 1 - b[0]],
+        180: lambda b: [1 - b[2], 1 - b[3], 1 - b[0], 1 - b[1]],
+        90: lambda b: [1 - b[3], b[0], 1 - b[1], b[2]],
+    }[angle]
+    bboxes = np.array([[rotate(photo), rotate(birthday)]], dtype=np.float32)
+    classes = np.array([[DriverLicenseClass.photo.value, DriverLicenseClass.birthday.value]], dtype=np.float32)
+    scores = np.array([[0.9, 0.8]], dtype=np.float32)
+    return bboxes, scores, classes
+
+
+def run_current(output, img_shape, scale, dw, dh):
+    bboxes, scores, classes = select_bboxes(*output)
+    scaled_bboxes = scale_bboxes(img_shape, bboxes, scale, dw, dh)
+    rotated_bboxes, angle = rotate_doc_with_bboxes(img_shape, scaled_bboxes, get_class_rows(classes))
+    return complete_predictions(rotated_bboxes, classes, scores), angle
+
+
+def run_legacy(output, img_shape, scale, dw, dh):
+    bboxes, scores, classes = legacy_select_bboxes(*output)
+    scaled_bboxes = legacy_scale_bboxes(img_shape, bboxes, scale, dw, dh)
+    rotated_bboxes, angle = legacy_rotate_doc_with_bboxes(img_shape, scaled_bboxes, classes)
+    return complete_predictions(rotated_bboxes, classes, scores), angle
+
+
+def assert_same_predictions(current, legacy):
+    current_predictions, current_angle = current
+    legacy_predictions, legacy_angle = legacy
+    assert current_angle == legacy_angle
+    assert [x.field_name for x in current_predictions] == [x.field_name for x in legacy_predictions]
+    assert [x.bbox.tolist() for x in current_predictions] == [x.bbox for x in legacy_predictions]
+    assert [float(x.score) for x in current_predictions] == [x.score for x in legacy_predictions]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_parity_random_output(seed):
+    rng = np.random.default_rng(seed)
+    img_shape = (int(rng.integers(500, 4000)), int(rng.integers(500, 4000)), 3)
+    scale = 1280 / max(img_shape[:2])
+    dw = 1280 - int(round(img_shape[1] * scale))
+    dh = 1280 - int(round(img_shape[0] * scale))
+    output = make_model_output(rng)
+
+    assert_same_predictions(run_current(output, img_shape, scale, dw, dh),
+                            run_legacy(output, img_shape, scale, dw, dh))
+
+
+@pytest.mark.parametrize('angle', [0, 90, 180, 270])
+def test_parity_rotated_document(angle):
+    img_shape = (3001, 2000, 3)
+    scale = 1280 / 3001
+    dw, dh = 1280 - int(round(2000 * scale)), 0
+    output = make_rotated_output(angle)
+
+    current = run_current(output, img_shape, scale, dw, dh)
+    assert current[1] == angle
+    assert_same_predictions(current, run_legacy(output, img_shape, scale, dw, dh))
+
+
+def test_empty_detection():
+    output = (np.zeros((1, 20, 4), np.float32), np.zeros((1, 20), np.float32), np.zeros((1, 20), np.float32))
+    bboxes, scores, classes = select_bboxes(*output)
+    scaled_bboxes = scale_bboxes((100, 100), bboxes, 1.0, 0, 0)
+
+    assert scaled_bboxes.shape == (0, 4)
+    assert (get_class_rows(classes) == -1).all()
+
+
+DETECTION_CONFIG = {'detector': {
+    'img_size': 1280, 'threshold': 0.5, 'check_front_fields': ['photo', 'birthday'], 'check_back_fields': ['back_serial'],
+}}
+
+
+def test_postprocess_batch_splits_images():
+    # Выходы пакета из трех фото: каждое фото постобрабатывается по своей строке index:index + 1
+    outputs = [make_model_output(np.random.default_rng(0)), make_rotated_output(90),
+               make_model_output(np.random.default_rng(1))]
+    outputs[1] = tuple(np.pad(x, [(0, 0), (0, 18)] + [(0, 0)] * (x.ndim - 2)) for x in outputs[1])
+    response_dict = {
+        name: np.concatenate([output[position] for output in outputs])
+        for position, name in enumerate(['detection_boxes', 'detection_scores', 'detection_classes'])
+    }
+    img_shapes = [(3000, 4000, 3), (3001, 2000, 3), (1000, 1000, 3)]
+    scales = [1280 / max(x[:2]) for x in img_shapes]
+    scales_pads = [(scale, (1280 - round(x[1] * scale), 1280 - round(x[0] * scale))) for x, scale in zip(img_shapes, scales)]
+
+    results = postprocess_batch(response_dict, img_shapes, scales_pads, DETECTION_CONFIG)
+
+    assert len(results) == 3
+    for result, output, img_shape, (scale, (dw, dh)) in zip(results, outputs, img_shapes, scales_pads):
+        predictions, angle = run_current(output, img_shape, scale, dw, dh)
+        assert result.angle == angle
+        assert [x.field_name for x in result.predictions] == [x.field_name for x in predictions]
+        assert [x.bbox.tolist() for x in result.predictions] == [x.bbox.tolist() for x in predictions]
+    assert results[1].angle == 90
+    assert results[1].is_correct and results[1].is_front_side
@@ -0,0 +1,194 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+from detection.postprocess import scale_bboxes
+from detection.preprocess import (NORM_SCALE, PAD_VALUE, PAD_VALUE_UINT8, BatchBuffer, DetectorSlots,
+                                  get_input_dtype, get_input_shapes, preprocess_into, preprocessing_img,
+                                  select_input_shape)
+
+
+def legacy_preprocessing_img(img, img_size):
+    # Предобработка до переноса изменения размера на uint8
+    img_height, img_width = img.shape[:2]
+    if img_height > img_width:
+        scale = img_size / img_height
+        resized_height, resized_width = img_size, int(img_width * scale)
+    else:
+        scale = img_size / img_width
+        resized_height, resized_width = int(img_height * scale), img_size
+    new_unpad = int(round(img_width * scale)), int(round(img_height * scale))
+    dw, dh = img_size - new_unpad[0], img_size - new_unpad[1]
+
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.
+    img = cv2.resize(img, (resized_width, resized_height))
+    delta_width, delta_height = img_size - resized_width, img_size - resized_height
+    pad_width, pad_height = delta_width // 2, delta_height // 2
+    img = np.pad(img, [(pad_height, delta_height - pad_height), (pad_width, delta_width - pad_width), (0, 0)],
+                 mode='constant', constant_values=(114 / 255.0, 114 / 255.0))
+    return np.expand_dims(img, axis=0), scale, (dw, dh)
+
+
+@pytest.mark.parametrize('shape', [(300, 200, 3), (200, 300, 3), (256, 256, 3), (97, 61, 3), (128, 40, 3)])
+def test_parity_with_legacy(shape):
+    img = np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+
+    img_tensor, scale, pads = preprocessing_img(img, 128)
+    legacy_tensor, legacy_scale, legacy_pads = legacy_preprocessing_img(img, 128)
+
+    assert img_tensor.shape == legacy_tensor.shape == (1, 128, 128, 3)
+    assert img_tensor.dtype == np.float32
+    assert scale == legacy_scale
+    assert pads == legacy_pads
+    # Округление uint8 после интерполяции дает расхождение не больше одного уровня яркости
+    np.testing.assert_allclose(img_tensor, legacy_tensor, rtol=0, atol=1 / 255 + 1e-6)
+
+
+def test_preprocess_into_batch():
+    rng = np.random.default_rng(1)
+    images = [rng.integers(0, 256, shape, dtype=np.uint8) for shape in [(300, 200, 3), (100, 250, 3)]]
+    buffer = BatchBuffer(128)
+    # Мусор от предыдущего пакета должен быть перезаписан полностью
+    buffer.get(3)[:] = -1
+    batch = buffer.get(2)
+
+    for index, img in enumerate(images):
+        scale, pads = preprocess_into(img, batch, index)
+        img_tensor, expected_scale, expected_pads = preprocessing_img(img, 128)
+        assert (scale, pads) == (expected_scale, expected_pads)
+        np.testing.assert_array_equal(batch[index], img_tensor[0])
+
+
+def test_batch_buffer_reuse():
+    buffer = BatchBuffer(16)
+    large = buffer.get(4)
+    small = buffer.get(2)
+
+    assert small.shape == (2, 16, 16, 3)
+    assert np.shares_memory(large, small)
+    assert buffer.get(5).shape == (5, 16, 16, 3)
+
+
+@pytest.mark.parametrize('shape', [(300, 200, 3), (97, 61, 3)])
+def test_uint8_input_normalized_in_graph(shape):
+    img = np.random.default_rng(2).integers(0, 256, shape, dtype=np.uint8)
+    float_batch = BatchBuffer(128).get(1)
+    uint8_batch = BatchBuffer(128, get_input_dtype('uint8')).get(1)
+
+    assert preprocess_into(img, float_batch, 0) == preprocess_into(img, uint8_batch, 0)
+    assert uint8_batch.dtype == np.uint8
+    # Нормализация в графе модели: cast(float32) * (1 / 255)
+    normalized = uint8_batch.astype(np.float32) * NORM_SCALE
+    content = uint8_batch != PAD_VALUE_UINT8
+    np.testing.assert_array_equal(normalized[content], float_batch[content])
+    # Паддинг 114 * (1 / 255) отличается от float32(114 / 255) не больше чем на 1 ulp
+    np.testing.assert_allclose(normalized, float_batch, rtol=1e-7, atol=0)
+
+
+def test_float16_input():
+    img = np.random.default_rng(3).integers(0, 256, (300, 200, 3), dtype=np.uint8)
+    float_batch = BatchBuffer(128).get(1)
+    half_batch = BatchBuffer(128, get_input_dtype('float16')).get(1)
+    preprocess_into(img, float_batch, 0)
+    preprocess_into(img, half_batch, 0)
+
+    assert half_batch.dtype == np.float16
+    # Половина шага float16 около 1.0
+    np.testing.assert_allclose(half_batch.astype(np.float32), float_batch, rtol=0, atol=2 ** -12)
+
+
+def test_unknown_input_dtype():
+    with pytest.raises(ValueError):
+        get_input_dtype('int8')
+
+
+def test_select_input_shape():
+    input_shapes = get_input_shapes({'img_size': 1280, 'input_shapes': [[1280, 1280], [960, 1280], [1280, 960]]})
+
+    assert input_shapes == [(1280, 1280), (960, 1280), (1280, 960)]
+    assert select_input_shape((3000, 4000), input_shapes) == 1
+    assert select_input_shape((4000, 3000), input_shapes) == 2
+    assert select_input_shape((1000, 1100), input_shapes) == 0
+    assert get_input_shapes({'img_size': 640}) == [(640, 640)]
+
+
+@pytest.mark.parametrize('input_shape', [(96, 128), (128, 96), (64, 128)])
+@pytest.mark.parametrize('shape', [(300, 400, 3), (400, 300, 3), (150, 400, 3)])
+def test_rectangular_input(shape, input_shape):
+    img = np.random.default_rng(4).integers(0, 256, shape, dtype=np.uint8)
+    batch = BatchBuffer(input_shape).get(1)
+    scale, (dw, dh) = preprocess_into(img, batch, 0)
+
+    assert batch.shape == (1, *input_shape, 3)
+    # Фото целиком помещается во вход, паддинг только по одной оси
+    assert round(shape[0] * scale) <= input_shape[0] and round(shape[1] * scale) <= input_shape[1]
+    assert min(dw, dh) == 0
+    rows = np.flatnonzero((batch[0] != PAD_VALUE).any(axis=(1, 2)))
+    cols = np.flatnonzero((batch[0] != PAD_VALUE).any(axis=(0, 2)))
+    # Рамка всего фото в долях входа переводится обратно в рамку фото с точностью до пикселя
+    content_bbox = np.array([[cols[0], rows[0], cols[-1] + 1, rows[-1] + 1]]) / ([input_shape[1], input_shape[0]] * 2)
+    bboxes = scale_bboxes(shape, content_bbox, scale, dw, dh, detector_img_size=input_shape)
+    np.testing.assert_allclose(bboxes, [[0, 0, shape[1], shape[0]]], atol=1 / scale + 1)
+
+
+def test_detector_slots_allocated_per_used_shape():
+    slots = DetectorSlots([BatchBuffer((16, 16)), BatchBuffer((12, 16)), BatchBuffer((16, 12))], 4)
+    first_batch, first_index = slots.take(1)
+    second_batch, second_index = slots.take(1)
+
+    assert (first_index, second_index) == (0, 1)
+    assert first_batch is second_batch and first_batch.shape == (4, 12, 16, 3)
+    # Форма без фото не занимает память
+    assert slots.batch(0) is None and slots.batch(2) is None
+    assert len(slots.buffers[0]._buffer) == 0
+    # Тензор формы - только на фото, которые еще не заняли слоты
+    assert slots.take(2)[0].shape == (2, 16, 12, 3)
+    assert slots.batch(1) is first_batch
+
+
+def test_detector_slots_threads():
+    slots = DetectorSlots([BatchBuffer(8), BatchBuffer((6, 8))], 64)
+    indexes = [[], []]
+
+    def take(shape_index):
+        for _ in range(16):
+            indexes[shape_index].append(slots.take(shape_index)[1])
+
+    threads = [threading.Thread(target=take, args=(x % 2,)) for x in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(indexes[0]) == list(range(32)) and sorted(indexes[1]) == list(range(32))
+    # Каждому занятому слоту хватает места в тензоре своей формы
+    assert len(slots.batch(0)) >= 32 and len(slots.batch(1)) >= 32
+
+
+def test_parallel_load_into_shared_batch():
+    # Загрузка пакета в пуле: каждое фото занимает слот своей формы и пишется в общий тензор
+    rng = np.random.default_rng(2)
+    images = [rng.integers(0, 256, shape, dtype=np.uint8)
+              for shape in [(300, 200, 3), (200, 300, 3), (250, 250, 3), (120, 200, 3), (400, 260, 3), (90, 90, 3)] * 4]
+    input_shapes = get_input_shapes({'img_size': 64, 'input_shapes': [64, [48, 64], [64, 48]]})
+    slots = DetectorSlots([BatchBuffer(shape) for shape in input_shapes], len(images))
+
+    def load(img):
+        shape_index = select_input_shape(img.shape, input_shapes)
+        batch, index = slots.take(shape_index)
+        return shape_index, index, preprocess_into(img, batch, index)
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        loaded = list(executor.map(load, images))
+
+    for img, (shape_index, index, scale_pad) in zip(images, loaded):
+        expected = BatchBuffer(input_shapes[shape_index]).get(1)
+        assert scale_pad == preprocess_into(img, expected, 0)
+        np.testing.assert_array_equal(slots.batch(shape_index)[index], expected[0])
+    # Слоты каждой формы заняты подряд с начала тензора
+    for shape_index in range(len(input_shapes)):
+        indexes = sorted(index for x, index, _ in loaded if x == shape_index)
+        assert indexes == list(range(len(indexes)))
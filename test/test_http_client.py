@@ -0,0 +1,162 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_client import HTTPConnectionPool, HTTPStatusError
+
+
+IMAGE_BYTES = b'\xff\xd8' + b'\x00' * 1024 + b'\xff\xd9'
+
+
+class FileServerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = []
+    proxied = []
+
+    def setup(self):
+        super().setup()
+        self.connections.append(self.client_address)
+
+    def do_GET(self):
+        if self.path.startswith('http://'):
+            # Запрос через прокси: полный url и заголовок авторизации на прокси
+            self.proxied.append((self.path, self.headers.get('Proxy-Authorization')))
+            self.path = '/' + self.path.split('/', 3)[3]
+        if self.path.startswith('/slow'):
+            time.sleep(1)
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.startswith('/loop'):
+            self.send_response(302)
+            self.send_header('Location', '/loop')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.startswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', '/image')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(IMAGE_BYTES)))
+        self.end_headers()
+        self.wfile.write(IMAGE_BYTES)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def file_server():
+    FileServerHandler.connections = []
+    FileServerHandler.proxied = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FileServerHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def download(http_pool, url, timeout_s=5):
+    with http_pool.get(url, timeout_s) as response:
+        return response.read()
+
+
+def test_connection_reused(file_server):
+    http_pool = HTTPConnectionPool()
+    for index in range(5):
+        assert download(http_pool, f'{file_server}/image?guid={index}') == IMAGE_BYTES
+    assert len(FileServerHandler.connections) == 1
+    http_pool.close()
+
+
+def test_reconnect_after_server_closed_connection(file_server):
+    http_pool = HTTPConnectionPool()
+    assert download(http_pool, f'{file_server}/image') == IMAGE_BYTES
+    # Простаивающее соединение оборвалось
+    idle_queue = http_pool._idle_connections[('http', '127.0.0.1', int(file_server.rsplit(':', 1)[1]))]
+    conn = idle_queue.get_nowait()
+    conn.sock.shutdown(socket.SHUT_RDWR)
+    idle_queue.put_nowait(conn)
+    assert download(http_pool, f'{file_server}/image') == IMAGE_BYTES
+    http_pool.close()
+
+
+def test_redirect(file_server):
+    http_pool = HTTPConnectionPool()
+    assert download(http_pool, f'{file_server}/redirect') == IMAGE_BYTES
+    assert len(FileServerHandler.connections) == 1
+    http_pool.close()
+
+
+def test_too_many_redirects(file_server):
+    http_pool = HTTPConnectionPool()
+    with pytest.raises(HTTPStatusError, match='Too many redirects'):
+        download(http_pool, f'{file_server}/loop')
+    # Соединение в пуле осталось открытым, следующий запрос идет по нему
+    idle_queue = http_pool._idle_connections[('http', '127.0.0.1', int(file_server.rsplit(':', 1)[1]))]
+    assert all(conn.sock is not None for conn in list(idle_queue.queue))
+    assert download(http_pool, f'{file_server}/image') == IMAGE_BYTES
+    assert len(FileServerHandler.connections) == 1
+    http_pool.close()
+
+
+def test_error_status(file_server):
+    http_pool = HTTPConnectionPool()
+    with pytest.raises(HTTPStatusError):
+        download(http_pool, f'{file_server}/missing')
+    http_pool.close()
+
+
+def test_request_timeout(file_server):
+    http_pool = HTTPConnectionPool()
+    with pytest.raises(socket.timeout):
+        download(http_pool, f'{file_server}/slow', timeout_s=0.1)
+    # Таймаут задается на запрос, а не на процесс
+    assert socket.getdefaulttimeout() is None
+    assert download(http_pool, f'{file_server}/slow', timeout_s=5) == IMAGE_BYTES
+    http_pool.close()
+
+
+@pytest.mark.parametrize('url', ['ftp://127.0.0.1/image', '127.0.0.1/image', 'file:///tmp/image', 'http:///image'])
+def test_unsupported_url_rejected(url):
+    http_pool = HTTPConnectionPool(proxies={})
+    with pytest.raises(ValueError, match='Unsupported url'):
+        download(http_pool, url)
+    http_pool.close()
+
+
+def test_unsupported_proxy_rejected():
+    http_pool = HTTPConnectionPool(proxies={'http': 'socks5://127.0.0.1:1080'})
+    with pytest.raises(ValueError, match='Unsupported http proxy'):
+        download(http_pool, 'http://files.example/image')
+    http_pool.close()
+
+
+def test_http_proxy(file_server, monkeypatch):
+    monkeypatch.setenv('no_proxy', 'bypassed.example')
+    proxy = file_server.replace('http://', 'http://user:secret@')
+    http_pool = HTTPConnectionPool(proxies={'http': proxy})
+
+    assert download(http_pool, 'http://files.example:8080/image?guid=1') == IMAGE_BYTES
+    assert download(http_pool, 'http://files.example:8080/image?guid=2') == IMAGE_BYTES
+    assert FileServerHandler.proxied == [
+        ('http://files.example:8080/image?guid=1', 'Basic dXNlcjpzZWNyZXQ='),
+        ('http://files.example:8080/image?guid=2', 'Basic dXNlcjpzZWNyZXQ='),
+    ]
+    # Соединение с прокси переиспользуется
+    assert len(FileServerHandler.connections) == 1
+    # Хост из NO_PROXY идет напрямую, мимо прокси
+    with pytest.raises(OSError):
+        download(http_pool, 'http://bypassed.example/image', timeout_s=1)
+    assert len(FileServerHandler.proxied) == 2
+    http_pool.close()
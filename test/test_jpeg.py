@@ -0,0 +1,75 @@
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+import jpeg
+from utils import get_exif_img, get_img_orientation
+
+
+XMP_SEGMENT_DATA = b'http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta xmlns:x="adobe:ns:meta/"/>'
+
+
+def make_segment(marker, payload):
+    return struct.pack('>BBH', 0xFF, marker, len(payload) + 2) + payload
+
+
+def make_exif_payload(orientation, endian):
+    byte_order = b'II' if endian == '<' else b'MM'
+    make = b'Phone\x00'
+    entries_count = 2
+    ifd_size = 2 + entries_count * 12 + 4
+    make_offset = 8 + ifd_size
+    ifd = struct.pack(f'{endian}H', entries_count)
+    # Make (ASCII), значение хранится после IFD
+    ifd += struct.pack(f'{endian}HHII', 0x010F, 2, len(make), make_offset)
+    # Orientation (SHORT), значение хранится в самой записи
+    ifd += struct.pack(f'{endian}HHIHH', 0x0112, 3, 1, orientation, 0)
+    ifd += struct.pack(f'{endian}I', 0)
+    tiff = byte_order + struct.pack(f'{endian}HI', 42, 8) + ifd + make
+    return b'Exif\x00\x00' + tiff
+
+
+def make_jpeg(orientation=None, endian='<', with_xmp=False):
+    img = np.random.default_rng(0).integers(0, 255, (24, 32, 3), dtype=np.uint8)
+    _, encoded = cv2.imencode('.jpg', img)
+    encoded = encoded.tobytes()
+    segments = b''
+    if with_xmp:
+        segments += make_segment(0xE1, XMP_SEGMENT_DATA)
+    if orientation is not None:
+        segments += make_segment(0xE1, make_exif_payload(orientation, endian))
+    return encoded[:2] + segments + encoded[2:]
+
+
+def exifread_orientation(data):
+    img_exif = get_exif_img(memoryview(data))
+    return img_exif['Image Orientation'].values[0] if 'Image Orientation' in img_exif else 1
+
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+@pytest.mark.parametrize('endian', ['<', '>'])
+@pytest.mark.parametrize('with_xmp', [False, True])
+def test_orientation_parity_with_exifread(orientation, endian, with_xmp):
+    data = make_jpeg(orientation, endian, with_xmp)
+    assert jpeg.read_orientation(memoryview(data)) == orientation
+    assert get_img_orientation(memoryview(data)) == exifread_orientation(data)
+
+
+def test_without_exif():
+    data = make_jpeg()
+    assert jpeg.read_orientation(data) is None
+    assert get_img_orientation(memoryview(data)) == exifread_orientation(data) == 1
+
+
+def test_truncated_exif():
+    data = make_jpeg(6)
+    # Обрезанный APP1 сегмент не должен приводить к исключению
+    assert jpeg.read_orientation(data[:30]) is None
+
+
+def test_not_jpeg():
+    _, encoded = cv2.imencode('.png', np.zeros((8, 8, 3), dtype=np.uint8))
+    assert not jpeg.is_jpeg(encoded.tobytes())
+    assert get_img_orientation(memoryview(encoded.tobytes())) == 1
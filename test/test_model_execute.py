@@ -0,0 +1,220 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+import pytest
+import yaml
+
+import triton_python_backend_utils as pb_utils
+
+if not getattr(pb_utils, 'is_stub', False):
+    pytest.skip('execute runs against the pb_utils stub of conftest', allow_module_level=True)
+
+import model  # noqa: E402
+from detection.postprocess import scale_bboxes  # noqa: E402
+from detection.preprocess import get_resize_params  # noqa: E402
+
+
+VOCABULARY = 'АВИНОП'
+DETECTOR_SIZE = 64
+# Фото по GUID: высота, ширина и яркость. Яркое фото детектор видит с рамкой фамилии за границей фото
+IMAGES = {'first': (150, 200, 200), 'second': (300, 200, 200), 'outside': (120, 160, 250), 'broken': None}
+FRONT_BBOXES = {'surname': [0.1, 0.1, 0.6, 0.3], 'name': [0.1, 0.4, 0.6, 0.6]}
+
+
+class ImageServerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    hits = []
+
+    def do_GET(self):
+        guid = self.path[1:].split('?')[0]
+        self.hits.append(guid)
+        if guid not in IMAGES:
+            body, status = b'', 404
+        elif IMAGES[guid] is None:
+            body, status = b'not a jpeg', 200
+        else:
+            height, width, value = IMAGES[guid]
+            body, status = cv2.imencode('.jpg', np.full((height, width, 3), value, np.uint8))[1].tobytes(), 200
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def detector(inputs):
+    # Яркость строки пакета различает фото, рамки в долях входа детектора
+    batch = inputs['inputs']
+    boxes = np.zeros((len(batch), 3, 4), np.float32)
+    classes = np.zeros((len(batch), 3), np.float32)
+    scores = np.zeros((len(batch), 3), np.float32)
+    for row, img in enumerate(batch):
+        surname = [1.05, 0.1, 1.2, 0.3] if img.max() > 0.9 else FRONT_BBOXES['surname']
+        boxes[row, :2] = [surname, FRONT_BBOXES['name']]
+        classes[row, :2] = [9, 10]
+        scores[row, :2] = 0.9
+    detector.batches.append(batch.shape)
+    return {'detection_boxes': boxes, 'detection_classes': classes, 'detection_scores': scores}
+
+
+def fio_ocr(inputs):
+    # Для любого фрагмента текст ИВАН
+    crops = inputs['input']
+    predictions = np.full((len(crops), 8, len(VOCABULARY) + 1), 0.01, np.float32)
+    for step, symbol in enumerate('ИИВВААНН'):
+        predictions[:, step, VOCABULARY.index(symbol) if symbol in VOCABULARY else len(VOCABULARY)] = 0.95
+    fio_ocr.batches.append(crops.shape)
+    return {'output': predictions}
+
+
+@pytest.fixture
+def image_server():
+    ImageServerHandler.hits = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ImageServerHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def bls_model(image_server, tmp_path, monkeypatch):
+    config = {
+        'image_download': {'url': image_server + '/{}?token={}', 'token': 'token', 'timeout_sec': 5, 'max_workers': 4},
+        'ru_driver_license_models': {
+            'detector': {'img_size': DETECTOR_SIZE, 'threshold': 0.5, 'check_front_fields': ['surname', 'name'],
+                         'check_back_fields': ['back_serial']},
+            'recognized_fields': {'surname': 'fio_recognition', 'name': 'fio_recognition'},
+            'fio_recognition': {'model_name': 'fio_ocr', 'image_height': 16, 'image_width': 48,
+                                'vocabulary': VOCABULARY, 'threshold': 0.5},
+        },
+        'result_cache': {'enabled': True},
+    }
+    config_path = tmp_path / 'driver_license_config.yaml'
+    config_path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding='utf-8')
+    monkeypatch.setattr(model, 'APP_CONFIG_PATH', str(config_path))
+    detector.batches, fio_ocr.batches = [], []
+    monkeypatch.setattr(pb_utils.InferenceRequest, 'models',
+                        {'tf_ru_driver_license_detection': detector, 'fio_ocr': fio_ocr})
+
+    bls = model.TritonPythonModel()
+    bls.initialize({
+        'model_config': json.dumps({'output': [{'name': 'recognition_response', 'data_type': 'TYPE_STRING'}]}),
+        'model_name': 'py_ru_driver_license_bls', 'model_version': '1',
+    })
+    yield bls
+    bls.finalize()
+
+
+def make_request(request_id, guid):
+    image_guid = np.array([[json.dumps({'guid': guid}).encode()]], dtype=np.object_)
+    return pb_utils.InferenceRequest(inputs=[pb_utils.Tensor('image_guid', image_guid)], request_id=request_id)
+
+
+def execute(bls, guids):
+    responses = asyncio.run(bls.execute([make_request(str(index), guid) for index, guid in enumerate(guids)]))
+    assert len(responses) == len(guids)
+    return [
+        response.error().message() if response.has_error()
+        else json.loads(response.output_tensors()[0].as_numpy()[0, 0])
+        for response in responses
+    ]
+
+
+def fields_by_name(result):
+    return {x['field_name']: x for x in result['fields_recognition_result']}
+
+
+def expected_bbox(guid, field_name):
+    img_shape = IMAGES[guid][:2]
+    scale, _, _, (dw, dh) = get_resize_params(img_shape, DETECTOR_SIZE)
+    return scale_bboxes(img_shape, np.array([FRONT_BBOXES[field_name]], np.float32), scale, dw, dh, DETECTOR_SIZE)[0].tolist()
+
+
+def test_batch_of_mixed_requests(bls_model):
+    guids = ['first', 'missing', 'second', 'first', 'broken', 'outside']
+    results = execute(bls_model, guids)
+
+    # Ошибки загрузки и декодирования остаются в своих запросах
+    assert 'Error loading image with guid missing' in results[1]
+    assert 'Error loading image with guid broken' in results[4]
+    for index in [0, 2, 5]:
+        assert results[index]['is_driver_license_found'] and results[index]['side'] == 'FrontSide'
+    for index, guid in [(0, 'first'), (2, 'second')]:
+        fields = fields_by_name(results[index])
+        assert fields['surname']['field_text'] == 'ИВАН' and fields['surname']['is_ocr']
+        assert fields['name']['field_bbox'] == expected_bbox(guid, 'name')
+    # Рамка фамилии за границей фото: поле не распознано, остальные поля и запросы пакета распознаны
+    fields = fields_by_name(results[5])
+    assert fields['surname']['is_detection'] and not fields['surname']['is_ocr']
+    assert fields['name']['is_ocr'] and fields['name']['field_bbox'] == expected_bbox('outside', 'name')
+    # Повтор GUID получает ответ ведущего запроса без второй загрузки
+    assert results[3] == results[0]
+    assert sorted(ImageServerHandler.hits) == sorted(set(guids))
+    assert bls_model.metric_coalesced_requests.value == 1
+    # Все загруженные фото идут в детектор одним запросом, все фрагменты - в OCR одним запросом
+    assert detector.batches == [(3, DETECTOR_SIZE, DETECTOR_SIZE, 3)]
+    assert fio_ocr.batches == [(5, 48, 16, 1)]
+
+
+def test_result_cache_skips_pipeline(bls_model):
+    first = execute(bls_model, ['first'])
+    ImageServerHandler.hits.clear()
+    second = execute(bls_model, ['first', 'second'])
+
+    assert second[0] == first[0]
+    assert ImageServerHandler.hits == ['second']
+    assert detector.batches[-1][0] == 1
+    assert bls_model.metric_result_cache_hit.value == 1
+    assert bls_model.metric_result_cache_miss.value == 2
+
+
+def test_model_error_fails_its_requests_only(bls_model, monkeypatch):
+    def failing_ocr(inputs):
+        raise RuntimeError('ocr is down')
+
+    monkeypatch.setitem(pb_utils.InferenceRequest.models, 'fio_ocr', failing_ocr)
+    results = execute(bls_model, ['first', 'missing', 'second'])
+
+    assert 'ocr is down' in results[0] and 'ocr is down' in results[2]
+    assert 'Error loading image with guid missing' in results[1]
+    # Промах кэша считается и для запросов, завершившихся ошибкой
+    assert bls_model.metric_result_cache_miss.value == 3
+    assert bls_model.metric_result_cache_hit.value == 0
+
+
+def test_failed_preprocessing_leaves_its_slot(bls_model, monkeypatch):
+    # Слот детектора занят до ошибки предобработки: детектор получает только фото без ошибок
+    preprocess_into = model.preprocess_into
+
+    def failing_preprocess_into(img, batch_tensor, index):
+        if img.shape[0] == IMAGES['second'][0]:
+            raise ValueError('preprocess failed')
+        return preprocess_into(img, batch_tensor, index)
+
+    monkeypatch.setattr(model, 'preprocess_into', failing_preprocess_into)
+    results = execute(bls_model, ['first', 'second', 'outside'])
+
+    assert 'preprocess failed' in results[1]
+    assert fields_by_name(results[0])['name']['field_bbox'] == expected_bbox('first', 'name')
+    assert fields_by_name(results[2])['name']['field_bbox'] == expected_bbox('outside', 'name')
+    assert not fields_by_name(results[2])['surname']['is_ocr']
+    assert detector.batches == [(2, DETECTOR_SIZE, DETECTOR_SIZE, 3)]
+
+
+def test_multi_row_input_rejected(bls_model):
+    # Клиентский пакет [k, 1] получил бы один ответ на k фото
+    image_guid = np.array([[json.dumps({'guid': guid}).encode()] for guid in ['first', 'second']], dtype=np.object_)
+    requests = [pb_utils.InferenceRequest(inputs=[pb_utils.Tensor('image_guid', image_guid)], request_id='0'),
+                make_request('1', 'first')]
+    responses = asyncio.run(bls_model.execute(requests))
+
+    assert responses[0].has_error() and 'image_guid must hold one photo per request' in responses[0].error().message()
+    assert not responses[1].has_error()
@@ -0,0 +1,56 @@
+import pytest
+
+from utils import read_into_buffer
+
+
+BODY = bytes(range(256)) * 4
+
+
+class ChunkedBody:
+    # Тело ответа, которое отдается кусками, как из сокета
+    def __init__(self, data, chunk_size=100):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.offset = 0
+
+    def readinto(self, view):
+        chunk = self.data[self.offset:self.offset + min(self.chunk_size, len(view))]
+        view[:len(chunk)] = chunk
+        self.offset += len(chunk)
+        return len(chunk)
+
+
+def test_content_length():
+    bytes_data = read_into_buffer(ChunkedBody(BODY), len(BODY), 4096)
+
+    assert bytes(bytes_data) == BODY
+    assert len(bytes_data.obj) == len(BODY)
+
+
+def test_exact_expected_size_not_grown():
+    # Без Content-Length, ожидаемый размер из запроса точный: конец тела виден без увеличения буфера
+    bytes_data = read_into_buffer(ChunkedBody(BODY), None, 4096, initial_size=len(BODY))
+
+    assert bytes(bytes_data) == BODY
+    assert len(bytes_data.obj) == len(BODY) + 1
+
+
+@pytest.mark.parametrize('initial_size', [1, 100, 5000])
+def test_missing_content_length(initial_size):
+    bytes_data = read_into_buffer(ChunkedBody(BODY), None, 4096, initial_size=initial_size)
+
+    assert bytes(bytes_data) == BODY
+
+
+def test_over_max_size():
+    with pytest.raises(ValueError):
+        read_into_buffer(ChunkedBody(BODY), len(BODY), len(BODY) - 1)
+    with pytest.raises(ValueError):
+        read_into_buffer(ChunkedBody(BODY), None, len(BODY) - 1, initial_size=len(BODY))
+    # Тело ровно max_size байт допустимо
+    assert bytes(read_into_buffer(ChunkedBody(BODY), None, len(BODY), initial_size=100)) == BODY
+
+
+def test_incomplete_body():
+    with pytest.raises(ValueError):
+        read_into_buffer(ChunkedBody(BODY[:500]), len(BODY), 4096)
@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+import pytest
+
+from recognition.postprocess import scatter_results
+from recognition.preprocess import PAD_VALUE, CropBatchBuffer, group_fields_by_model, preprocess_batch
+
+
+CONFIG = {'recognized_fields': {
+    'surname': 'ru_recognition', 'name': 'ru_recognition', 'datein': 'digits_recognition',
+    'birthday': 'digits_recognition', 'front_serial': 'serial_recognition',
+}}
+
+
+def infer_groups(groups):
+    # Вместо ответов моделей: по одному результату на строку пакета, в порядке groups как после gather
+    return [[f'{model_name}:{row}' for row in range(len(model_fields))] for model_name, model_fields in groups.items()]
+
+
+def test_scatter_results_by_model():
+    fields = [('surname', [0, 0, 1, 1]), ('datein', [1, 1, 2, 2]), ('front_serial', [2, 2, 3, 3]),
+              ('name', [3, 3, 4, 4]), ('birthday', [4, 4, 5, 5])]
+    groups = group_fields_by_model([fields], CONFIG)
+
+    assert scatter_results(groups, infer_groups(groups), 1) == [{
+        'surname': 'ru_recognition:0', 'name': 'ru_recognition:1', 'datein': 'digits_recognition:0',
+        'birthday': 'digits_recognition:1', 'front_serial': 'serial_recognition:0',
+    }]
+
+
+def test_documents_of_batch_share_model_requests():
+    # Запросы пакета dynamic batching: поля всех документов одной модели идут одним пакетом
+    documents_fields = [
+        [('surname', [0, 0, 1, 1]), ('datein', [1, 1, 2, 2])],
+        [],
+        [('datein', [5, 5, 6, 6]), ('name', [6, 6, 7, 7]), ('surname', [7, 7, 8, 8])],
+    ]
+    groups = group_fields_by_model(documents_fields, CONFIG)
+
+    assert [document_index for document_index, _, _ in groups['ru_recognition']] == [0, 2, 2]
+    assert [document_index for document_index, _, _ in groups['digits_recognition']] == [0, 2]
+    assert scatter_results(groups, infer_groups(groups), len(documents_fields)) == [
+        {'surname': 'ru_recognition:0', 'datein': 'digits_recognition:0'},
+        {},
+        {'datein': 'digits_recognition:1', 'name': 'ru_recognition:1', 'surname': 'ru_recognition:2'},
+    ]
+
+
+def test_out_of_image_crops_dropped():
+    # Рамка за границей фото дает пустой фрагмент, рамка в один пиксель высотой - вырожденный
+    config = {**CONFIG, 'ru_recognition': {'image_height': 32, 'image_width': 120},
+              'digits_recognition': {'image_height': 32, 'image_width': 120}}
+    documents_fields = [
+        [('surname', [10, 10, 200, 40]), ('datein', [900, 10, 1000, 40])],
+        [('surname', [10, 10, 500, 11]), ('name', [10, 50, 200, 80])],
+    ]
+    groups = group_fields_by_model(documents_fields, config, [((600, 800, 3), 0), ((800, 600, 3), 90)])
+
+    assert groups == {'ru_recognition': [(0, 'surname', [10, 10, 200, 40]), (1, 'name', [10, 50, 200, 80])]}
+    assert scatter_results(groups, infer_groups(groups), 2) == [
+        {'surname': 'ru_recognition:0'}, {'name': 'ru_recognition:1'}]
+
+
+def test_crop_errors_stay_with_their_slot():
+    img = np.random.default_rng(0).integers(0, 256, (100, 200, 3), dtype=np.uint8)
+    crops = [(img, [0, 0, 100, 30], 0), (img, [150, 50, 150, 80], 0), (img, [20, 40, 180, 70], 90)]
+    errors = {}
+    batch = preprocess_batch(crops, CropBatchBuffer((32, 120)), errors)
+
+    assert list(errors) == [1]
+    assert (batch[1] == PAD_VALUE).all()
+    np.testing.assert_array_equal(batch[[0, 2]], preprocess_batch(crops[::2], CropBatchBuffer((32, 120))))
+    with pytest.raises(cv2.error):
+        preprocess_batch(crops, CropBatchBuffer((32, 120)))
@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+import pytest
+
+from recognition.preprocess import CropBatchBuffer, group_fields_by_model, preprocess_batch, to_gray
+from utils import crop_rotated_img
+
+
+def legacy_preprocess(img, bbox, angle, img_size):
+    # Предобработка фрагмента до записи в тензор пакета
+    img = cv2.cvtColor(crop_rotated_img(img, bbox, angle), cv2.COLOR_BGR2GRAY)
+    img_height, img_width = img.shape[:2]
+    new_img_height, new_img_width = img_size
+    if new_img_width / img_width < new_img_height / img_height:
+        scale = new_img_width / img_width
+        resized_height, resized_width = int(img_height * scale), new_img_width
+    else:
+        scale = new_img_height / img_height
+        resized_height, resized_width = new_img_height, int(img_width * scale)
+    img = cv2.resize(img, (resized_width, resized_height)).astype(np.float32)
+    img /= 255.
+    delta_width, delta_height = new_img_width - resized_width, new_img_height - resized_height
+    img = np.pad(img, [(delta_height // 2, delta_height - delta_height // 2),
+                       (delta_width // 2, delta_width - delta_width // 2)],
+                 mode='constant', constant_values=(114 / 255., 114 / 255.))
+    return np.transpose(img[None, :, :, None], (0, 2, 1, 3))
+
+
+IMG = np.random.default_rng(0).integers(0, 256, (500, 700, 3), dtype=np.uint8)
+CROPS = [([10, 20, 300, 80], 0), ([0, 0, 50, 200], 0), ([100, 100, 130, 400], 90),
+         ([20, 300, 480, 340], 180), ([400, 30, 480, 70], 270)]
+
+
+def document_crops(crops):
+    return [(IMG, bbox, angle) for bbox, angle in crops]
+
+
+@pytest.mark.parametrize('img_size', [(32, 120), (32, 200), (24, 24)])
+def test_batch_parity_with_legacy(img_size):
+    buffer = CropBatchBuffer(img_size)
+    batch = preprocess_batch(document_crops(CROPS), buffer)
+    legacy = np.concatenate([legacy_preprocess(IMG, bbox, angle, img_size) for bbox, angle in CROPS])
+
+    assert batch.shape == legacy.shape == (len(CROPS), img_size[1], img_size[0], 1)
+    assert batch.dtype == np.float32
+    assert batch.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(batch, legacy)
+
+
+def test_single_crop_batch():
+    bbox, angle = CROPS[2]
+    batch = preprocess_batch([(IMG, bbox, angle)], CropBatchBuffer((32, 120)))
+    np.testing.assert_array_equal(batch, legacy_preprocess(IMG, bbox, angle, (32, 120)))
+
+
+def test_buffer_reused_and_grown():
+    buffer = CropBatchBuffer((32, 120))
+    crops = document_crops(CROPS)
+
+    large = preprocess_batch(crops, buffer)
+    small = preprocess_batch(crops[:2], buffer)
+    assert small.base is large.base
+    np.testing.assert_array_equal(small[1], legacy_preprocess(IMG, *CROPS[1], (32, 120))[0])
+
+    grown = preprocess_batch(crops * 2, buffer)
+    assert grown.shape[0] == 2 * len(CROPS)
+    np.testing.assert_array_equal(grown[len(CROPS):], grown[:len(CROPS)])
+
+
+@pytest.mark.parametrize('angle', [0, 90, 180, 270])
+def test_gray_before_rotation_matches_rotated_crop_gray(angle):
+    # Рамки с выходом за границы вырезаются как срезы python
+    for bbox in [[30, 40, 200, 90], [150, 10, 420, 60], [400, 5, 900, 30], [380, 420, 900, 460]]:
+        expected = cv2.cvtColor(crop_rotated_img(IMG, bbox, angle), cv2.COLOR_BGR2GRAY)
+        gray = crop_rotated_img(IMG, bbox, angle, convert=to_gray)
+        np.testing.assert_array_equal(gray, expected)
+
+
+RECOGNITION_CONFIG = {'recognized_fields': {
+    'surname': 'ru_recognition', 'datein': 'digits_recognition', 'name': 'ru_recognition',
+    'front_serial': 'digits_recognition', 'birthday': 'digits_recognition',
+}}
+
+
+def test_group_fields_by_model_order():
+    # Поля модели идут в порядке документа: строки выхода модели совпадают с порядком фрагментов
+    fields = [('datein', [0, 0, 10, 10]), ('surname', [1, 1, 11, 11]), ('birthday', [2, 2, 12, 12]),
+              ('name', [3, 3, 13, 13]), ('front_serial', [4, 4, 14, 14])]
+    groups = group_fields_by_model([fields], RECOGNITION_CONFIG)
+
+    assert list(groups) == ['digits_recognition', 'ru_recognition']
+    assert groups['digits_recognition'] == [
+        (0, 'datein', [0, 0, 10, 10]), (0, 'birthday', [2, 2, 12, 12]), (0, 'front_serial', [4, 4, 14, 14])]
+    assert groups['ru_recognition'] == [(0, 'surname', [1, 1, 11, 11]), (0, 'name', [3, 3, 13, 13])]
+    assert group_fields_by_model([[]], RECOGNITION_CONFIG) == {}
@@ -0,0 +1,31 @@
+from request_trace import RequestTrace
+
+
+def test_stage_offsets_from_request_start():
+    trace = RequestTrace(start_ns=1_000_000)
+    trace.add_stage('detection', 3_500_000, 10_000_000, {'detection_infer': 4_000_000}, shape=[2, 1280, 1280, 3])
+
+    assert trace.stages == [{
+        'stage': 'detection',
+        'start_ms': 2.5,
+        'end_ms': 9.0,
+        'durations_ms': {'detection_infer': 4.0},
+        'shape': [2, 1280, 1280, 3],
+    }]
+
+
+def test_empty_durations_are_omitted():
+    trace = RequestTrace(start_ns=0)
+    trace.add_stage('parse', 0, 1_000, None)
+    trace.add_stage('load_image', 1_000, 2_000, {})
+
+    assert all('durations_ms' not in x for x in trace.stages)
+
+
+def test_to_dict_total_is_after_last_stage():
+    trace = RequestTrace(start_ns=0)
+    trace.add_stage('parse', 0, 1_000)
+    trace_dict = trace.to_dict()
+
+    assert trace_dict['stages'][0]['stage'] == 'parse'
+    assert trace_dict['total_ms'] >= trace_dict['stages'][-1]['end_ms']
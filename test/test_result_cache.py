@@ -0,0 +1,108 @@
+import os
+import time
+
+import pytest
+
+import result_cache
+from result_cache import FileCacheBackend, ResultCache, get_result_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_get_put_several_keys():
+    cache = ResultCache()
+    cache.put(['guid/1', 'sha256/a'], '{"side": "front"}')
+
+    assert cache.get('guid/1') == '{"side": "front"}'
+    assert cache.get('sha256/a') == '{"side": "front"}'
+    assert cache.get('guid/2') is None
+
+
+def test_lru_eviction_by_entries():
+    cache = ResultCache(max_entries=2)
+    cache.put(['a'], '1')
+    cache.put(['b'], '2')
+    # a становится самой свежей записью, вытесняется b
+    assert cache.get('a') == '1'
+    cache.put(['c'], '3')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    assert cache.get('c') == '3'
+    assert len(cache) == 2
+
+
+def test_eviction_by_bytes():
+    cache = ResultCache(max_bytes=10)
+    cache.put(['a'], 'x' * 6)
+    cache.put(['b'], 'y' * 6)
+
+    assert cache.get('a') is None
+    assert cache.get('b') == 'y' * 6
+    assert cache.size_bytes == 6
+
+    # Значение больше лимита не сохраняется и не вытесняет остальные
+    cache.put(['c'], 'z' * 11)
+    assert cache.get('c') is None
+    assert cache.get('b') == 'y' * 6
+
+
+def test_replace_value_updates_size():
+    cache = ResultCache()
+    cache.put(['a'], 'xxxx')
+    cache.put(['a'], 'xx')
+
+    assert cache.get('a') == 'xx'
+    assert cache.size_bytes == 2
+
+
+def test_ttl(clock):
+    cache = ResultCache(ttl_sec=10)
+    cache.put(['a'], '1')
+    clock[0] += 9
+    assert cache.get('a') == '1'
+    clock[0] += 2
+    assert cache.get('a') is None
+    assert len(cache) == 0
+    assert cache.size_bytes == 0
+
+
+def test_file_backend_shared_between_caches(tmp_path):
+    first = ResultCache(backend=FileCacheBackend(str(tmp_path), ttl_sec=60))
+    second = ResultCache(backend=FileCacheBackend(str(tmp_path), ttl_sec=60))
+    first.put(['guid/1'], '{"a": 1}')
+
+    assert second.get('guid/1') == '{"a": 1}'
+    # Найденная в общем хранилище запись сохраняется в локальном кэше
+    assert len(second) == 1
+
+
+def test_file_backend_ttl_and_prune(tmp_path):
+    backend = FileCacheBackend(str(tmp_path), ttl_sec=60, max_files=2)
+    for key in ['a', 'b', 'c', 'd']:
+        backend.put(key, key)
+    old_time = time.time() - 120
+    os.utime(backend._path('a'), (old_time, old_time))
+    os.utime(backend._path('b'), (old_time + 100, old_time + 100))
+
+    assert backend.get('a') is None
+    assert not os.path.exists(backend._path('a'))
+
+    backend.prune()
+    # Остаются две самые свежие записи
+    assert backend.get('b') is None
+    assert backend.get('c') == ('c', pytest.approx(60, abs=1))
+    assert backend.get('d')[0] == 'd'
+
+
+def test_get_result_cache_disabled_by_default(tmp_path):
+    assert get_result_cache({}) is None
+
+    cache = get_result_cache({'enabled': True, 'max_entries': 5, 'shared_dir': str(tmp_path / 'cache')})
+    assert cache.max_entries == 5
+    assert cache.backend is not None
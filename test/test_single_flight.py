@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip('fastapi')
+
+APP_DIR = os.path.join(os.path.dirname(__file__), '..', 'src', 'driver_licence_recognition', 'app')
+sys.path.insert(0, os.path.abspath(APP_DIR))
+
+from core.single_flight import SingleFlight  # noqa: E402
+
+
+def test_same_key_shares_one_call():
+    calls = []
+    release = threading.Event()
+
+    def recognize(guid):
+        calls.append(guid)
+        release.wait(5)
+        return f'result {guid}'
+
+    async def run():
+        flight = SingleFlight()
+        requests = [asyncio.ensure_future(flight.do('guid', recognize, 'guid')) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        release.set()
+        results = await asyncio.gather(*requests)
+        return flight, results
+
+    flight, results = asyncio.run(run())
+    assert calls == ['guid']
+    assert [result for result, _ in results] == ['result guid'] * 3
+    assert sorted(shared for _, shared in results) == [False, True, True]
+    assert flight._calls == {}
+
+
+def test_different_keys_run_concurrently():
+    # Оба вызова должны исполняться одновременно в пуле потоков, иначе барьер не дождется второго
+    barrier = threading.Barrier(2, timeout=5)
+    threads = set()
+
+    def recognize(guid):
+        threads.add(threading.get_ident())
+        barrier.wait()
+        return f'result {guid}'
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(flight.do('first', recognize, 'first'), flight.do('second', recognize, 'second'))
+
+    results = asyncio.run(run())
+    assert results == [('result first', False), ('result second', False)]
+    assert len(threads) == 2
+
+
+def test_exception_shared_and_key_released():
+    def fail(guid):
+        raise ValueError(guid)
+
+    async def run():
+        flight = SingleFlight()
+        with pytest.raises(ValueError):
+            await flight.do('guid', fail, 'guid')
+        return flight
+
+    assert asyncio.run(run())._calls == {}
@@ -0,0 +1,69 @@
+import re
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from recognition.validation import (date_validation, fio_validation, get_validators, serial_validation,
+                                    validate_batch)
+
+
+def legacy_date_validation(date, date_format='%d.%m.%Y'):
+    try:
+        valid = bool(datetime.strptime(date, date_format))
+    except ValueError:
+        valid = False
+    return valid
+
+
+def legacy_serial_validation(predict_word, pattern=r'([0-9]{2}\s{1}[0-9]{2}\s{1}[0-9]{6})'):
+    return re.fullmatch(pattern, predict_word) is not None
+
+
+def random_words(alphabet, template, count, seed):
+    # Слова по шаблону с заменой, вставкой и удалением символов
+    rng = np.random.default_rng(seed)
+    words = []
+    for _ in range(count):
+        word = list(template.format(
+            rng.integers(0, 40), rng.integers(0, 15), rng.integers(0, 10000), rng.integers(0, 1000000)))
+        for _ in range(rng.integers(0, 3)):
+            position = int(rng.integers(0, len(word) + 1))
+            operation = rng.integers(0, 3)
+            symbol = alphabet[rng.integers(0, len(alphabet))]
+            if operation == 0 and position < len(word):
+                word[position] = symbol
+            elif operation == 1:
+                word.insert(position, symbol)
+            elif position < len(word):
+                del word[position]
+        words.append(''.join(word))
+    return words
+
+
+@pytest.mark.parametrize('template', ['{0:02d}.{1:02d}.{2:04d}', '{0}.{1}.{2:04d}', '{0:2d}.{1}.{2:04d}'])
+def test_date_parity_with_strptime(template):
+    words = random_words('0123456789. ', template, 3000, 0)
+    words += ['29.02.2020', '29.02.2019', '29.02.1900', '29.02.2000', '31.04.2021', '00.01.2020', '01.01.0000',
+              '1.1.2020', ' 1.1.2020', '01.1.20200', '', '.', '31.12.9999']
+
+    assert [date_validation(x) for x in words] == [legacy_date_validation(x) for x in words]
+
+
+def test_serial_parity_with_re():
+    words = random_words('0123456789 .', '{0:02d} {1:02d} {3:06d}', 3000, 1)
+    words += ['12 34 567890', '12\t34\n567890', '1234 567890', '']
+
+    assert [serial_validation(x) for x in words] == [legacy_serial_validation(x) for x in words]
+
+
+def test_registry_and_batch():
+    validators = get_validators({'birthday': 'date_model', 'front_serial': 'serial_model', 'name': 'fio_model'})
+
+    assert validators == {'birthday': date_validation, 'front_serial': serial_validation, 'name': fio_validation}
+    words = ['01.02.2003', '12 34 567890', 'ИВАН', '31.02.2003']
+    validations = [validators['birthday'], validators['front_serial'], validators['name'], validators['birthday']]
+    assert validate_batch(words, validations) == [True, True, True, False]
+
+    with pytest.raises(ValueError):
+        get_validators({'photo': 'fio_model'})